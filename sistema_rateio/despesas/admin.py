@@ -1,34 +1,60 @@
-import io
-import zipfile
 from datetime import datetime
-from django.db.models import Q
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 import os, json
+import tempfile
 from django.conf import settings
-from xlsxwriter.utility import xl_rowcol_to_cell
-import xlsxwriter
-import numpy as np
 from .forms import DespesaGasForm, DespesaAguaForm, DespesaEnergiaForm
+from . import cache_boletos, execucao_unica
+from .boletos import (
+    COMPRESSOES,
+    assinatura_do_mes,
+    boleto_da_unidade,
+    gerar_pdf_unico,
+    gerar_zip_de_boletos,
+    gravar_arquivo_do_mes,
+    iterar_zip_de_boletos,
+    montar_contextos,
+    nome_arquivo_boleto,
+    nome_arquivo_pdf_unico,
+    nome_arquivo_zip,
+    pdf_da_unidade,
+)
+from .exportacao import (
+    ABAS_XLSX,
+    CSV_CONTENT_TYPE,
+    XLSX_CONTENT_TYPE,
+    abas_validas,
+    escrever_planilha,
+    linhas_csv_rateios,
+    nome_arquivo_csv,
+    nome_arquivo_xlsx,
+    nome_arquivo_xlsx_periodo,
+    versao_dados,
+)
+from .importacao import CSV_COLUNAS as COLUNAS_LEITURAS, importar as importar_leituras, ler_csv
+from .tarefas import caminho_arquivo, enfileirar, nome_download
 from django import forms
 from django.contrib import admin
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-import pandas as pd
-from django.http import HttpResponse
-from django.template.loader import render_to_string
+from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template.response import TemplateResponse
 from django.urls import path
-from weasyprint import HTML
+from django.utils.cache import get_conditional_response
 from django.utils.html import format_html
+from django.utils.http import quote_etag
 from django.db.models import OuterRef, Subquery, CharField, F
 from django.db.models.functions import Cast
 from django.utils import timezone
 from django.db.models.signals import post_delete
 from django.db.models import Sum
-import csv
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
 
 from .models import (
+    Leitura,
     Unidade,
     TipoDespesa,
     Despesa,
@@ -53,6 +79,7 @@ from .models import (
     DespesaReparoComSala,
     DespesaReparoSemSala,
     LogAlteracao,
+    Tarefa,
     )
 
 BASE_TIPOS = [
@@ -312,30 +339,97 @@ class RateioAdmin(admin.ModelAdmin):
     list_display = ('id', 'despesa', 'unidade', 'valor')
     list_filter = ('despesa', 'unidade')
 
+
+def _consumo_da_leitura(campo='consumo'):
+    """``campo`` de ``Leitura.com_consumo`` para a leitura da linha, como subconsulta."""
+    periodo = OuterRef('periodo')
+    linhas = Leitura.objects.filter(
+        tipo=OuterRef('tipo'),
+        unidade=OuterRef('unidade'),
+        medidor=OuterRef('medidor'),
+    ).com_consumo((periodo, periodo))
+    return Subquery(linhas.values(campo)[:1])
+
+class ImportarLeiturasForm(forms.Form):
+    arquivo = forms.FileField(
+        label="Arquivo CSV",
+        help_text=(f"Colunas {';'.join(COLUNAS_LEITURAS)}; tipo gas, agua ou energia; "
+                   "medidor 1 ou 2 na energia e vazio no gás e na água."),
+    )
+
+
+class LeiturasAdmin(admin.ModelAdmin):
+    """Base dos admins de leitura, com a página "Importar leituras" (CSV)."""
+    change_list_template = "admin/despesas/leituras_changelist.html"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path(
+                'importar/',
+                self.admin_site.admin_view(self.importar_view),
+                name=f'despesas_{self.opts.model_name}_importar'
+            ),
+        ]
+        return custom + urls
+
+    def importar_view(self, request):
+        """
+        Recebe o CSV de leituras (de qualquer tipo) e grava tudo numa
+        transação; com erro em alguma linha, lista os erros e não grava nada.
+        """
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        erros = []
+        if request.method == 'POST':
+            form = ImportarLeiturasForm(request.POST, request.FILES)
+            if form.is_valid():
+                try:
+                    linhas = ler_csv(form.cleaned_data['arquivo'].read())
+                except ValueError as e:
+                    form.add_error('arquivo', str(e))
+                else:
+                    gravadas, erros = importar_leituras(linhas)
+                    if not erros:
+                        messages.success(request, f"{gravadas} leitura(s) importada(s).")
+                        return redirect(f'admin:despesas_{self.opts.model_name}_changelist')
+        else:
+            form = ImportarLeiturasForm()
+
+        context = self.admin_site.each_context(request)
+        context.update({
+            'form':  form,
+            'erros': erros,
+            'opts':  self.opts,
+            'title': "Importar leituras",
+        })
+        return TemplateResponse(request, "admin/despesas/importar_leituras.html", context)
+
+
 @admin.register(LeituraEnergia)
-class LeituraEnergiaAdmin(admin.ModelAdmin):
+class LeituraEnergiaAdmin(LeiturasAdmin):
     list_display = ('id','unidade','mes','ano','leitura','medidor','consumo',)
     list_filter   = ('ano', 'mes', 'unidade', 'medidor')
     search_fields = ('unidade__nome',)
     ordering      = ('-ano', '-mes', 'unidade', 'medidor')
 
-    def consumo(self, obj):
-        # igual ao LeituraGasAdmin, mas filtrando pelo mesmo medidor
-        if obj.mes > 1:
-            mes_ant, ano_ant = obj.mes - 1, obj.ano
-        else:
-            mes_ant, ano_ant = 12, obj.ano - 1
+    def formfield_for_choice_field(self, db_field, request, **kwargs):
+        if db_field.name == 'medidor':
+            # o 0 ("Único") é o de gás e água
+            kwargs['choices'] = LeituraEnergia.MEDIDOR_CHOICES
+        return super().formfield_for_choice_field(db_field, request, **kwargs)
 
-        anterior = LeituraEnergia.objects.filter(
-            unidade=obj.unidade,
-            medidor=obj.medidor,
-            mes=mes_ant,
-            ano=ano_ant
-        ).first()
-
-        if anterior:
-            diff = obj.leitura - anterior.leitura
-            return f"{max(diff, 0):.3f}"
+    def get_queryset(self, request):
+        # consumo na mesma consulta da listagem
+        return super().get_queryset(request).annotate(
+            _consumo=_consumo_da_leitura(),
+            _leitura_anterior=_consumo_da_leitura('leitura_anterior'),
+        )
+
+    def consumo(self, obj):
+        # igual ao LeituraGasAdmin, mas do mesmo medidor
+        if obj._leitura_anterior is not None:
+            return f"{obj._consumo:.3f}"
         total_leitura = (
             LeituraEnergia.objects
             .filter(
@@ -887,34 +981,23 @@ class DespesaAreasComunsAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 @admin.register(LeituraGas)
-class LeituraGasAdmin(admin.ModelAdmin):
+class LeituraGasAdmin(LeiturasAdmin):
     list_display = ('id', 'unidade', 'mes', 'ano', 'leitura', 'consumo')
     list_filter = ('ano', 'mes', 'unidade')
     search_fields = ('unidade__nome',)
     ordering = ('-ano', '-mes', 'unidade')
+    exclude = ('medidor',)
 
-    def consumo(self, obj):
-        # calcula mês/ano anterior
-        if obj.mes > 1:
-            mes_ant = obj.mes - 1
-            ano_ant = obj.ano
-        else:
-            mes_ant = 12
-            ano_ant = obj.ano - 1
+    def get_queryset(self, request):
+        # consumo na mesma consulta da listagem
+        return super().get_queryset(request).annotate(
+            _consumo=_consumo_da_leitura(),
+        )
 
-        anterior = LeituraGas.objects.filter(
-            unidade=obj.unidade,
-            mes=mes_ant,
-            ano=ano_ant
-        ).first()
-
-        if anterior:
-            # diferença entre a leitura atual e a anterior
-            diff = obj.leitura - anterior.leitura
-            # formata com 4 casas decimais, se quiser:
-            return f"{max(diff, 0):.4f}"
-        else:
-            return f"{obj.leitura:.4f}"
+    def consumo(self, obj):
+        # diferença para a leitura do mês anterior (ou a própria leitura, se
+        # não houver anterior)
+        return f"{obj._consumo:.4f}"
 
     consumo.short_description = 'Consumo (m³)'
     consumo.admin_order_field = 'leitura'
@@ -1202,11 +1285,12 @@ class DespesaAguaAdmin(DespesaBaseAdmin):
         return initial
 
 @admin.register(LeituraAgua)
-class LeituraAguaAdmin(admin.ModelAdmin):
+class LeituraAguaAdmin(LeiturasAdmin):
     list_display = ('id', 'unidade', 'mes', 'ano', 'leitura', 'consumo')
     list_filter = ('ano', 'mes', 'unidade')
     search_fields = ('unidade__nome',)
     ordering = ('-ano', '-mes', 'unidade')
+    exclude = ('medidor',)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -1219,26 +1303,13 @@ class LeituraAguaAdmin(admin.ModelAdmin):
         ).values('valor')[:1]
 
         return qs.annotate(
-            _valor_rateado=Subquery(rateio_sq)
+            _valor_rateado=Subquery(rateio_sq),
+            _consumo=_consumo_da_leitura(),
         )
 
     def consumo(self, obj):
-        """Calcula o consumo baseado na leitura anterior"""
-        if obj.mes > 1:
-            mes_ant, ano_ant = obj.mes - 1, obj.ano
-        else:
-            mes_ant, ano_ant = 12, obj.ano - 1
-
-        anterior = LeituraAgua.objects.filter(
-            unidade=obj.unidade,
-            mes=mes_ant,
-            ano=ano_ant
-        ).first()
-
-        if anterior:
-            diff = obj.leitura - anterior.leitura
-            return f"{max(diff, 0):.4f}"
-        return f"{obj.leitura:.4f}"
+        """Consumo em relação à leitura anterior (ver Leitura.com_consumo)"""
+        return f"{obj._consumo:.4f}"
     consumo.short_description = 'Consumo (m³)'
 
 @admin.register(FracaoPorTipoDespesa)
@@ -1269,6 +1340,40 @@ MESES_CHOICES = [
 class GerarBoletosForm(forms.Form):
     mes = forms.ChoiceField(label="Mês", choices=MESES_CHOICES)
     ano = forms.ChoiceField(label="Ano", choices=[(str(y), str(y)) for y in range(2025, 2030)])
+    formato = forms.ChoiceField(
+        label="Formato",
+        choices=[
+            ('zip', "ZIP com um PDF por unidade"),
+            ('pdf', "PDF único (todas as unidades, uma por página)"),
+        ],
+        initial='zip',
+    )
+    compressao = forms.ChoiceField(
+        label="Compressão",
+        choices=[
+            ('stored',   "Sem compressão"),
+            ('deflated', "Deflate"),
+            ('bzip2',    "BZIP2"),
+            ('lzma',     "LZMA"),
+        ],
+        initial='stored',
+    )
+    nivel = forms.IntegerField(
+        label="Nível", required=False, min_value=0, max_value=9,
+        help_text="0–9 (Deflate) ou 1–9 (BZIP2); vazio usa o padrão."
+    )
+    streaming = forms.BooleanField(
+        label="Enviar em streaming", required=False,
+        help_text="Começa o download enquanto os PDFs ainda estão sendo gerados."
+    )
+
+    def clean(self):
+        cd = super().clean()
+        if cd.get('compressao') == 'bzip2' and cd.get('nivel') == 0:
+            self.add_error('nivel', "BZIP2 aceita níveis de 1 a 9.")
+        if cd.get('formato') == 'pdf' and cd.get('streaming'):
+            self.add_error('streaming', "O streaming só está disponível para o ZIP.")
+        return cd
 
 class RateioFundoInline(admin.TabularInline):
     model = Rateio
@@ -1399,6 +1504,13 @@ class FundoReservaAdmin(admin.ModelAdmin):
         for unidade, v in valores.items():
             Rateio.objects.create(despesa=obj, unidade=unidade, valor=v)
 
+def enfileirar_e_acompanhar(request, tipo, mes, ano, parametros=None):
+    """Enfileira a geração e redireciona para a página de acompanhamento."""
+    tarefa, criada = enfileirar(tipo, mes, ano, parametros=parametros, usuario=request.user)
+    if not criada:
+        messages.info(request, "Já havia uma geração igual em andamento; acompanhando a mesma tarefa.")
+    return redirect('admin:despesas_tarefa_status', tarefa.pk)
+
 @admin.register(Boleto)
 class BoletoAdmin(admin.ModelAdmin):
     change_list_template = "admin/despesas/boletos_changelist.html"
@@ -1408,6 +1520,8 @@ class BoletoAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None): return False
     def has_delete_permission(self, request, obj=None): return False
 
+    list_display = ('nome', 'boleto_do_mes')
+
     def get_urls(self):
         urls = super().get_urls()
         custom = [
@@ -1416,9 +1530,44 @@ class BoletoAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.gerar_boletos_view),
                 name='despesas_boleto_gerar'
             ),
+            path(
+                '<int:unidade_id>/<int:mes>/<int:ano>.pdf',
+                self.admin_site.admin_view(self.boleto_pdf_view),
+                name='despesas_boleto_pdf'
+            ),
         ]
         return custom + urls
 
+    @admin.display(description="Boleto do mês")
+    def boleto_do_mes(self, obj):
+        hoje = datetime.now()
+        url = reverse('admin:despesas_boleto_pdf', args=[obj.pk, hoje.month, hoje.year])
+        return format_html('<a href="{}">PDF {}</a>', url, f"{hoje.month:02d}/{hoje.year}")
+
+    def boleto_pdf_view(self, request, unidade_id, mes, ano):
+        """
+        Boleto de uma única unidade. A ETag é o hash do conteúdo do boleto
+        (dados da unidade no mês + template): se o navegador já tem essa
+        versão a resposta é 304, sem renderizar nada. Não há Last-Modified:
+        os dados não guardam quando foram alterados.
+        """
+        if not 1 <= mes <= 12:
+            raise Http404("Mês inválido.")
+        contexto, chave = boleto_da_unidade(unidade_id, mes, ano)
+        if contexto is None:
+            raise Http404("Unidade não encontrada.")
+
+        etag = quote_etag(chave)
+        nao_modificado = get_conditional_response(request, etag=etag)
+        if nao_modificado is not None:
+            return nao_modificado
+
+        resp = HttpResponse(pdf_da_unidade(contexto, chave), content_type="application/pdf")
+        resp["ETag"] = etag
+        nome = nome_arquivo_boleto(contexto['unidade'], mes, ano)
+        resp["Content-Disposition"] = f'inline; filename="{nome}"'
+        return resp
+
     def boletos_button(self, request):
         return {
             'title':       "Gerar boletos por mês",
@@ -1437,7 +1586,30 @@ class BoletoAdmin(admin.ModelAdmin):
             if form.is_valid():
                 mes = int(form.cleaned_data['mes'])
                 ano = int(form.cleaned_data['ano'])
-                return self._gerar_zip_de_boletos(mes, ano)
+                formato = form.cleaned_data['formato']
+                streaming = form.cleaned_data.get('streaming')
+                if formato == 'pdf':
+                    parametros = {'formato': 'pdf'}
+                else:
+                    parametros = {
+                        'formato':    'zip',
+                        'compressao': form.cleaned_data['compressao'],
+                        'nivel':      form.cleaned_data.get('nivel'),
+                    }
+
+                # em streaming o download começa na hora, então não vai para a fila
+                if streaming or not getattr(settings, 'TAREFAS_EM_SEGUNDO_PLANO', False):
+                    if formato == 'pdf':
+                        return self._gerar_pdf_unico(mes, ano)
+                    return self._gerar_zip_de_boletos(
+                        mes, ano,
+                        compressao=COMPRESSOES[parametros['compressao']],
+                        nivel=parametros['nivel'],
+                        streaming=streaming,
+                    )
+                return enfileirar_e_acompanhar(
+                    request, Tarefa.BOLETOS, mes, ano, parametros=parametros,
+                )
         else:
             form = GerarBoletosForm(initial={
                 'mes': str(datetime.now().month),
@@ -1451,219 +1623,36 @@ class BoletoAdmin(admin.ModelAdmin):
         })
         return TemplateResponse(request, "admin/despesas/gerar_boletos.html", context)
 
-    def _gerar_zip_de_boletos(self, mes, ano):
-        buffer = io.BytesIO()
-        zf = zipfile.ZipFile(buffer, 'w')
-
-        if mes > 1:
-            mes_ant = mes - 1
-            ano_ant = ano
-        else:
-            mes_ant = 12
-            ano_ant = ano - 1
-
-        # 1) soma as despesas-base e calcula 10%
-        BASE = [
-          'Reparos/Reforma',
-          'Reparo/Reforma (Sem a Sala)',
-          'Salário - Síndico',
-          'Elevador',
-          'Serviço - Faxina',
-          'Material Consumo (Sem Sala Comercial)',
-          'Material/Serviço de Consumo',
-          'Seguro 6x',
-          'Energia Áreas Comuns',
-          'Taxa Lixo',
-          'Água',
-          'Honorários Contábeis',
-        ]
-        soma = Despesa.objects.filter(
-            tipo__nome__in=BASE,
-            mes=str(mes),
-            ano=ano
-        ).aggregate(total=Sum('valor_total'))['total'] or Decimal('0')
-        valor_fundo_total = (soma * Decimal('0.1')).quantize(Decimal('0.01'))
-
-        # 2) mapa de frações normalizadas (0–1) para o Fundo de Reserva
-        frac_qs = FracaoPorTipoDespesa.objects.filter(
-            tipo_despesa__nome__iexact='Fundo de Reserva'
-        )
-        frac_map = {
-            f.unidade.id: (Decimal(f.percentual) / Decimal('100'))
-            if Decimal(f.percentual) > 1 else Decimal(f.percentual)
-            for f in frac_qs
-        }
-
-        # 3) identifica a Sala e calcula metade da sua cota
-        try:
-            f_sala = frac_qs.get(unidade__nome__icontains='Sala')
-            sala = f_sala.unidade
-            pct_sala = frac_map[sala.id]
-            share_sala = (valor_fundo_total * pct_sala / Decimal('2')).quantize(Decimal('0.01'))
-        except FracaoPorTipoDespesa.DoesNotExist:
-            sala = None
-            share_sala = Decimal('0')
-
-        # 4) restante após a sala
-        restante_fundo = (valor_fundo_total - share_sala).quantize(Decimal('0.01'))
-
-        # 5) monta o mapa de valores do Fundo para cada unidade
-        valores_fundo = {}
-        if sala:
-            valores_fundo[sala.id] = share_sala
-        for unid, pct in frac_map.items():
-            if unid == sala.id:
-                continue
-            valores_fundo[unid] = (restante_fundo * pct).quantize(Decimal('0.01'))
-
-        tipos = (
-            TipoDespesa.objects
-            .exclude(nome__iexact='Fundo de Reserva')
-            .exclude(nome__iexact='Fatura Energia Elétrica')
-            .order_by('nome')
+    def _arquivo_do_mes(self, mes, ano, formato, compressao=COMPRESSOES['stored'], nivel=None):
+        """ZIP ou PDF único do mês, gerado uma vez só para pedidos simultâneos iguais."""
+        contextos = montar_contextos(mes, ano)
+        return execucao_unica.executar_uma_vez(
+            f"boletos-{formato}-{compressao}-{nivel}_{mes:02d}-{ano}",
+            assinatura_do_mes(contextos, formato, compressao),
+            lambda destino: gravar_arquivo_do_mes(destino, contextos, mes, ano, formato,
+                                                  compressao=compressao, nivel=nivel),
         )
 
-        existe_despesa_agua = Despesa.objects.filter(
-            tipo__nome__iexact='Água',
-            mes=str(mes),
-            ano=ano,
-            valor_total__gt=0
-        ).exists()
-
-        # 6) gera um PDF por unidade
-        for unidade in Unidade.objects.order_by('nome'):
-            lancamentos = []
-
-            # percorre cada tipo (exceto Fundo de Reserva)
-            for tipo in tipos:
-                desp = (Despesa.objects
-                    .filter(tipo=tipo,
-                            mes=str(mes),
-                            ano=ano,
-                            valor_total__gt=0)
-                    .order_by('-id')
-                    .first())
-
-                if desp:
-                    rateio = Rateio.objects.filter(
-                        despesa=desp,
-                        unidade=unidade
-                    ).first()
-
-                    # só calcula consumo se existir rateio e valor > 0
-                    if rateio and rateio.valor > Decimal('0'):
-                        atual = LeituraGas.objects.filter(
-                            unidade=unidade, mes=mes, ano=ano
-                        ).first()
-                        anterior = LeituraGas.objects.filter(
-                            unidade=unidade, mes=mes_ant, ano=ano_ant
-                        ).first()
-
-                        if atual and anterior:
-                            diff = atual.leitura - anterior.leitura
-                            consumo_gas = diff if diff > 0 else 0
-                        else:
-                            consumo_gas = 0
-                    else:
-                        consumo_gas = 0
-
-                    valor = rateio.valor if rateio else Decimal('0.00')
-
-                else:
-                    # não existe despesa cadastrada: exibe “–”
-                    consumo_gas = 0
-                    valor = None
-
-                lancamentos.append({
-                    'descricao': tipo.nome,
-                    'valor':     valor,
-                })
-
-            valor_fundo_un = valores_fundo.get(unidade.id, Decimal('0'))
-
-            # por fim, insere o Fundo de Reserva
-            if valor_fundo_un > 0:
-                lancamentos.append({
-                    'descricao': 'Fundo de Reserva',
-                    'valor':     valor_fundo_un,
-                })
-
-            # 6.4) consumo de gás
-            rateio_gas = Rateio.objects.filter(
-                despesa__tipo__nome__iexact='Gás',
-                despesa__mes=str(mes),
-                despesa__ano=ano,
-                unidade=unidade
-            ).first()
-
-            if rateio_gas and rateio_gas.valor > Decimal('0'):
-                atual_gas = LeituraGas.objects.filter(unidade=unidade,
-                                       mes=str(mes),
-                                       ano=str(ano)
-                                      ).first()
-                anterior  = LeituraGas.objects.filter(unidade=unidade,
-                                       mes=str(mes_ant),
-                                       ano=str(ano_ant)
-                                      ).first()
-                if atual_gas and anterior:
-                    diff = atual_gas.leitura - anterior.leitura
-                    consumo_gas = diff if diff > 0 else 0
-                elif atual_gas:
-                    consumo_gas = atual_gas.leitura
-                else:
-                    consumo_gas = 0
-            else:
-                consumo_gas = 0
-
-            if existe_despesa_agua:
-                atual_agua = LeituraAgua.objects.filter(unidade=unidade,
-                                                         mes=str(mes),
-                                                         ano=str(ano)
-                                                        ).first()
-                ant_agua   = LeituraAgua.objects.filter(unidade=unidade,
-                                                         mes=str(mes_ant),
-                                                         ano=str(ano_ant)
-                                                        ).first()
-                if atual_agua and ant_agua:
-                    diff_wa = atual_agua.leitura - ant_agua.leitura
-                    consumo_agua = diff_wa if diff_wa > 0 else 0
-                elif atual_agua:
-                    consumo_agua = atual_agua.leitura
-                else:
-                    consumo_agua = 0
-
-                rateio_agua = Rateio.objects.filter(
-                    despesa__tipo__nome__iexact='Água',
-                    despesa__mes=str(mes),
-                    despesa__ano=ano,
-                    unidade=unidade
-                ).first()
-                valor_agua = rateio_agua.valor if (rateio_agua and rateio_agua.valor > 0) else None
-            else:
-                consumo_agua = None
-                valor_agua = None
-
-            # 6.6) soma final e geração do PDF
-            total_boleto = sum(
-                item['valor'] if item['valor'] is not None else Decimal('0.00')
-                for item in lancamentos
-            )
-            html = render_to_string("despesas/boletos/boleto.html", {
-                'unidade':          unidade,
-                'mes':              mes,
-                'ano':              ano,
-                'lancamentos':      lancamentos,
-                'total':            total_boleto,
-                'gas_consumption':  consumo_gas,
-                'water_consumption': consumo_agua,
-            })
-            pdf = HTML(string=html, base_url=f"file://{settings.STATIC_ROOT}/").write_pdf()
-            zf.writestr(f"boleto_{unidade.nome}_{mes:02d}-{ano}.pdf", pdf)
+    def _gerar_zip_de_boletos(self, mes, ano, compressao=COMPRESSOES['stored'],
+                              nivel=None, streaming=False):
+        if streaming:
+            partes = iterar_zip_de_boletos(mes, ano, compressao=compressao, nivel=nivel)
+            resp = StreamingHttpResponse(partes, content_type="application/zip")
+        elif execucao_unica.ativo():
+            arquivo = self._arquivo_do_mes(mes, ano, 'zip', compressao, nivel)
+            resp = FileResponse(arquivo, content_type="application/zip")
+        else:
+            conteudo = gerar_zip_de_boletos(mes, ano, compressao=compressao, nivel=nivel)
+            resp = HttpResponse(conteudo, content_type="application/zip")
+        resp["Content-Disposition"] = f'attachment; filename="{nome_arquivo_zip(mes, ano)}"'
+        return resp
 
-        # 7) devolve o ZIP
-        zf.close()
-        resp = HttpResponse(buffer.getvalue(), content_type="application/zip")
-        resp["Content-Disposition"] = f'attachment; filename="boletos_{mes:02d}-{ano}.zip"'
+    def _gerar_pdf_unico(self, mes, ano):
+        if execucao_unica.ativo():
+            resp = FileResponse(self._arquivo_do_mes(mes, ano, 'pdf'), content_type="application/pdf")
+        else:
+            resp = HttpResponse(gerar_pdf_unico(mes, ano), content_type="application/pdf")
+        resp["Content-Disposition"] = f'attachment; filename="{nome_arquivo_pdf_unico(mes, ano)}"'
         return resp
 
 @receiver(post_delete, sender=Despesa)
@@ -1721,6 +1710,11 @@ class ExportarXlsxAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.exportar_excel_view),
                 name='despesas_exportar_xlsx'
             ),
+            path(
+                'exportar-csv/',
+                self.admin_site.admin_view(self.exportar_csv_view),
+                name='despesas_exportar_csv'
+            ),
         ]
         return custom + urls
 
@@ -1730,871 +1724,164 @@ class ExportarXlsxAdmin(admin.ModelAdmin):
         extra_context['anos_choices']   = [
             str(y) for y,_ in Despesa._meta.get_field('ano').choices
         ]
+        extra_context['abas_xlsx'] = ABAS_XLSX
         return super().changelist_view(request, extra_context=extra_context)
 
     def exportar_excel_view(self, request):
-        mes_str = request.GET.get('mes')
-        ano_str = request.GET.get('ano')
-        if not mes_str or not ano_str:
+        try:
+            mes = int(request.GET['mes'])
+            ano = int(request.GET['ano'])
+            # "até o mês": vários meses numa planilha só (resumo + RATEIO por mês)
+            mes_final = int(request.GET.get('mes_final') or mes)
+        except (KeyError, ValueError):
             return HttpResponse('Selecione mês e ano.', status=400)
-
-        mes = int(mes_str)
-        ano = int(ano_str)
-
-            # --- 1) buscar últimos registros de cada despesa direto do banco ---
-        wa = DespesaAgua.objects.filter(mes=mes, ano=ano).order_by('-id').first()
-        if wa and wa.agua_leituras:
-            p = wa.agua_leituras['params']
-            agua_fat    = Decimal(p.get('fatura', 0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-            agua_m3tot  = Decimal(p.get('m3_total', 0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-            agua_val_m3 = Decimal(p.get('valor_m3_agua', 0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-        else:
-            agua_fat = agua_m3tot = agua_val_m3 = Decimal('0')
-
-        ga = DespesaGas.objects.filter(mes=mes, ano=ano).order_by('-id').first()
-        if ga and ga.gas_leituras:
-            p = ga.gas_leituras['params']
-            gas_rec    = Decimal(p.get('recarga', 0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-            gas_kg     = Decimal(p.get('kg',      1)).quantize(Decimal('0.0001'), ROUND_HALF_UP)
-            gas_m3kg   = Decimal(p.get('m3_kg',   1)).quantize(Decimal('0.0001'), ROUND_HALF_UP)
-            gas_val_m3 = Decimal(p.get('valor_m3',0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-        else:
-            gas_rec = gas_kg = gas_m3kg = gas_val_m3 = Decimal('0')
-
-        en = DespesaEnergia.objects.filter(mes=mes, ano=ano).order_by('-id').first()
-        if en and en.energia_leituras:
-            p = en.energia_leituras['params']
-            en_fat     = Decimal(p.get('fatura',   0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-            en_kwh_tot = Decimal(p.get('kwh_total',1)).quantize(Decimal('0.0001'), ROUND_HALF_UP)
-            en_custo   = Decimal(p.get('custo_kwh',0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-            en_uso     = Decimal(p.get('uso_kwh',  0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
-        else:
-            en_fat = en_kwh_tot = en_custo = en_uso = Decimal('0')
-
-
-        if agua_m3tot != 0:
-            valor_por_m3   = (agua_fat / agua_m3tot).quantize(Decimal('0.01'), ROUND_HALF_UP)
-        else:
-            valor_por_m3   = Decimal('0.00')
-
-        # 1) busca dados
-        despesas = Despesa.objects.filter(mes=mes, ano=int(ano))
-        rateios  = Rateio.objects.filter(despesa__mes=mes, despesa__ano=int(ano))
-
-        # filtra todos os rateios do período
-        rateios = Rateio.objects.filter(
-            despesa__mes=mes,
-            despesa__ano=int(ano)
-        )
-
-        # pega apenas o FUNDOSERVA mais recente
-        fundo_tipo = TipoDespesa.objects.get(nome__iexact='Fundo de Reserva')
-        latest_fr = FundoReserva.objects.filter(
-            mes=mes,
-            ano=int(ano),
-            tipo=fundo_tipo
-        ).order_by('-id').first()
-
-        shares = {}
-
-        if latest_fr:
-            # mantém todos os rateios que NÃO são de Fundo de Reserva
-            # + apenas os rateios desse único Fundo de Reserva
-            rateios = rateios.filter(
-                Q(despesa__tipo__nome__iexact='Fundo de Reserva', despesa=latest_fr) |
-                ~Q(despesa__tipo__nome__iexact='Fundo de Reserva')
-            )
-
-        # 3) monta DataFrame RATEIO achatado
-        rows = []
-        for r in rateios:
-            rows.append({
-                'Unidade':      r.unidade.nome,
-                'Tipo':         r.despesa.tipo.nome,
-                'Valor Rateio': float(Decimal(r.valor).quantize(Decimal('0.01'))),
-            })
-        df_rateio = pd.DataFrame(rows)
-
-        # 4) pivot para ter colunas de cada tipo
-        df_rateio_pivot = (
-            df_rateio
-            .pivot_table(
-                index='Unidade',
-                columns='Tipo',
-                values='Valor Rateio',
-                aggfunc='sum',
-                fill_value=0
+        if not 1 <= mes <= mes_final <= 12:
+            return HttpResponse('Mês inválido: o final deve ser igual ou posterior ao inicial, até 12.',
+                                status=400)
+        # abas marcadas (só na planilha de um mês); nenhuma = todas
+        try:
+            abas = abas_validas(request.GET.getlist('abas'))
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        abas_parciais = abas != ABAS_XLSX and mes_final == mes
+
+        if getattr(settings, 'TAREFAS_EM_SEGUNDO_PLANO', False):
+            parametros = {}
+            if mes_final != mes:
+                parametros['mes_final'] = mes_final
+            if abas_parciais:
+                parametros['abas'] = list(abas)
+            return enfileirar_e_acompanhar(request, Tarefa.XLSX, mes, ano, parametros)
+
+        nome = (nome_arquivo_xlsx_periodo(mes, mes_final, ano) if mes_final != mes
+                else nome_arquivo_xlsx(mes, ano))
+
+        def escrever(destino):
+            escrever_planilha(destino, mes, ano, mes_final, abas)
+
+        if execucao_unica.ativo():
+            # pedidos simultâneos da mesma planilha recebem o mesmo arquivo
+            chave = f"xlsx_{mes:02d}-{mes_final:02d}_{ano}"
+            if abas_parciais:
+                chave += "_abas" + "".join(str(ABAS_XLSX.index(a)) for a in abas)
+            arquivo = execucao_unica.executar_uma_vez(
+                chave,
+                versao_dados(ano, range(mes, mes_final + 1)),
+                lambda destino: escrever(str(destino)),
             )
-            .reset_index()
-        )
-        df_rateio_pivot.replace(0, pd.NA, inplace=True)
-        # tenta carregar o proxy de FundoReserva para este mês/ano
-        if latest_fr:
-            rateios_fundo = Rateio.objects.filter(despesa=latest_fr)
-            shares = {r.unidade.nome: float(r.valor) for r in rateios_fundo}
-            df_rateio_pivot['Fundo de Reserva'] = df_rateio_pivot['Unidade'].map(shares).fillna(0)
         else:
-            df_rateio_pivot['Fundo de Reserva'] = 0
-
-        # injeta na pivot — todas as linhas terão valor (zero se a unidade não existir no mapa)
-        df_rateio_pivot['Fundo de Reserva'] = (
-            df_rateio_pivot['Unidade']
-            .map(shares)
-            .fillna(Decimal('0'))
-            .astype(float)
-        )
-        tipos = list(
-            TipoDespesa.objects
-            .order_by('id')
-            .values_list('nome', flat=True)
-        )
-
-        for t in tipos:
-            if t not in df_rateio_pivot.columns:
-                df_rateio_pivot[t] = 0
-
-        # só agora você sabe que 'Gás' existe
-        gas_rateio_map = df_rateio_pivot.set_index('Unidade')['Gás'].fillna(0).to_dict()
-
-        # reordena as colunas: primeiro 'Unidade', depois todas as despesas
-        df_rateio_pivot = df_rateio_pivot[['Unidade'] + tipos]
-
-        # ––– 5) EXIBIÇÃO POR UNIDADE –––
-        # calcula mês/ano anterior corretamente
-        prev_mes = mes - 1 if mes > 1 else 12
-        prev_ano = ano     if mes > 1 else ano - 1
-
-        # pivot com índice = Tipo e colunas = Unidade
-        df_exib_un = (
-            df_rateio
-            .pivot_table(
-                index='Tipo',
-                columns='Unidade',
-                values='Valor Rateio',
-                aggfunc='sum',
-                fill_value=0
-            )
-        )
-        df_exib_un.replace(0, pd.NA, inplace=True)
-        # garante todas as despesas, na ordem do TipoDespesa
-        tipos = list(
-            TipoDespesa.objects
-                .order_by('id')
-                .values_list('nome', flat=True)
-        )
-        df_exib_un = df_exib_un.reindex(tipos).fillna(0)
-        df_exib_un.drop('Fatura Energia Elétrica', errors='ignore', inplace=True)
-
-        # calcula consumo de gás e água por unidade
-        energia_map = {}
-        # for un in df_exib_un.columns:
-        #     # só calcula se tiver rateio > 0
-        #     rateio_en = Rateio.objects.filter(
-        #         despesa__tipo__nome__iexect='Energia Salão',
-        #         despesa__mes=str(mes),
-        #         despesa__ano=ano,
-        #         unidade__nome=un
-        #     ).first()
-        #     if rateio_en and rateio_en.valor > Decimal('0'):
-        #         # leituras anteriores e atuais dos 2 medidores
-        #         ant1 = LeituraEnergia.objects.filter(
-        #             unidade__nome=un, medidor=1,
-        #             mes=prev_mes, ano=prev_ano
-        #         ).first()
-        #         atu1 = LeituraEnergia.objects.filter(
-        #             unidade__nome=un, medidor=1,
-        #             mes=mes, ano=ano
-        #         ).first()
-        #         ant2 = LeituraEnergia.objects.filter(
-        #             unidade__nome=un, medidor=2,
-        #             mes=prev_mes, ano=prev_ano
-        #         ).first()
-        #         atu2 = LeituraEnergia.objects.filter(
-        #             unidade__nome=un, medidor=2,
-        #             mes=mes, ano=ano
-        #         ).first()
-        #
-        #         diff1 = (atu1.leitura - ant1.leitura) if (ant1 and atu1) else 0
-        #         diff2 = (atu2.leitura - ant2.leitura) if (ant2 and atu2) else 0
-        #         energia = max(diff1, 0) + max(diff2, 0)
-        #     else:
-        #         energia = 0
-        #
-        #     energia_map[un] = energia
-
-        gas_map = {}
-        agua_map = {}
-        for un in df_exib_un.columns:
-
-            rateio_gas = Rateio.objects.filter(
-                despesa__tipo__nome__iexact='Gás',
-                despesa__mes=str(mes),
-                despesa__ano=ano,
-                unidade__nome=un
-            ).first()
-
-            if rateio_gas and rateio_gas.valor > Decimal('0'):
-                atual_gas = LeituraGas.objects.filter(unidade__nome=un, mes=mes, ano=ano).first()
-                ant_gas   = LeituraGas.objects.filter(unidade__nome=un, mes=prev_mes, ano=prev_ano).first()
-                if atual_gas and ant_gas:
-                    diff_g = atual_gas.leitura - ant_gas.leitura
-                    gas_map[un] = diff_g if diff_g > 0 else 0
-                elif atual_gas:
-                    gas_map[un] = atual_gas.leitura
-                else:
-                    gas_map[un] = 0
-            else:
-                gas_map[un] = 0
-
-            rateio_agua = Rateio.objects.filter(
-                despesa__tipo__nome__iexact='Água',
-                despesa__mes=str(mes),
-                despesa__ano=ano,
-                unidade__nome=un
-            ).first()
-
-            if rateio_agua and rateio_agua.valor > Decimal('0'):
-                atual_agua = LeituraAgua.objects.filter(unidade__nome=un, mes=mes,     ano=ano).first()
-                ant_agua   = LeituraAgua.objects.filter(unidade__nome=un, mes=prev_mes, ano=prev_ano).first()
-                # Só subtrai se TIVER leituras atual e anterior
-                if atual_agua and ant_agua:
-                    diff_wa = atual_agua.leitura - ant_agua.leitura
-                    agua_map[un] = diff_wa if diff_wa > 0 else 0
-                else:
-                    # Se não existir leitura atual OU não existir anterior, zera
-                    agua_map[un] = 0
-            else:
-                # Se não há rateio de água para esta unidade, força 0
-                agua_map[un] = 0
-
-            # água
-            atual_a = LeituraAgua.objects.filter(unidade__nome=un, mes=mes,     ano=ano).first()
-            ant_a   = LeituraAgua.objects.filter(unidade__nome=un, mes=prev_mes, ano=prev_ano).first()
-            if atual_a and ant_a:
-                diff = atual_a.leitura - ant_a.leitura
-                agua_map[un] = diff if diff > 0 else 0
-            else:
-                agua_map[un] = 0
-
-        # adiciona as linhas no final
-        df_exib_un = df_exib_un.replace({
-            r"R\$\s*": "",
-            r"\.": "",
-            r",": ".",
-        }, regex=True)
-        # converte todas as colunas para valores numéricos antes de calcular o
-        # total, tratando qualquer valor não numérico como 0
-        df_exib_un = df_exib_un.apply(pd.to_numeric, errors="coerce").fillna(0)
-        df_exib_un.loc["TOTAL BOLETO"] = df_exib_un.sum(axis=0)
-        df_exib_un.loc['Consumo Gás m³']  = pd.Series(gas_map)
-        df_exib_un.loc['Consumo Água m³'] = pd.Series(agua_map)
-
-        df_exib_un.index.name = 'Tipo'
-
-        # 2) reseta índice e renomeia a coluna 'Tipo' para 'Despesas Condomínio'
-        df_exib_un = df_exib_un.reset_index().rename(columns={'Tipo': 'Despesas Condomínio'})
-
-        piv = df_exib_un.set_index('Despesas Condomínio')
-
-        agua_rateio_map = piv.loc['Água'].to_dict()
-        gas_rateio_map  = {
-            uni: (val or 0)
-            for uni, val in df_rateio_pivot.set_index('Unidade')['Gás'].to_dict().items()
-        }
-
-        # valores de energia já foram obtidos anteriormente (en_fat,
-        # en_kwh_tot, en_custo, en_uso). Evita nova consulta repetida
-        rows = []
-        energia_map = {}
-
-        for un in Unidade.objects.order_by('nome'):
-            # consumo você já calcula normalmente
-            ant_wa = LeituraAgua.objects.filter(unidade=un, mes=prev_mes, ano=prev_ano).first()
-            atu_wa = LeituraAgua.objects.filter(unidade=un, mes=mes,     ano=ano    ).first()
-            if ant_wa and atu_wa:
-                diff_wa = atu_wa.leitura - ant_wa.leitura
-                cons_wa = diff_wa if diff_wa > 0 else 0
-            else:
-                cons_wa = 0
-
-            ant_ga = LeituraGas.objects.filter(unidade=un, mes=prev_mes, ano=prev_ano).first()
-            atu_ga = LeituraGas.objects.filter(unidade=un, mes=mes,     ano=ano    ).first()
-            if ant_ga and atu_ga:
-                diff_ga = atu_ga.leitura - ant_ga.leitura
-                cons_ga = diff_ga if diff_ga > 0 else 0
-            elif atu_ga:
-                cons_ga = atu_ga.leitura
-            else:
-                cons_ga = 0
-
-            ant1 = LeituraEnergia.objects.filter(unidade=un, mes=prev_mes, ano=prev_ano, medidor=1).first()
-            atu1 = LeituraEnergia.objects.filter(unidade=un, mes=mes,     ano=ano,     medidor=1).first()
-            ant2 = LeituraEnergia.objects.filter(unidade=un, mes=prev_mes, ano=prev_ano, medidor=2).first()
-            atu2 = LeituraEnergia.objects.filter(unidade=un, mes=mes,     ano=ano,     medidor=2).first()
-            la1_val = ant1.leitura if ant1 else None
-            lk1_val = atu1.leitura if atu1 else None
-            la2_val = ant2.leitura if ant2 else None
-            lk2_val = atu2.leitura if atu2 else None
-
-            if lk1_val is not None:
-                diff1 = lk1_val - (la1_val or 0)
-            else:
-                diff1 = 0
-
-            if lk2_val is not None:
-                diff2 = lk2_val - (la2_val or 0)
-            else:
-                diff2 = 0
-            cons_en = max(diff1, 0) + max(diff2, 0)
-            energia_map[un.nome] = round(cons_en, 3)
-
-            la1 = la1_val if la1_val is not None else '-'
-            lk1 = lk1_val if lk1_val is not None else '-'
-            la2 = la2_val if la2_val is not None else '-'
-            lk2 = lk2_val if lk2_val is not None else '-'
-
-            valor_dec = (Decimal(cons_en) * en_uso).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            valor = float(valor_dec)
-
-            # 1) pega os valores prontos vindos do admin
-            wa = DespesaAgua.objects.filter(mes=mes, ano=ano).order_by('-id').first()
-            if wa and wa.agua_leituras:
-                params_agua = wa.agua_leituras.get('params', {})
-                agua_fat    = Decimal(params_agua.get('fatura',    0))
-                agua_m3tot  = Decimal(params_agua.get('m3_total',  0))
-                agua_val_m3 = Decimal(params_agua.get('valor_m3_agua',  0))
-            else:
-                agua_fat = agua_m3tot = agua_val_m3 = Decimal('0')
-
-            # faça o mesmo para m3_total e valor_m3_agua:
-            if wa and wa.m3_total is not None:
-                agua_m3tot = Decimal(str(wa.m3_total))
-            else:
-                agua_m3tot = Decimal('0')
-
-
-            if wa and wa.valor_m3_agua is not None:
-                agua_val_m3 = Decimal(str(wa.valor_m3_agua))
-            else:
-                agua_val_m3 = Decimal('0')
-
-            # repita o guard para gás e energia…
-            ga = DespesaGas.objects.filter(mes=mes, ano=ano).order_by('-id').first()
-            if ga and ga.gas_leituras:
-                p = ga.gas_leituras.get('params', {})
-                gas_rec  = Decimal(p.get('recarga', 0))
-                gas_kg   = Decimal(p.get('kg',      0))
-                gas_m3kg = Decimal(p.get('m3_kg',   0))
-            else:
-                gas_rec = gas_kg = gas_m3kg = Decimal('0')
-
-            # 2) só depois disso você monta o dicionário:
-            rows.append({
-                'Unidade':            un.nome,
-                'Água – R$ Fatura':   float(agua_fat),
-                'Água – m³ total':    float(agua_m3tot),
-                'Água – R$/m³':       float(agua_val_m3),
-                'Água – Leitura Ant.':   getattr(ant_wa, 'leitura', ''),
-                'Água – Leitura Atu.':   getattr(atu_wa, 'leitura', ''),
-                'Água – Consumo m³':     cons_wa,
-                'Água – R$':           float(agua_rateio_map.get(un.nome, 0)),
-
-                'Gás – R$ Recarga':    float(gas_rec),
-                'Gás – KG':            float(gas_kg),
-                'Gás – m³/kg':         float(gas_m3kg),
-                'Gás – R$ por m³': float(gas_val_m3),
-                'Gás – Leitura Ant.':  getattr(ant_ga, 'leitura', ''),
-                'Gás – Leitura Atu.':  getattr(atu_ga, 'leitura', ''),
-                'Gás – Consumo m³':     cons_ga,
-                'Gás – R$':  float(gas_rateio_map .get(un.nome, 0)),
-
-                'Energia – Fatura': float(en_fat),
-                'Energia – kWh Total':         float(en_kwh_tot),
-                'Energia – R$ por kWh':        float(en_custo),
-                'Energia – Uso kWh': float(en_uso),
-                'Energia – Med1 Ant.': la1,
-                'Energia – Med1 Atu.': lk1,
-                'Energia – Med2 Ant.': la2,
-                'Energia – Med2 Atu.': lk2,
-                'Energia – Consumo kWh': cons_en,
-                'Energia – R$':          float(valor),
-            })
-
-        df_leituras = pd.DataFrame(rows)
+            # arquivo temporário: apagado quando o FileResponse o fechar
+            arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+            escrever(arquivo)
+            arquivo.seek(0)
+        return FileResponse(arquivo, as_attachment=True, filename=nome,
+                            content_type=XLSX_CONTENT_TYPE)
+
+    def exportar_csv_view(self, request):
+        """Rateios de um período qualquer (pode cruzar anos), em CSV por streaming."""
+        try:
+            mes = int(request.GET['mes'])
+            ano = int(request.GET['ano'])
+            mes_final = int(request.GET.get('mes_final') or mes)
+            ano_final = int(request.GET.get('ano_final') or ano)
+        except (KeyError, ValueError):
+            return HttpResponse('Selecione mês e ano.', status=400)
+        if not (1 <= mes <= 12 and 1 <= mes_final <= 12):
+            return HttpResponse('Mês inválido.', status=400)
+        if (ano_final, mes_final) < (ano, mes):
+            return HttpResponse('O período final deve ser igual ou posterior ao inicial.', status=400)
+
+        linhas = linhas_csv_rateios(mes, ano, mes_final, ano_final,
+                                    chunk_size=getattr(settings, 'CSV_CHUNK_SIZE', 2000))
+        response = StreamingHttpResponse(linhas, content_type=CSV_CONTENT_TYPE)
+        nome = nome_arquivo_csv(mes, ano, mes_final, ano_final)
+        response['Content-Disposition'] = f'attachment; filename="{nome}"'
+        return response
 
-        df_leituras['Energia – Consumo kWh'] = (
-            df_leituras['Energia – Consumo kWh']
-              .astype(float)
-              .round(3)
-        )
+@admin.register(LogAlteracao)
+class LogAlteracaoAdmin(admin.ModelAdmin):
+    list_display = ('usuario','modelo','objeto_id','acao','valor','criado_em')
+    readonly_fields = ('usuario','modelo','objeto_id','acao','descricao','despesa','valor','criado_em')
 
-        for col in [
-            'Energia – Med1 Ant.',
-            'Energia – Med1 Atu.',
-            'Energia – Med2 Ant.',
-            'Energia – Med2 Atu.',
-        ]:
-            df_leituras[col] = (
-                df_leituras[col]
-                  .replace('-', np.nan)
-                  .replace('', np.nan)
-                  .astype(float)
-                  .round(4)
-            )
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display  = ('id', 'tipo', 'mes', 'ano', 'status', 'progresso', 'usuario',
+                     'criado_em', 'duracao_segundos', 'acompanhar')
+    list_filter   = ('tipo', 'status')
+    readonly_fields = ('tipo', 'mes', 'ano', 'parametros', 'status', 'progresso', 'erro',
+                       'arquivo', 'usuario', 'criado_em', 'iniciado_em', 'concluido_em')
 
-        # máscara: linhas onde as duas colunas são NaN
-        mask_sem_leitura = (
-            df_leituras[['Energia – Med1 Atu.', 'Energia – Med2 Atu.']]
-              .isna()
-              .all(axis=1)
-        )
+    def has_add_permission(self, request):    return False
+    def has_change_permission(self, request, obj=None): return False
 
-        # para essas linhas, zera consumo e valor
-        df_leituras.loc[mask_sem_leitura, 'Energia – Consumo kWh'] = 0.0
-        df_leituras.loc[mask_sem_leitura, 'Energia – R$']           = 0.0
-
-        # garante que não haja Decimal na divisão
-        df_leituras['Água – R$'] = df_leituras['Água – R$'].astype(float)
-        df_leituras['Água – Consumo m³'] = df_leituras['Água – Consumo m³'].astype(float)
-
-        # agora sim, float ÷ float
-        df_leituras['Água – R$/m³'] = (
-            df_leituras['Água – R$'] /
-            df_leituras['Água – Consumo m³'].replace(0, pd.NA)  # evita divisão por zero
-        ).fillna(0).round(4)
-
-        # calcula a coluna "Água – R$/m³" linha a linha
-        df_leituras['Água – R$/m³'] = (
-            df_leituras['Água – R$'] / df_leituras['Água – Consumo m³']
-        ).round(4)
-
-        # primeiro converte as duas colunas para float
-        serie_valr   = df_leituras['Água – R$'].astype(float)
-        serie_cons   = df_leituras['Água – Consumo m³'].astype(float)
-
-        # aí faz a divisão, cuidando do zero
-        df_leituras['Água – R$/m³'] = (
-            serie_valr.div(serie_cons.replace(0, pd.NA))  # troca 0 por NA para não dar divisão por zero
-                   .fillna(0)                              # coloca 0 onde era NA ou infinidade
-        )
+    def has_view_permission(self, request, obj=None):
+        # quem pediu a geração acompanha e baixa a própria tarefa
+        if obj is not None and obj.usuario_id == request.user.pk:
+            return True
+        return super().has_view_permission(request, obj)
 
-        df_leituras.replace(0, pd.NA, inplace=True)
-
-        df_exib_un = df_exib_un.set_index('Despesas Condomínio')
-        df_exib_un.loc['Consumo Energia Salão'] = pd.Series(energia_map)
-        if 'Energia Salão' in df_exib_un.index:
-            energia_row = df_exib_un.loc['Energia Salão']
-            for unidade, val in energia_row.items():
-                if unidade in df_leituras['Unidade'].values:
-                    df_leituras.loc[df_leituras['Unidade'] == unidade, 'Energia – R$'] = float(val or 0)
-        df_exib_un = df_exib_un.reset_index()
-
-        # lista completa na ordem que você quer
-        colunas = [
-            'Unidade',
-            'Água – R$ Fatura',
-            'Água – m³ total',
-            'Água – R$/m³',
-            'Água – Leitura Ant.',
-            'Água – Leitura Atu.',
-            'Água – Consumo m³',
-            'Água – R$',
-            # agora os campos de gás
-            'Gás – R$ Recarga',
-            'Gás – KG',
-            'Gás – m³/kg',
-            'Gás – R$ por m³',
-            'Gás – Leitura Ant.',
-            'Gás – Leitura Atu.',
-            'Gás – Consumo m³',
-            'Gás – R$',
-            # e finalmente os de energia
-            'Energia – Fatura',
-            'Energia – kWh Total',
-            'Energia – R$ por kWh',
-            'Energia – Uso kWh',
-            'Energia – kWh total',
-            'Energia – Custo kWh',
-            'Energia – Med1 Ant.',
-            'Energia – Med1 Atu.',
-            'Energia – Med2 Ant.',
-            'Energia – Med2 Atu.',
-            'Energia – Consumo kWh',
-            'Energia – R$',
-        ]
-        # filtra apenas as colunas existentes (evita KeyError caso falte alguma)
-        colunas_existentes = [c for c in colunas if c in df_leituras.columns]
-        df_leituras = df_leituras[[c for c in colunas if c in df_leituras.columns]]
+    def _tarefa(self, request, pk, **filtros):
+        tarefa = get_object_or_404(Tarefa, pk=pk, **filtros)
+        if not self.has_view_permission(request, tarefa):
+            raise PermissionDenied
+        return tarefa
 
-        if agua_m3tot:
-            valor_por_m3 = (agua_fat / agua_m3tot).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        else:
-            valor_por_m3 = Decimal('0.00')
-
-        df_leituras['Água – R$/m³'] = float(valor_por_m3)
-
-        df_params_agua = pd.DataFrame([
-            {"Parâmetro": "R$ Fatura",      "Valor": float(agua_fat)},
-            {"Parâmetro": "m³ Total",        "Valor": float(agua_m3tot)},
-            {"Parâmetro": "R$ por m³ Água", "Valor": float(valor_por_m3)},
-        ])
-        df_params_gas = pd.DataFrame([
-            {"Parâmetro": "R$ Recarga",      "Valor": float(gas_rec)},
-            {"Parâmetro": "KG",              "Valor": float(gas_kg)},
-            {"Parâmetro": "m³/kg",           "Valor": float(gas_m3kg)},
-            {"Parâmetro": "R$ por m³ Gás",   "Valor": float(gas_val_m3)},
-        ])
-        df_params_energia = pd.DataFrame([
-            {"Parâmetro": "R$ Fatura",      "Valor": float(en_fat)},
-            {"Parâmetro": "kWh Total",      "Valor": float(en_kwh_tot)},
-            {"Parâmetro": "R$ por kWh",     "Valor": float(en_custo)},
-            {"Parâmetro": "Uso kWh",        "Valor": float(en_uso)},
-        ])
-
-        tipos_nf = [
-            "Material/Serviço de Consumo",
-            "Material Consumo (Sem Sala Comercial)",
-            "Reparos/Reforma",
-            "Reparo/Reforma (Sem a Sala)",
+    def get_urls(self):
+        urls = super().get_urls()
+        custom = [
+            path(
+                '<int:pk>/status/',
+                self.admin_site.admin_view(self.status_view),
+                name='despesas_tarefa_status'
+            ),
+            path(
+                '<int:pk>/status.json',
+                self.admin_site.admin_view(self.status_json_view),
+                name='despesas_tarefa_status_json'
+            ),
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='despesas_tarefa_download'
+            ),
         ]
+        return custom + urls
 
-        nf_rows = []
-        despesas_nf = Despesa.objects.filter(
-            mes=mes,
-            ano=ano,
-            tipo__nome__in=tipos_nf,
-        )
-
-        for desp in despesas_nf:
-            for nf in desp.nf_info or []:
-                nf_rows.append({
-                    "Tipo Despesa": desp.tipo.nome,
-                    "Fornecedor": nf.get("fornecedor", ""),
-                    "Histórico": nf.get("historico", ""),
-                    "NF Nº": nf.get("numero", ""),
-                    "Tipo (com/sem)": nf.get("tipo", ""),
-                    "Valor": nf.get("valor", 0),
-                })
-
-        df_nfs = pd.DataFrame(nf_rows)
-
-        # 3) gravar tudo no Excel, incluindo a aba de parâmetros
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            df_params_gas    .to_excel(writer, sheet_name="Parâmetros Gás",    index=False)
-            df_params_energia.to_excel(writer, sheet_name="Parâmetros Energia",index=False)
-
-            # suas demais abas
-            df_rateio_pivot.to_excel(
-                writer,
-                sheet_name="RATEIO",
-                index=False,
-                na_rep='-'
-            )
-
-            unit_cols = [c for c in df_exib_un.columns if c != 'Despesas Condomínio']
-            df_exib_un['Total Geral'] = ''
-            if 'TOTAL BOLETO' in df_exib_un['Despesas Condomínio'].values:
-                soma_geral = (
-                    df_exib_un.loc[
-                        df_exib_un['Despesas Condomínio']=='TOTAL BOLETO',
-                        unit_cols
-                    ]
-                    .sum(axis=1)
-                    .iat[0]
-                )
-                df_exib_un.loc[
-                    df_exib_un['Despesas Condomínio']=='TOTAL BOLETO',
-                    'Total Geral'
-                ] = float(soma_geral)
-            # reordena para garantir que fique no fim
-            cols = [c for c in df_exib_un.columns if c!='Total Geral'] + ['Total Geral']
-            df_exib_un = df_exib_un[cols]
-
-            # reordena para garantir que 'Total Geral' fique na última coluna
-            cols_ordenadas = [c for c in df_exib_un.columns if c != 'Total Geral'] + ['Total Geral']
-            df_exib_un = df_exib_un[cols_ordenadas]
-
-            df_exib_un.to_excel(
-                writer,
-                sheet_name="EXIBIÇÃO POR UNIDADE",
-                index=False,
-                na_rep='-'
-            )
-            workbook       = writer.book
-            bold_currency_fmt = workbook.add_format({
-                'bold':      True,
-                'num_format':'R$ #,##0.00;R$ -#,##0.00;"–";@',
-                'align':     'center',
-                'valign':    'vcenter',
-            })
-
-            # 2) Pega a planilha “Exibição por Unidade”
-            ws2 = writer.sheets['EXIBIÇÃO POR UNIDADE']
-
-            # 3) Descobre o índice da nova coluna
-            col_idx = {name: idx for idx, name in enumerate(df_exib_un.columns)}
-            if 'Total Geral' in col_idx:
-                idx_tot = col_idx['Total Geral']
-                # 4) Aplica largura + negrito moeda
-                ws2.set_column(idx_tot, idx_tot, 15, bold_currency_fmt)
-
-            df_leituras.to_excel(
-                writer,
-                sheet_name="DESPESAS RATEIO",
-                index=False,
-                na_rep='-'
-            )
+    @admin.display(description="Duração (s)")
+    def duracao_segundos(self, obj):
+        return f"{obj.duracao:.1f}" if obj.duracao is not None else "–"
 
-            df_nfs.to_excel(
-                writer,
-                sheet_name="Notas Fiscais",
-                index=False
-            )
+    @admin.display(description="Acompanhar")
+    def acompanhar(self, obj):
+        url = reverse('admin:despesas_tarefa_status', args=[obj.pk])
+        return format_html('<a href="{}">abrir</a>', url)
 
-            nrows   = len(df_leituras)
-            cols    = list(df_leituras.columns)
-            idx     = {c:i for i,c in enumerate(cols)}
-
-            c_med1  = idx["Energia – Med1 Atu."]
-            c_med2  = idx["Energia – Med2 Atu."]
-            c_ant1  = idx["Energia – Med1 Ant."]
-            c_ant2  = idx["Energia – Med2 Ant."]
-            c_uso   = idx["Energia – Uso kWh"]
-            c_cons  = idx["Energia – Consumo kWh"]
-            c_val   = idx["Energia – R$"]
-
-            # formatos
-            number4_fmt  = writer.book.add_format({'num_format':'0.000','align':'center'})
-            currency_fmt = writer.book.add_format({'num_format':'R$ #,##0.00','align':'center'})
-
-            # tenta obter a aba 'DESPESAS RATEIO'
-            ws3 = writer.sheets.get('DESPESAS RATEIO')
-            if ws3:
-                for row in range(1, nrows+1):
-                    m1 = xl_rowcol_to_cell(row, c_med1)
-                    m2 = xl_rowcol_to_cell(row, c_med2)
-                    a1 = xl_rowcol_to_cell(row, c_ant1)
-                    a2 = xl_rowcol_to_cell(row, c_ant2)
-                    uso= xl_rowcol_to_cell(row, c_uso)
-                    cons_cell = xl_rowcol_to_cell(row, c_cons)
-
-                    # só calcula consumo se existir leitura atual em pelo menos um medidor
-                    f_cons = f'=IF(AND({m1}="",{m2}=""),0,({m1}-{a1})+({m2}-{a2}))'
-                #    ws3.write_formula(row, c_cons, f_cons, number4_fmt)
-
-                    # só calcula valor se houver consumo
-                    f_val  = f'=IF(AND({m1}="",{m2}=""),0,{cons_cell}*{uso})'
-                #    ws3.write_formula(row, c_val, f_val, currency_fmt)
-
-            # --- 8.2) crie seus formatos ---
-            workbook    = writer.book
-            currency_fmt = workbook.add_format({
-                'num_format': 'R$ #,##0.00;R$ -#,##0.00;"–";@',
-                'align':      'center',
-                'valign':     'vcenter',
-            })
-            header_fmt = workbook.add_format({
-                'bold':   True,
-                'align':  'center',
-                'valign': 'vcenter',
-                'bg_color':'#D3D3D3',
-            })
-            number4_fmt = workbook.add_format({
-                'num_format': '0.000',
-                'align':      'center',
-                'valign':     'vcenter',
-            })
-            # negrito + moeda para a linha TOTAL BOLETO
-            bold_currency_fmt = workbook.add_format({
-                'bold':      True,
-                'num_format':'R$ #,##0.00;R$ -#,##0.00;"–";@',
-                'align':     'center',
-                'valign':    'vcenter',
-            })
-
-            # --- 8.3) formate apenas a aba RATEIO, se existir ---
-            if 'RATEIO' in writer.sheets:
-                ws = writer.sheets['RATEIO']
-                first_col = 1
-                last_col  = df_rateio_pivot.shape[1] - 1
-                ws.set_column(first_col, last_col, 15, currency_fmt)
-                ws.set_row(0, None, header_fmt)
-
-                # escreve a linha TOTAL logo abaixo dos dados
-                n = len(df_rateio_pivot)
-                total_row = n + 1
-                ws.write(total_row, 0, 'TOTAL:', header_fmt)
-                for col_idx in range(first_col, last_col + 1):
-                    col_letter = xlsxwriter.utility.xl_col_to_name(col_idx)
-                    formula = f"=SUM({col_letter}2:{col_letter}{n+1})"
-                    ws.write_formula(total_row, col_idx, formula, bold_currency_fmt)
-
-                # --- 8.4) formata aba EXIBIÇÃO POR UNIDADE ---
-                if 'EXIBIÇÃO POR UNIDADE' in writer.sheets:
-                    ws2 = writer.sheets['EXIBIÇÃO POR UNIDADE']
-
-                    # cabeçalho
-                    ws2.set_row(0, None, header_fmt)
-
-                    idx_total = df_exib_un.index[
-                        df_exib_un['Despesas Condomínio'] == 'TOTAL BOLETO'
-                    ].tolist()
-                    if idx_total:
-                        total_row_exib = idx_total[0] + 1  # +1 para o cabeçalho
-                    else:
-                        total_row_exib = len(tipos) + 1
-
-                    # TOTAL BOLETO em negrito e moeda
-                    ws2.set_row(total_row_exib, None, bold_currency_fmt)
-
-                    total_cols = len(df_exib_un.columns)
-
-                    # 1) todas as colunas de unidade (1 até última) como R$
-                    ws2.set_column(1, total_cols-1, 15, currency_fmt)
-
-                    # 2) apenas as linhas de consumo (duas após o TOTAL BOLETO) com 4 casas e dash no zero
-                    # consumo Gás
-                    ws2.set_row(total_row_exib + 1, None, number4_fmt)
-                    # consumo Água
-                    ws2.set_row(total_row_exib + 2, None, number4_fmt)
-                    # consumo Energia Salão
-                    ws2.set_row(total_row_exib + 3, None, number4_fmt)
-
-                # --- 8.5) formata aba DESPESAS RATEIO ---
-                if 'DESPESAS RATEIO' in writer.sheets:
-                    ws3 = writer.sheets['DESPESAS RATEIO']
-                    # cabeçalho em negrito
-                    ws3.set_row(0, None, header_fmt)
-
-                    col_idx = {col: i for i, col in enumerate(df_leituras.columns)}
-
-                # 1) formata Unidade em negrito
-                bold_fmt = workbook.add_format({'bold': True})
-
-                fmt_agua = workbook.add_format({
-                    'bg_color': '#E8F6F3',
-                    'align':    'center',
-                    'valign':   'vcenter',
-                })
-                fmt_gas  = workbook.add_format({
-                    'bg_color': '#FEF9E7',
-                    'align':    'center',
-                    'valign':   'vcenter',
-                })
-                fmt_ener = workbook.add_format({
-                    'bg_color': '#D6EAF8',  # cor nova
-                    'align':    'center',
-                    'valign':   'vcenter',
-                })
-                fmt_cons = workbook.add_format({
-                    'bg_color': '#E8DAEF',
-                    'align':    'center',
-                    'valign':   'vcenter',
-                })
-
-                # formato de consumo com 4 casas e centralizado
-                consumo_fmt = workbook.add_format({
-                    'num_format': '0.000',
-                    'align':      'center',
-                    'valign':     'vcenter',
-                })
-
-                leitura_ener_fmt = workbook.add_format({
-                    'num_format': '0.0000',
-                    'align':      'center',
-                    'valign':     'vcenter',
-                })
-
-                # cria um format só com alinhamento central
-                center_fmt = workbook.add_format({
-                    'align':  'center',
-                    'valign': 'vcenter',
-                })
-
-                for sheet in ("Parâmetros Água", "Parâmetros Gás", "Parâmetros Energia"):
-                    ws = writer.sheets.get(sheet)
-                    if ws:
-                        ws.hide()
-
-                ws_rateio = writer.sheets.get("RATEIO")
-                if ws_rateio:
-                    ws_rateio.activate()
-
-                # encontra colunas que contêm 'Leitura' no nome
-                leitura_cols = [i for i, c in enumerate(df_leituras.columns) if 'Leitura' in c]
-
-                # aplica centralização nessas colunas, mantendo a largura automática (ou escolha uma)
-                for col_idx in range(len(df_leituras.columns)):
-                    # largura “None” mantém o padrão/autofit
-                    ws3.set_column(col_idx, col_idx, None, center_fmt)
-
-                last_col = len(df_leituras.columns) - 1
-                ws3.set_column(last_col, last_col, 15, currency_fmt)
-
-                # determina até onde colorir (linha de dados começa em 1; limite = min(24, total))
-                n_linhas = df_leituras.shape[0]
-                last_row = min(n_linhas, 24)
-
-                cols = df_leituras.columns.tolist()
-                idx  = {c: i for i, c in enumerate(cols)}
-
-                # coluna Unidade em negrito
-                bold_fmt = workbook.add_format({'bold': True, 'align':'center','valign':'vcenter'})
-                if 'Unidade' in idx:
-                    ws3.set_column(idx['Unidade'], idx['Unidade'], None, bold_fmt)
-
-                # agrupa índices por prefixo
-                agua_idx = [idx[c] for c in cols if c.startswith('Água')]
-                gas_idx  = [idx[c] for c in cols if c.startswith('Gás')]
-                ener_idx = [idx[c] for c in cols if c.startswith('Energia')]
-                cons_idx = [idx[c] for c in cols if 'Consumo' in c]
-                ener_leitura_idx = [
-                    idx[c] for c in cols
-                    if 'Energia' in c and 'Med' in c
-                ]
-
-                # aplica o number4_fmt nas colunas de consumo
-                for ci in cons_idx:
-                    ws3.set_column(ci, ci, 12, consumo_fmt)
-                # aplica 4 casas às leituras de energia
-                for ci in ener_leitura_idx:
-                    ws3.set_column(ci, ci, 12, leitura_ener_fmt)
-
-
-                # helper para pintar bloco
-                def paint(cols_idx, fmt):
-                    if not cols_idx: return
-                    c1, c2 = min(cols_idx), max(cols_idx)
-                    ws3.conditional_format(1, c1, last_row, c2, {
-                        'type':   'no_errors',
-                        'format': fmt
-                    })
-
-                # pinta cada bloco
-                paint(agua_idx, fmt_agua)
-                paint(gas_idx,  fmt_gas)
-                paint(ener_idx, fmt_ener)
-                paint(cons_idx, fmt_cons)
-
-                if 'Notas Fiscais' in writer.sheets:
-                    ws_nf = writer.sheets['Notas Fiscais']
-                    ws_nf.set_row(0, None, header_fmt)
-                    ws_nf.set_column(0, len(df_nfs.columns)-1, 20, center_fmt)
-                    if 'Valor' in df_nfs.columns:
-                        col_val_nf = df_nfs.columns.get_loc('Valor')
-                        ws_nf.set_column(col_val_nf, col_val_nf, 15, currency_fmt)
-
-        buffer.seek(0)
-        filename = f'RATEIOS DESPESAS {mes:02d}_{ano}.xlsx'
-        response = HttpResponse(
-            buffer.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+    def status_view(self, request, pk):
+        tarefa = self._tarefa(request, pk)
+        context = self.admin_site.each_context(request)
+        context.update({
+            'title':         str(tarefa),
+            'tarefa':        tarefa,
+            'nome_download': nome_download(tarefa),
+            'status_url':    reverse('admin:despesas_tarefa_status_json', args=[pk]),
+            'download_url':  reverse('admin:despesas_tarefa_download', args=[pk]),
+        })
+        return TemplateResponse(request, "admin/despesas/tarefa_status.html", context)
+
+    def status_json_view(self, request, pk):
+        tarefa = self._tarefa(request, pk)
+        return JsonResponse({
+            'status':         tarefa.status,
+            'status_display': tarefa.get_status_display(),
+            'progresso':      tarefa.progresso,
+            'finalizada':     tarefa.finalizada,
+            'erro':           tarefa.erro,
+        })
 
-@admin.register(LogAlteracao)
-class LogAlteracaoAdmin(admin.ModelAdmin):
-    list_display = ('usuario','modelo','objeto_id','acao','valor','criado_em')
-    readonly_fields = ('usuario','modelo','objeto_id','acao','descricao','despesa','valor','criado_em')
+    def download_view(self, request, pk):
+        tarefa = self._tarefa(request, pk, status=Tarefa.CONCLUIDA)
+        caminho = caminho_arquivo(tarefa)
+        if caminho is None or not caminho.exists():
+            raise Http404("Arquivo da tarefa não encontrado.")
+        return FileResponse(open(caminho, 'rb'), as_attachment=True,
+                            filename=nome_download(tarefa))
@@ -11,6 +11,9 @@ class DespesasConfig(AppConfig):
     name = 'despesas'
 
     def ready(self):
+        # receptores de sinais (Fundo de Reserva, energia, consumo mensal)
+        from . import signals  # noqa: F401
+
         # garante que a pasta exista
         settings.PARAMETROS_AGUA_JSON.parent.mkdir(parents=True, exist_ok=True)
         settings.PARAMETROS_GAS_JSON .parent.mkdir(parents=True, exist_ok=True)
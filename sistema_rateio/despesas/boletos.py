@@ -0,0 +1,488 @@
+"""
+Geração dos boletos mensais: um PDF por unidade, empacotados num ZIP.
+
+Os contextos de cada unidade são montados no processo principal (que tem
+acesso ao banco); a renderização dos PDFs com o WeasyPrint pode ser
+distribuída entre processos filhos (ver ``BOLETOS_WORKERS`` no settings).
+
+O WeasyPrint fica em ``renderizacao`` e só é importado quando um boleto é
+de fato renderizado.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, Q, Sum
+
+from . import cache_boletos, pool_boletos
+from .models import (
+    Unidade,
+    TipoDespesa,
+    Despesa,
+    Rateio,
+    ConsumoMensal,
+    FracaoPorTipoDespesa,
+)
+
+BOLETO_TEMPLATE       = "boletos/boleto.html"
+BOLETO_CORPO_TEMPLATE = "boletos/_corpo_boleto.html"
+BOLETOS_MES_TEMPLATE  = "boletos/boletos_mes.html"
+BOLETO_CSS            = "boletos/boleto.css"
+
+BASE = [
+    'Reparos/Reforma',
+    'Reparo/Reforma (Sem a Sala)',
+    'Salário - Síndico',
+    'Elevador',
+    'Serviço - Faxina',
+    'Material Consumo (Sem Sala Comercial)',
+    'Material/Serviço de Consumo',
+    'Seguro 6x',
+    'Energia Áreas Comuns',
+    'Taxa Lixo',
+    'Água',
+    'Honorários Contábeis',
+]
+
+
+def nome_arquivo_boleto(unidade, mes, ano):
+    return f"boleto_{unidade.nome}_{mes:02d}-{ano}.pdf"
+
+
+def nome_arquivo_zip(mes, ano):
+    return f"boletos_{mes:02d}-{ano}.zip"
+
+
+def nome_arquivo_pdf_unico(mes, ano):
+    return f"boletos_{mes:02d}-{ano}.pdf"
+
+
+def carregar_razao_mensal(mes, ano, unidade_id=None):
+    """
+    Carrega de uma vez tudo o que os boletos do mês precisam e devolve um
+    dicionário ``{unidade.id: contexto}`` (em ordem de nome da unidade).
+
+    O número de consultas é fixo, independente da quantidade de unidades e
+    de tipos de despesa. Com ``unidade_id`` só o contexto dessa unidade é
+    montado.
+    """
+    # 1) soma as despesas-base e calcula 10%
+    soma = Despesa.objects.filter(
+        tipo__nome__in=BASE,
+        mes=str(mes),
+        ano=ano
+    ).aggregate(total=Sum('valor_total'))['total'] or Decimal('0')
+    valor_fundo_total = (soma * Decimal('0.1')).quantize(Decimal('0.01'))
+
+    # 2) mapa de frações normalizadas (0–1) para o Fundo de Reserva
+    frac_qs = FracaoPorTipoDespesa.objects.filter(
+        tipo_despesa__nome__iexact='Fundo de Reserva'
+    )
+    frac_map = {
+        unid: (Decimal(pct) / Decimal('100'))
+        if Decimal(pct) > 1 else Decimal(pct)
+        for unid, pct in frac_qs.values_list('unidade_id', 'percentual')
+    }
+
+    # 3) identifica a Sala e calcula metade da sua cota
+    try:
+        sala_id = frac_qs.get(unidade__nome__icontains='Sala').unidade_id
+        share_sala = (valor_fundo_total * frac_map[sala_id] / Decimal('2')).quantize(Decimal('0.01'))
+    except FracaoPorTipoDespesa.DoesNotExist:
+        sala_id = None
+        share_sala = Decimal('0')
+
+    # 4) restante após a sala e valor do Fundo para cada unidade
+    restante_fundo = (valor_fundo_total - share_sala).quantize(Decimal('0.01'))
+    valores_fundo = {}
+    if sala_id is not None:
+        valores_fundo[sala_id] = share_sala
+    for unid, pct in frac_map.items():
+        if unid == sala_id:
+            continue
+        valores_fundo[unid] = (restante_fundo * pct).quantize(Decimal('0.01'))
+
+    tipos = list(
+        TipoDespesa.objects
+        .exclude(nome__iexact='Fundo de Reserva')
+        .exclude(nome__iexact='Fatura Energia Elétrica')
+        .order_by('nome')
+        .values_list('id', 'nome')
+    )
+
+    # 5) despesa mais recente de cada tipo no mês
+    despesas_mes = (
+        Despesa.objects
+        .filter(mes=str(mes), ano=ano, valor_total__gt=0)
+        .annotate(eh_agua=ExpressionWrapper(Q(tipo__nome__iexact='Água'),
+                                            output_field=BooleanField()))
+        .order_by('-id')
+        .values_list('id', 'tipo_id', 'eh_agua')
+    )
+    despesa_por_tipo = {}
+    existe_despesa_agua = False
+    for desp_id, tipo_id, eh_agua in despesas_mes:
+        despesa_por_tipo.setdefault(tipo_id, desp_id)
+        existe_despesa_agua = existe_despesa_agua or bool(eh_agua)
+
+    # 6) rateios dessas despesas + rateios de gás do mês (o primeiro de cada
+    #    par despesa/unidade, como no .first())
+    rateios = (
+        Rateio.objects
+        .filter(
+            Q(despesa_id__in=list(despesa_por_tipo.values()))
+            | Q(despesa__tipo__nome__iexact='Gás',
+                despesa__mes=str(mes),
+                despesa__ano=ano)
+        )
+        .annotate(eh_gas=ExpressionWrapper(Q(despesa__tipo__nome__iexact='Gás'),
+                                           output_field=BooleanField()))
+        .order_by('id')
+        .values_list('despesa_id', 'unidade_id', 'valor', 'eh_gas')
+    )
+    if unidade_id is not None:
+        rateios = rateios.filter(unidade_id=unidade_id)
+    valor_rateio = {}
+    rateio_gas = {}
+    for desp_id, unid, valor, eh_gas in rateios:
+        valor_rateio.setdefault((desp_id, unid), valor)
+        if eh_gas:
+            rateio_gas.setdefault(unid, valor)
+
+    # 7) consumo do mês, já calculado em ConsumoMensal; gás e água numa
+    #    consulta só (água só se houver despesa de água)
+    tipos_consumo = [ConsumoMensal.GAS]
+    if existe_despesa_agua:
+        tipos_consumo.append(ConsumoMensal.AGUA)
+    consumos_qs = ConsumoMensal.objects.filter(mes=mes, ano=ano, tipo__in=tipos_consumo)
+    if unidade_id is not None:
+        consumos_qs = consumos_qs.filter(unidade_id=unidade_id)
+    consumos = {ConsumoMensal.GAS: {}, ConsumoMensal.AGUA: {}}
+    for tipo, unid, valor in consumos_qs.values_list('tipo', 'unidade_id', 'consumo'):
+        # consumo zero fica 0, como sempre foi no boleto
+        consumos[tipo][unid] = valor if valor > 0 else 0
+    consumo_gas_mes, consumo_agua_mes = consumos[ConsumoMensal.GAS], consumos[ConsumoMensal.AGUA]
+
+    # 8) um contexto por unidade
+    razao = {}
+    unidades = Unidade.objects.order_by('nome')
+    if unidade_id is not None:
+        unidades = unidades.filter(pk=unidade_id)
+    for unidade in unidades:
+        lancamentos = []
+        for tipo_id, tipo_nome in tipos:
+            desp_id = despesa_por_tipo.get(tipo_id)
+            if desp_id is not None:
+                valor = valor_rateio.get((desp_id, unidade.id), Decimal('0.00'))
+            else:
+                # não existe despesa cadastrada: exibe “–”
+                valor = None
+            lancamentos.append({
+                'descricao': tipo_nome,
+                'valor':     valor,
+            })
+
+        # por fim, insere o Fundo de Reserva
+        valor_fundo_un = valores_fundo.get(unidade.id, Decimal('0'))
+        if valor_fundo_un > 0:
+            lancamentos.append({
+                'descricao': 'Fundo de Reserva',
+                'valor':     valor_fundo_un,
+            })
+
+        # 8.1) consumo de gás
+        valor_gas = rateio_gas.get(unidade.id)
+        if valor_gas is not None and valor_gas > Decimal('0'):
+            consumo_gas = consumo_gas_mes.get(unidade.id, 0)
+        else:
+            consumo_gas = 0
+
+        # 8.2) consumo de água
+        if existe_despesa_agua:
+            consumo_agua = consumo_agua_mes.get(unidade.id, 0)
+        else:
+            consumo_agua = None
+
+        # 8.3) soma final
+        total_boleto = sum(
+            item['valor'] if item['valor'] is not None else Decimal('0.00')
+            for item in lancamentos
+        )
+        razao[unidade.id] = {
+            'unidade':           unidade,
+            'mes':               mes,
+            'ano':               ano,
+            'lancamentos':       lancamentos,
+            'total':             total_boleto,
+            'gas_consumption':   consumo_gas,
+            'water_consumption': consumo_agua,
+        }
+
+    return razao
+
+
+def montar_contextos(mes, ano):
+    """
+    Devolve a lista de contextos (um por unidade, em ordem de nome) usados
+    para renderizar o template do boleto.
+    """
+    return list(carregar_razao_mensal(mes, ano).values())
+
+
+def base_url_boletos():
+    return f"file://{settings.STATIC_ROOT}/"
+
+
+def renderizar_boleto(contexto):
+    """Renderiza o boleto de uma unidade e devolve os bytes do PDF."""
+    from .renderizacao import RenderizadorBoletos
+    return RenderizadorBoletos()(contexto)
+
+
+def _renderizar(contextos, workers):
+    if workers <= 1 or len(contextos) <= 1:
+        from .renderizacao import RenderizadorBoletos
+        renderizador = RenderizadorBoletos()
+        for contexto in contextos:
+            yield renderizador(contexto)
+        return
+
+    # "spawn" evita herdar do servidor web conexões abertas e threads
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=pool_boletos.iniciar) as pool:
+        pendentes = deque()
+        for contexto in contextos:
+            pendentes.append(pool.submit(pool_boletos.renderizar, contexto))
+            if len(pendentes) >= 2 * workers:
+                yield pendentes.popleft().result()
+        while pendentes:
+            yield pendentes.popleft().result()
+
+
+def versao_boleto():
+    return cache_boletos.versao_boleto(BOLETO_TEMPLATE, BOLETO_CORPO_TEMPLATE, BOLETO_CSS)
+
+
+def boleto_da_unidade(unidade_id, mes, ano):
+    """
+    Devolve ``(contexto, chave)`` do boleto de uma unidade, sem renderizar.
+    A chave é o hash do conteúdo (a mesma usada no cache de PDFs).
+    """
+    contexto = carregar_razao_mensal(mes, ano, unidade_id=unidade_id).get(unidade_id)
+    if contexto is None:
+        return None, None
+    return contexto, cache_boletos.chave_boleto(contexto, versao_boleto())
+
+
+def pdf_da_unidade(contexto, chave):
+    """PDF do boleto de uma unidade, vindo do cache quando possível."""
+    if not cache_boletos.ativo():
+        return renderizar_boleto(contexto)
+    pdf = cache_boletos.ler(chave)
+    if pdf is None:
+        pdf = renderizar_boleto(contexto)
+        cache_boletos.gravar(chave, pdf)
+        cache_boletos.podar()
+    return pdf
+
+
+def renderizar_boletos(contextos, workers=None):
+    """
+    Gera os PDFs dos contextos, na mesma ordem em que foram recebidos.
+
+    Com ``workers`` > 1 a renderização é feita num pool de processos; no
+    máximo ``2 * workers`` PDFs ficam pendentes na memória ao mesmo tempo.
+    Com o cache ligado, só são renderizadas as unidades cujo boleto mudou;
+    as demais vêm do disco.
+    """
+    if workers is None:
+        workers = getattr(settings, 'BOLETOS_WORKERS', 1)
+
+    if not cache_boletos.ativo():
+        yield from _renderizar(contextos, workers)
+        return
+
+    versao = versao_boleto()
+    chaves = [cache_boletos.chave_boleto(c, versao) for c in contextos]
+    faltando = {i for i, chave in enumerate(chaves) if not cache_boletos.existe(chave)}
+    novos = _renderizar([contextos[i] for i in sorted(faltando)], workers)
+
+    for i, (contexto, chave) in enumerate(zip(contextos, chaves)):
+        pdf = None if i in faltando else cache_boletos.ler(chave)
+        if pdf is None:
+            # não estava no cache (ou foi podado desde a verificação acima)
+            pdf = next(novos) if i in faltando else renderizar_boleto(contexto)
+            cache_boletos.gravar(chave, pdf)
+        yield pdf
+
+    cache_boletos.podar()
+
+
+def pdf_unico(contextos, mes, ano):
+    """PDF único com os boletos dos ``contextos`` já montados, um por página."""
+    from .renderizacao import RenderizadorBoletos
+    return RenderizadorBoletos()(
+        {'boletos': contextos, 'mes': mes, 'ano': ano},
+        template=BOLETOS_MES_TEMPLATE,
+    )
+
+
+def gerar_pdf_unico(mes, ano):
+    """
+    Devolve um único PDF com os boletos de todas as unidades, um por
+    página, renderizado num só documento (uma única passada de layout).
+    """
+    return pdf_unico(montar_contextos(mes, ano), mes, ano)
+
+
+# métodos de compressão oferecidos no formulário de geração
+COMPRESSOES = {
+    'stored':   zipfile.ZIP_STORED,
+    'deflated': zipfile.ZIP_DEFLATED,
+    'bzip2':    zipfile.ZIP_BZIP2,
+    'lzma':     zipfile.ZIP_LZMA,
+}
+
+
+def zip_info(nome, mes, ano, compress_type=zipfile.ZIP_STORED):
+    """
+    Entrada de ZIP com data fixa (1º dia do mês de referência), para que o
+    arquivo gerado seja idêntico entre execuções e entre os modos
+    sequencial e paralelo.
+    """
+    info = zipfile.ZipInfo(nome, date_time=(ano, mes, 1, 0, 0, 0))
+    info.compress_type = compress_type
+    info.external_attr = 0o600 << 16
+    return info
+
+
+def _entradas(contextos, mes, ano, workers):
+    pdfs = renderizar_boletos(contextos, workers=workers)
+    for contexto, pdf in zip(contextos, pdfs):
+        yield nome_arquivo_boleto(contexto['unidade'], mes, ano), pdf
+
+
+def escrever_zip(destino, contextos, mes, ano, workers=None,
+                 compressao=zipfile.ZIP_STORED, nivel=None, progresso=None):
+    """
+    Grava em ``destino`` (caminho ou arquivo aberto) o ZIP com os boletos
+    dos ``contextos`` já montados.
+
+    ``progresso``, se informado, é chamado com ``(feitos, total)`` a cada
+    PDF adicionado.
+    """
+    with zipfile.ZipFile(destino, 'w') as zf:
+        for i, (nome, pdf) in enumerate(_entradas(contextos, mes, ano, workers), 1):
+            zf.writestr(zip_info(nome, mes, ano, compressao), pdf,
+                        compresslevel=nivel)
+            if progresso:
+                progresso(i, len(contextos))
+
+
+def assinatura_do_mes(contextos, formato='zip', compressao=zipfile.ZIP_STORED):
+    """
+    Hash de tudo o que vai no arquivo do mês: as chaves de conteúdo de cada
+    boleto (as mesmas do cache de PDFs), o formato e a compressão. Se não
+    mudou, o arquivo gerado da última vez continua valendo.
+    """
+    if formato == 'pdf':
+        versao = cache_boletos.versao_boleto(
+            BOLETOS_MES_TEMPLATE, BOLETO_CORPO_TEMPLATE, BOLETO_CSS)
+    else:
+        versao = versao_boleto()
+    h = hashlib.sha256(f"{formato}:{compressao}".encode())
+    for contexto in contextos:
+        h.update(cache_boletos.chave_boleto(contexto, versao).encode())
+    return h.hexdigest()
+
+
+def gravar_arquivo_do_mes(destino, contextos, mes, ano, formato='zip',
+                          workers=None, compressao=zipfile.ZIP_STORED, nivel=None):
+    """
+    Grava em ``destino`` o ZIP (ou o PDF único) do mês. O arquivo é escrito
+    ao lado com outro nome e só então renomeado, para nunca deixar um
+    arquivo pela metade no lugar do anterior.
+    """
+    destino = Path(destino)
+    temporario = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+    try:
+        if formato == 'pdf':
+            temporario.write_bytes(pdf_unico(contextos, mes, ano))
+        else:
+            escrever_zip(temporario, contextos, mes, ano, workers=workers,
+                         compressao=compressao, nivel=nivel)
+        os.replace(temporario, destino)
+    finally:
+        temporario.unlink(missing_ok=True)
+    return destino
+
+
+def gerar_zip_de_boletos(mes, ano, workers=None,
+                         compressao=zipfile.ZIP_STORED, nivel=None,
+                         progresso=None):
+    """Devolve os bytes do ZIP com os boletos de todas as unidades."""
+    contextos = montar_contextos(mes, ano)
+
+    buffer = io.BytesIO()
+    escrever_zip(buffer, contextos, mes, ano, workers=workers,
+                 compressao=compressao, nivel=nivel, progresso=progresso)
+    return buffer.getvalue()
+
+
+class _SaidaZip(io.RawIOBase):
+    """
+    Destino sem ``seek`` para o ZipFile: guarda o que foi escrito até ser
+    drenado. Sem ``seek`` o zipfile grava cada entrada com data descriptor,
+    sem precisar voltar ao cabeçalho local.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def drenar(self):
+        dados = b''.join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def iterar_zip_de_boletos(mes, ano, workers=None,
+                          compressao=zipfile.ZIP_STORED, nivel=None):
+    """
+    Versão em streaming de ``gerar_zip_de_boletos``: os dados do mês são
+    carregados já na chamada e o iterador devolvido entrega o cabeçalho e o
+    conteúdo de cada PDF assim que ele fica pronto, terminando com o
+    diretório central do ZIP.
+    """
+    contextos = montar_contextos(mes, ano)
+
+    def partes():
+        saida = _SaidaZip()
+        with zipfile.ZipFile(saida, 'w') as zf:
+            for nome, pdf in _entradas(contextos, mes, ano, workers):
+                zf.writestr(zip_info(nome, mes, ano, compressao), pdf,
+                            compresslevel=nivel)
+                yield saida.drenar()
+        yield saida.drenar()
+
+    return partes()
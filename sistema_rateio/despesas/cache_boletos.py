@@ -0,0 +1,159 @@
+"""
+Cache em disco dos PDFs de boleto, endereçado pelo conteúdo.
+
+A chave de cada PDF é o hash de tudo o que aparece nele (dados da unidade
+no mês + versão do template e das imagens). Se nada mudou para a unidade,
+o PDF gravado é reaproveitado em vez de renderizado de novo. O tamanho
+total é limitado por ``BOLETOS_CACHE_MAX_BYTES``; ao passar do limite os
+arquivos usados há mais tempo são apagados.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+
+def limite_bytes():
+    return getattr(settings, 'BOLETOS_CACHE_MAX_BYTES', 0)
+
+
+def ativo():
+    return limite_bytes() > 0
+
+
+def pasta_cache():
+    pasta = Path(getattr(settings, 'BOLETOS_CACHE_DIR', settings.DATA_DIR / 'cache_boletos'))
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta
+
+
+def _arquivos(pasta):
+    pasta = Path(pasta)
+    if not pasta.is_dir():
+        return []
+    return sorted(p for p in pasta.rglob('*') if p.is_file())
+
+
+def _estado(caminho):
+    try:
+        st = os.stat(caminho)
+    except (OSError, TypeError):
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+# {templates: (assinatura, versão)}: a versão calculada por este processo
+_versoes = {}
+
+
+def versao_boleto(*templates):
+    """
+    Hash dos templates do boleto (HTML e CSS) e das imagens em
+    ``STATIC_ROOT/img`` (de onde o WeasyPrint as lê). Muda sempre que o
+    layout muda.
+
+    Fica guardado no processo enquanto tamanho e mtime desses arquivos não
+    mudam: a cada pedido só se faz ``stat``, sem reler nem refazer o hash.
+    """
+    img = Path(settings.STATIC_ROOT) / 'img'
+    fontes = [(nome, get_template(nome).origin.name) for nome in templates]
+    imagens = _arquivos(img)
+    assinatura = (
+        tuple((nome, origem, _estado(origem)) for nome, origem in fontes),
+        tuple((str(arq), _estado(arq)) for arq in imagens),
+    )
+    guardada = _versoes.get(templates)
+    if guardada is not None and guardada[0] == assinatura:
+        return guardada[1]
+
+    h = hashlib.sha256()
+    for nome, _ in fontes:
+        h.update(get_template(nome).template.source.encode())
+    for arq in imagens:
+        h.update(str(arq.relative_to(img)).encode())
+        h.update(arq.read_bytes())
+    versao = h.hexdigest()
+    _versoes[templates] = (assinatura, versao)
+    return versao
+
+
+def chave_boleto(contexto, versao):
+    """Hash do que o boleto exibe para a unidade (inclui nome, mês e ano)."""
+    dados = {
+        'versao':            versao,
+        'unidade':           contexto['unidade'].nome,
+        'mes':               contexto['mes'],
+        'ano':               contexto['ano'],
+        'lancamentos':       contexto['lancamentos'],
+        'total':             contexto['total'],
+        'gas_consumption':   contexto['gas_consumption'],
+        'water_consumption': contexto['water_consumption'],
+    }
+    serial = json.dumps(dados, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serial.encode()).hexdigest()
+
+
+def _caminho(chave):
+    return pasta_cache() / chave[:2] / f"{chave}.pdf"
+
+
+def existe(chave):
+    return _caminho(chave).exists()
+
+
+def ler(chave):
+    """
+    Devolve os bytes do PDF em cache (ou ``None``) e o marca como usado.
+
+    O uso fica no atime, que é o que ``podar`` usa para o LRU.
+    """
+    caminho = _caminho(chave)
+    try:
+        pdf = caminho.read_bytes()
+        os.utime(caminho, (time.time(), caminho.stat().st_mtime))
+    except FileNotFoundError:
+        return None
+    return pdf
+
+
+def gravar(chave, pdf):
+    caminho = _caminho(chave)
+    caminho.parent.mkdir(exist_ok=True)
+    temporario = caminho.with_name(f"{caminho.name}.{os.getpid()}.tmp")
+    temporario.write_bytes(pdf)
+    os.replace(temporario, caminho)
+
+
+def podar(limite=None):
+    """
+    Apaga os PDFs usados há mais tempo até o cache caber em ``limite``
+    bytes. Devolve quantos arquivos foram removidos.
+    """
+    if limite is None:
+        limite = limite_bytes()
+
+    arquivos = []
+    total = 0
+    for caminho in pasta_cache().glob('*/*.pdf'):
+        try:
+            st = caminho.stat()
+        except FileNotFoundError:
+            continue
+        arquivos.append((st.st_atime, st.st_size, caminho))
+        total += st.st_size
+
+    removidos = 0
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= limite:
+            break
+        try:
+            caminho.unlink()
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+        removidos += 1
+    return removidos
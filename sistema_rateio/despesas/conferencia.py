@@ -0,0 +1,203 @@
+"""
+Conferência das exportações com arquivos de referência ("golden master").
+
+``popular_dados_referencia`` cria sempre os mesmos dados (unidades, tipos,
+despesas, rateios e leituras de vários meses). ``capturar`` gera a partir
+deles as planilhas XLSX (cada célula de cada aba, como está no arquivo) e
+os lançamentos e totais do boleto de cada unidade. O resultado é comparado
+com os JSON de ``despesas/referencia/``: qualquer otimização da exportação
+ou dos boletos tem de reproduzi-los exatamente.
+
+A referência é a saída da versão anterior às otimizações (``REVISAO_BASE``):
+``capturar_da_base`` extrai essa versão do git, copia para ela
+``conferencia_dados`` (que não depende do código conferido) e gera lá os
+mesmos arquivos. Use pelo comando ``conferir_referencia`` (que roda num
+banco de teste; ``--base`` confere também a versão de base e ``--gravar``
+regrava a partir dela) ou pelo teste correspondente em ``tests.py``.
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .boletos import montar_contextos
+from .conferencia_dados import ANO, MESES, celulas_xlsx, resumo_boleto
+from .conferencia_dados import popular_dados_referencia as _popular
+from .consumo import reconstruir
+from .exportacao import escrever_xlsx, escrever_xlsx_periodo
+
+PASTA_REFERENCIA = Path(__file__).resolve().parent / 'referencia'
+ARQUIVO_TEMPOS = 'tempos.json'
+# versão anterior às otimizações: a referência é a saída dela
+REVISAO_BASE = '2e711eb'
+
+
+def popular_dados_referencia(semente=2025):
+    """Os dados fixos de ``conferencia_dados`` e o consumo mensal deles."""
+    _popular(semente)
+    # bulk_create não passa pelos sinais que mantêm o consumo mensal
+    reconstruir()
+
+
+# --- captura ----------------------------------------------------------------
+
+def lancamentos_boletos(mes, ano):
+    """Lançamentos, total e consumos do boleto de cada unidade no mês."""
+    return [resumo_boleto(c) for c in montar_contextos(mes, ano)]
+
+
+def _xlsx(escrever, *args):
+    buffer = io.BytesIO()
+    escrever(buffer, *args, diagnostico=False)
+    return celulas_xlsx(buffer.getvalue())
+
+
+def capturar(ano=ANO, meses=MESES):
+    """
+    Gera tudo o que é conferido e devolve ``(dados, tempos)``: ``dados`` é
+    ``{nome do arquivo de referência: conteúdo}`` e ``tempos`` o tempo, em
+    segundos, de cada geração.
+    """
+    dados, tempos = {}, {}
+
+    def medir(nome, gerar, *args):
+        inicio = time.perf_counter()
+        dados[f'{nome}.json'] = gerar(*args)
+        tempos[nome] = round(time.perf_counter() - inicio, 4)
+
+    for mes in meses:
+        medir(f'xlsx_{mes:02d}-{ano}', _xlsx, escrever_xlsx, mes, ano)
+        medir(f'boletos_{mes:02d}-{ano}', lancamentos_boletos, mes, ano)
+    medir(f'xlsx_{meses[0]:02d}-{meses[-1]:02d}_{ano}', _xlsx, escrever_xlsx_periodo, ano, meses)
+    return dados, tempos
+
+
+_CAPTURA_NA_BASE = """
+import json, sys, django
+django.setup()
+from django.core.management import call_command
+call_command('migrate', run_syncdb=True, verbosity=0)
+from despesas.conferencia_dados import capturar_versao_base, popular_dados_referencia
+popular_dados_referencia()
+with open(sys.argv[1], 'w', encoding='utf-8') as f:
+    json.dump(capturar_versao_base(), f)
+"""
+
+
+def capturar_da_base(revisao=REVISAO_BASE):
+    """
+    ``dados`` (como em ``capturar``) gerados pela versão ``revisao`` do
+    projeto: ela é extraída do git numa pasta temporária, recebe uma cópia
+    de ``conferencia_dados`` e roda a captura num processo à parte, com
+    banco em memória. As tabelas saem direto dos modelos, porque as
+    migrações de uma versão antiga podem não bater com eles.
+    """
+    projeto = Path(settings.BASE_DIR)
+    with tempfile.TemporaryDirectory() as pasta:
+        pasta = Path(pasta)
+        raiz, prefixo = subprocess.run(
+            ['git', 'rev-parse', '--show-toplevel', '--show-prefix'],
+            cwd=projeto, capture_output=True, text=True, check=True,
+        ).stdout.split('\n')[:2]
+        arquivo = subprocess.run(['git', 'archive', '--format=tar', f'{revisao}:{prefixo}'],
+                                 cwd=raiz, capture_output=True, check=True).stdout
+        with tarfile.open(fileobj=io.BytesIO(arquivo)) as tar:
+            tar.extractall(pasta)
+        shutil.copy(Path(__file__).with_name('conferencia_dados.py'), pasta / 'despesas')
+        (pasta / 'conferencia_settings.py').write_text(
+            f"from {settings.SETTINGS_MODULE} import *\n"
+            "DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}\n"
+            "MIGRATION_MODULES = {'despesas': None}\n",
+            encoding='utf-8',
+        )
+        resultado = pasta / 'captura.json'
+        saida = subprocess.run(
+            [sys.executable, '-c', _CAPTURA_NA_BASE, str(resultado)],
+            cwd=pasta, capture_output=True, text=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'conferencia_settings'},
+        )
+        if saida.returncode:
+            raise RuntimeError(f"Captura na versão {revisao} falhou:\n{saida.stderr}")
+        return json.loads(resultado.read_text(encoding='utf-8'))
+
+
+def com_base(dados, base):
+    """
+    ``dados`` com o conteúdo de ``base`` no lugar, aba por aba nas planilhas:
+    o que não existia na versão de base (a aba RESUMO da planilha de vários
+    meses) continua vindo de ``dados``.
+    """
+    resultado = {}
+    for nome, conteudo in dados.items():
+        original = base.get(nome, conteudo)
+        if isinstance(conteudo, dict):
+            original = {aba: original.get(aba, valor) for aba, valor in conteudo.items()}
+        resultado[nome] = original
+    return resultado
+
+
+# --- comparação ------------------------------------------------------------
+
+def _serializar(conteudo):
+    return json.dumps(conteudo, ensure_ascii=False, indent=1) + '\n'
+
+
+def gravar_referencia(dados, tempos, pasta=PASTA_REFERENCIA):
+    pasta.mkdir(parents=True, exist_ok=True)
+    for nome, conteudo in dados.items():
+        (pasta / nome).write_text(_serializar(conteudo), encoding='utf-8')
+    (pasta / ARQUIVO_TEMPOS).write_text(_serializar(tempos), encoding='utf-8')
+
+
+def ler_tempos(pasta=PASTA_REFERENCIA):
+    try:
+        return json.loads((pasta / ARQUIVO_TEMPOS).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {}
+
+
+def _diferencas(esperado, obtido, caminho):
+    if isinstance(esperado, dict) and isinstance(obtido, dict):
+        for chave in esperado.keys() | obtido.keys():
+            if chave not in obtido:
+                yield f"{caminho}/{chave}: faltando"
+            elif chave not in esperado:
+                yield f"{caminho}/{chave}: a mais"
+            else:
+                yield from _diferencas(esperado[chave], obtido[chave], f"{caminho}/{chave}")
+    elif isinstance(esperado, list) and isinstance(obtido, list):
+        for i, (e, o) in enumerate(zip(esperado, obtido)):
+            yield from _diferencas(e, o, f"{caminho}[{i}]")
+        if len(esperado) != len(obtido):
+            yield f"{caminho}: {len(esperado)} itens na referência, {len(obtido)} agora"
+    elif esperado != obtido:
+        yield f"{caminho}: esperado {esperado!r}, obtido {obtido!r}"
+
+
+def comparar(dados, pasta=PASTA_REFERENCIA, so_abas_presentes=False):
+    """
+    Lista (vazia se tudo bate) das diferenças entre ``dados`` e a referência.
+    Com ``so_abas_presentes`` as planilhas são conferidas só nas abas que
+    ``dados`` tem (para a captura da versão de base).
+    """
+    diferencas = []
+    for nome, conteudo in dados.items():
+        try:
+            esperado = json.loads((pasta / nome).read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            diferencas.append(f"{nome}: sem arquivo de referência")
+            continue
+        if so_abas_presentes and isinstance(esperado, dict):
+            esperado = {aba: valor for aba, valor in esperado.items() if aba in conteudo}
+        # passa pelo JSON para comparar nos mesmos tipos do arquivo
+        obtido = json.loads(_serializar(conteudo))
+        diferencas.extend(_diferencas(esperado, obtido, nome))
+    return diferencas
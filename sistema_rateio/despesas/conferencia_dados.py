@@ -0,0 +1,296 @@
+"""
+Parte da conferência ("golden master") que não depende do código conferido:
+os dados fixos, a leitura das células de um XLSX e a captura pela versão
+anterior às otimizações.
+
+Só usa modelos que já existiam nessa versão, para que o módulo possa ser
+copiado para ela e rodar lá (``conferir_referencia --base``): é assim que
+os arquivos de ``despesas/referencia/`` são gravados e conferidos contra a
+saída original.
+"""
+import io
+import random
+import zipfile
+from decimal import ROUND_DOWN, Decimal
+from xml.etree import ElementTree
+
+from .models import (
+    Unidade,
+    TipoDespesa,
+    Despesa,
+    Rateio,
+    LeituraGas,
+    LeituraAgua,
+    LeituraEnergia,
+    FracaoPorTipoDespesa,
+)
+
+ANO = 2025
+MESES = (1, 2, 3, 4)
+UNIDADES = ('101', '102', '103', '104', '201', '202', '203', '204', 'Sala 01')
+# tipos que entram na base do Fundo de Reserva; cópia fixa, para os dados não
+# mudarem junto com o código conferido
+BASE = [
+    'Reparos/Reforma',
+    'Reparo/Reforma (Sem a Sala)',
+    'Salário - Síndico',
+    'Elevador',
+    'Serviço - Faxina',
+    'Material Consumo (Sem Sala Comercial)',
+    'Material/Serviço de Consumo',
+    'Seguro 6x',
+    'Energia Áreas Comuns',
+    'Taxa Lixo',
+    'Água',
+    'Honorários Contábeis',
+]
+TIPOS = BASE + ['Gás', 'Energia Salão', 'Fatura Energia Elétrica', 'Fundo de Reserva']
+TIPOS_NF = ('Material/Serviço de Consumo', 'Reparos/Reforma')
+
+
+# --- dados ----------------------------------------------------------------
+
+def _centavos(rnd, minimo, maximo):
+    return Decimal(rnd.randint(minimo * 100, maximo * 100)) / 100
+
+
+def _dividir(valor, pesos):
+    """Divide ``valor`` proporcionalmente aos ``pesos``, fechando no centavo."""
+    total = sum(pesos.values())
+    partes = {
+        u: (valor * p / total).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+        for u, p in pesos.items()
+    }
+    primeira = next(iter(partes))
+    partes[primeira] += valor - sum(partes.values())
+    return partes
+
+
+def popular_dados_referencia(semente=2025):
+    """
+    Cria (com bulk_create, sem sinais) os dados fixos da conferência: 9
+    unidades, os tipos usados nos boletos e na planilha, despesas e rateios
+    de ``MESES`` e leituras desses meses e de dezembro do ano anterior.
+
+    Inclui de propósito alguns casos de borda: um tipo sem despesa num mês,
+    uma despesa repetida (e desativada), leituras faltando e notas fiscais.
+    """
+    rnd = random.Random(semente)
+    unidades = Unidade.objects.bulk_create([Unidade(nome=n) for n in UNIDADES])
+    sala = unidades[-1]
+    tipos = {
+        t.nome: t for t in
+        TipoDespesa.objects.bulk_create([TipoDespesa(nome=n) for n in TIPOS])
+    }
+    FracaoPorTipoDespesa.objects.bulk_create([
+        FracaoPorTipoDespesa(tipo_despesa=tipos['Fundo de Reserva'], unidade=u,
+                             percentual=Decimal('0.2') if u is sala else Decimal('0.1'))
+        for u in unidades
+    ])
+
+    # leituras: dezembro do ano anterior e os meses da conferência
+    periodos = [(12, ANO - 1)] + [(m, ANO) for m in MESES]
+    gas, agua, energia = [], [], []
+    for u in unidades:
+        leitura_gas = _centavos(rnd, 100, 900)
+        leitura_agua = _centavos(rnd, 500, 3000)
+        medidores = {1: _centavos(rnd, 1000, 9000), 2: _centavos(rnd, 1000, 9000)}
+        for mes, ano in periodos:
+            leitura_gas += _centavos(rnd, 0, 25)
+            leitura_agua += _centavos(rnd, 0, 40)
+            if not (u.nome == '103' and mes == 12):
+                gas.append(LeituraGas(unidade=u, mes=mes, ano=ano, leitura=leitura_gas))
+            if not (u.nome == '204' and mes == MESES[-1]):
+                agua.append(LeituraAgua(unidade=u, mes=mes, ano=ano, leitura=leitura_agua))
+            if u is sala:
+                for medidor in medidores:
+                    medidores[medidor] += _centavos(rnd, 50, 400)
+                    energia.append(LeituraEnergia(unidade=u, mes=mes, ano=ano, medidor=medidor,
+                                                  leitura=medidores[medidor]))
+    LeituraGas.objects.bulk_create(gas)
+    LeituraAgua.objects.bulk_create(agua)
+    LeituraEnergia.objects.bulk_create(energia)
+
+    for mes in MESES:
+        _popular_mes(rnd, mes, unidades, tipos)
+
+
+def _popular_mes(rnd, mes, unidades, tipos):
+    valores = {
+        nome: _centavos(rnd, 100, 5000)
+        for nome in TIPOS
+        # um tipo sem despesa no mês: no boleto aparece "–"
+        if nome != 'Fundo de Reserva' and not (mes == 3 and nome == 'Seguro 6x')
+    }
+    base = sum(v for n, v in valores.items() if n in BASE)
+    valores['Fundo de Reserva'] = (base * Decimal('0.1')).quantize(Decimal('0.01'))
+
+    # Fundo de Reserva primeiro e Água por último (a planilha lê os
+    # parâmetros da despesa mais recente do mês)
+    ordem = ['Fundo de Reserva'] + sorted(n for n in valores if n not in ('Fundo de Reserva', 'Água'))
+    if 'Água' in valores:
+        ordem.append('Água')
+
+    despesas = []
+    for nome in ordem:
+        valor = valores[nome]
+        extras = {}
+        if nome == 'Água':
+            m3 = _centavos(rnd, 50, 300)
+            extras['agua_leituras'] = {'params': {
+                'fatura': float(valor), 'm3_total': float(m3),
+                'valor_m3_agua': float((valor / m3).quantize(Decimal('0.01'))),
+            }}
+        elif nome == 'Gás':
+            extras['gas_leituras'] = {'params': {
+                'recarga': float(valor), 'kg': rnd.randint(20, 90),
+                'm3_kg': 0.4589, 'valor_m3': float(_centavos(rnd, 10, 30)),
+            }}
+        elif nome == 'Fatura Energia Elétrica':
+            extras['energia_leituras'] = {'params': {
+                'fatura': float(valor), 'kwh_total': rnd.randint(500, 3000),
+                'custo_kwh': float(_centavos(rnd, 0, 2)), 'uso_kwh': rnd.randint(50, 400),
+            }}
+        elif nome in TIPOS_NF:
+            extras['nf_info'] = [
+                {'fornecedor': f'Fornecedor {i}', 'historico': f'{nome} {mes:02d}/{ANO}',
+                 'numero': str(rnd.randint(1000, 9999)), 'tipo': rnd.choice(['com', 'sem']),
+                 'valor': float(_centavos(rnd, 10, 500))}
+                for i in range(rnd.randint(1, 3))
+            ]
+        despesas.append(Despesa(tipo=tipos[nome], mes=str(mes), ano=ANO,
+                                valor_total=valor, **extras))
+    if mes == 2:
+        # lançamento repetido e desativado: o boleto usa a despesa mais recente
+        despesas.append(Despesa(tipo=tipos['Elevador'], mes=str(mes), ano=ANO,
+                                valor_total=_centavos(rnd, 100, 5000), ativo=False))
+    despesas = Despesa.objects.bulk_create(despesas)
+
+    rateios = []
+    for despesa in despesas:
+        nome = despesa.tipo.nome
+        if nome == 'Fundo de Reserva':
+            pesos = {u: Decimal('2') if u.nome.startswith('Sala') else Decimal('1') for u in unidades}
+        else:
+            pesos = {
+                u: Decimal(rnd.randint(1, 5)) for u in unidades
+                if not (u.nome.startswith('Sala') and 'Sala' in nome)
+            }
+        for u, valor in _dividir(despesa.valor_total, pesos).items():
+            consumo = _centavos(rnd, 0, 20) if nome == 'Gás' else None
+            rateios.append(Rateio(despesa=despesa, unidade=u, valor=valor, consumo=consumo))
+    Rateio.objects.bulk_create(rateios)
+
+
+# --- leitura do XLSX ---------------------------------------------------------
+
+_NS = {'m': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+
+def _texto(elemento):
+    return ''.join(t.text or '' for t in elemento.iter(f"{{{_NS['m']}}}t"))
+
+
+def celulas_xlsx(conteudo):
+    """
+    ``{aba: [[célula, valor], ...]}`` de um XLSX, na ordem do arquivo.
+    Números como float, textos como str e fórmulas como "=FÓRMULA"
+    (o valor calculado não é guardado no arquivo).
+    """
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as z:
+        nomes = z.namelist()
+        compartilhadas = []
+        if 'xl/sharedStrings.xml' in nomes:
+            raiz = ElementTree.fromstring(z.read('xl/sharedStrings.xml'))
+            compartilhadas = [_texto(si) for si in raiz.findall('m:si', _NS)]
+        rels = ElementTree.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+        alvos = {r.get('Id'): r.get('Target') for r in rels}
+        livro = ElementTree.fromstring(z.read('xl/workbook.xml'))
+
+        abas = {}
+        for aba in livro.find('m:sheets', _NS):
+            raiz = ElementTree.fromstring(z.read('xl/' + alvos[aba.get(_NS_REL)]))
+            linhas = []
+            for c in raiz.iter(f"{{{_NS['m']}}}c"):
+                formula = c.find('m:f', _NS)
+                v = c.find('m:v', _NS)
+                tipo = c.get('t')
+                if formula is not None:
+                    valor = '=' + (formula.text or '')
+                elif tipo == 's':
+                    valor = compartilhadas[int(v.text)]
+                elif tipo == 'inlineStr':
+                    valor = _texto(c)
+                elif v is None:
+                    continue                    # só formatação
+                elif tipo == 'b':
+                    valor = v.text == '1'
+                elif tipo in ('str', 'e'):
+                    valor = v.text
+                else:
+                    valor = float(v.text)
+                linhas.append([c.get('r'), valor])
+            abas[aba.get('name')] = linhas
+    return abas
+
+
+def _numero(valor):
+    """Valor numérico como texto, sem depender de casas decimais (10.50 == 10.5)."""
+    if valor is None:
+        return None
+    return format(Decimal(valor).normalize(), 'f')
+
+
+
+def resumo_boleto(contexto):
+    """Lançamentos, total e consumos do boleto (contexto do template) de uma unidade."""
+    return {
+        'unidade':     contexto['unidade'].nome,
+        'lancamentos': [[l['descricao'], _numero(l['valor'])] for l in contexto['lancamentos']],
+        'total':       _numero(contexto['total']),
+        'gas':         _numero(contexto['gas_consumption']),
+        'agua':        _numero(contexto['water_consumption']),
+    }
+
+
+# --- versão de base ----------------------------------------------------------
+
+def capturar_versao_base(ano=ANO, meses=MESES):
+    """
+    O mesmo que ``conferencia.capturar`` (sem os tempos), mas pelas views da
+    versão de base, em que a planilha e os boletos eram montados dentro do
+    admin: a planilha vem da resposta da view e os boletos dos contextos
+    passados ao template. A planilha de vários meses ainda não existia; dela
+    só há as abas RATEIO, iguais às de cada mês.
+    """
+    from unittest import mock
+
+    from django.contrib import admin
+    from django.test import RequestFactory
+
+    from . import admin as admin_base
+    from .models import Boleto, ExportarXlsx
+
+    exportacao = admin.site._registry[ExportarXlsx]
+    boletos = admin.site._registry[Boleto]
+    dados = {}
+    periodo = {}
+    for mes in meses:
+        pedido = RequestFactory().get('/', {'mes': mes, 'ano': ano})
+        planilha = celulas_xlsx(exportacao.exportar_excel_view(pedido).content)
+        dados[f'xlsx_{mes:02d}-{ano}.json'] = planilha
+        periodo[f'RATEIO {mes:02d}-{ano}'] = planilha['RATEIO']
+
+        contextos = []
+        def guardar(template, contexto, *args, **kwargs):
+            contextos.append(contexto)
+            return ''
+        # nada de PDF: só importa o que iria para o template
+        sem_pdf = {'return_value.write_pdf.return_value': b''}
+        with mock.patch.object(admin_base, 'render_to_string', guardar), \
+                mock.patch.object(admin_base, 'HTML', **sem_pdf):
+            boletos._gerar_zip_de_boletos(mes, ano)
+        dados[f'boletos_{mes:02d}-{ano}.json'] = [resumo_boleto(c) for c in contextos]
+    dados[f'xlsx_{meses[0]:02d}-{meses[-1]:02d}_{ano}.json'] = periodo
+    return dados
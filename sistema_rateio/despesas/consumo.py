@@ -0,0 +1,171 @@
+"""
+Consumo mensal (leitura atual − leitura do mês anterior) guardado na tabela
+``ConsumoMensal``.
+
+Cada leitura gravada ou apagada muda duas linhas: a do próprio mês (é a
+leitura atual) e a do mês seguinte (é a anterior). ``atualizar`` refaz só
+essas duas, ``atualizar_varios`` as de muitas leituras de uma vez (importação
+de CSV) e ``reconstruir`` a tabela inteira a partir das leituras (comando
+``recalcular_consumo``). Quem precisa do consumo de um mês lê tudo
+numa consulta com ``do_mes``.
+"""
+from decimal import Decimal
+
+from django.apps import apps as apps_globais
+from django.db import transaction
+
+from .models import ConsumoMensal, Leitura
+from .periodo import Periodo
+
+
+def mes_anterior(mes, ano):
+    anterior = Periodo(mes, ano).anterior()
+    return anterior.mes, anterior.ano
+
+
+def mes_seguinte(mes, ano):
+    seguinte = Periodo(mes, ano).seguinte()
+    return seguinte.mes, seguinte.ano
+
+
+def calcular(anterior, atual):
+    """Consumo do mês: nunca negativo; sem leitura anterior, a própria atual."""
+    if atual is None:
+        return Decimal('0')
+    if anterior is None:
+        return atual
+    return max(atual - anterior, Decimal('0'))
+
+
+def chave_da_leitura(leitura):
+    """``(tipo, unidade_id, medidor, mes, ano)`` da linha em que ``leitura`` é a atual."""
+    return (leitura.tipo, leitura.unidade_id, leitura.medidor, leitura.mes, leitura.ano)
+
+
+def atualizar(tipo, unidade_id, medidor, mes, ano):
+    """Refaz as linhas de ``mes``/``ano`` e do mês seguinte do medidor da unidade."""
+    seguinte = mes_seguinte(mes, ano)
+    periodo = Periodo(mes, ano)
+    leituras_qs = Leitura.objects.filter(
+        tipo=tipo, unidade_id=unidade_id, medidor=medidor,
+        periodo__range=(periodo.anterior(), periodo.seguinte()),
+    )
+    leituras = {}
+    for m, a, leitura in leituras_qs.order_by('id').values_list('mes', 'ano', 'leitura'):
+        leituras.setdefault((m, a), leitura)
+
+    with transaction.atomic():
+        for m, a in ((mes, ano), seguinte):
+            anterior = leituras.get(mes_anterior(m, a))
+            atual = leituras.get((m, a))
+            chave = dict(tipo=tipo, unidade_id=unidade_id, medidor=medidor, mes=m, ano=a)
+            if anterior is None and atual is None:
+                ConsumoMensal.objects.filter(**chave).delete()
+                continue
+            ConsumoMensal.objects.update_or_create(**chave, defaults={
+                'leitura_anterior': anterior,
+                'leitura_atual':    atual,
+                'consumo':          calcular(anterior, atual),
+            })
+
+
+def _com_mes_seguinte(chaves):
+    # cada leitura é a atual do seu mês e a anterior do mês seguinte
+    linhas = set()
+    for tipo, unidade_id, medidor, m, a in chaves:
+        linhas.add((tipo, unidade_id, medidor, m, a))
+        linhas.add((tipo, unidade_id, medidor, *mes_seguinte(m, a)))
+    return linhas
+
+
+def _linhas_de_consumo(Consumo, leituras, chaves):
+    linhas = []
+    for tipo, unidade_id, medidor, m, a in sorted(chaves):
+        anterior = leituras.get((tipo, unidade_id, medidor, *mes_anterior(m, a)))
+        atual = leituras.get((tipo, unidade_id, medidor, m, a))
+        linhas.append(Consumo(
+            tipo=tipo, unidade_id=unidade_id, medidor=medidor, mes=m, ano=a,
+            leitura_anterior=anterior, leitura_atual=atual,
+            consumo=calcular(anterior, atual),
+        ))
+    return linhas
+
+
+def atualizar_varios(chaves):
+    """
+    ``atualizar`` de várias ``chaves`` (de ``chave_da_leitura``) de leituras
+    gravadas: uma consulta das leituras e um upsert, seja qual for o número
+    de chaves. Só serve para leituras gravadas, não apagadas: toda linha
+    refeita tem a leitura atual ou a anterior.
+    """
+    linhas = _com_mes_seguinte(chaves)
+    if not linhas:
+        return
+    periodos = [Periodo(m, a) for *_, m, a in linhas]
+    # uma consulta larga (unidades e meses envolvidos); o dicionário acerta a chave
+    leituras = {}
+    for *k, leitura in (
+        Leitura.objects.filter(
+            tipo__in={k[0] for k in linhas},
+            unidade_id__in={k[1] for k in linhas},
+            periodo__range=(min(periodos).anterior(), max(periodos)),
+        ).order_by('id').values_list('tipo', 'unidade_id', 'medidor', 'mes', 'ano', 'leitura')
+    ):
+        leituras.setdefault(tuple(k), leitura)
+    ConsumoMensal.objects.bulk_create(
+        _linhas_de_consumo(ConsumoMensal, leituras, linhas),
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['tipo', 'ano', 'mes', 'unidade', 'medidor'],
+        update_fields=['leitura_anterior', 'leitura_atual', 'consumo'],
+    )
+
+
+def _todas_as_leituras(apps):
+    """``(tipo, unidade_id, medidor, mes, ano, leitura)`` de cada leitura, por id."""
+    campos = ('unidade_id', 'mes', 'ano', 'leitura')
+    try:
+        yield from (apps.get_model('despesas', 'Leitura').objects.order_by('id')
+                    .values_list('tipo', 'unidade_id', 'medidor', 'mes', 'ano', 'leitura'))
+        return
+    except LookupError:
+        pass
+    # modelos históricos de antes da 0011: uma tabela por tipo, medidor só na energia
+    for tipo, nome_modelo in ((Leitura.GAS, 'LeituraGas'), (Leitura.AGUA, 'LeituraAgua')):
+        for unidade_id, mes, ano, leitura in (
+            apps.get_model('despesas', nome_modelo).objects.order_by('id').values_list(*campos)
+        ):
+            yield tipo, unidade_id, 0, mes, ano, leitura
+    for unidade_id, medidor, mes, ano, leitura in (
+        apps.get_model('despesas', 'LeituraEnergia').objects.order_by('id')
+        .values_list('unidade_id', 'medidor', *campos[1:])
+    ):
+        yield Leitura.ENERGIA, unidade_id, medidor, mes, ano, leitura
+
+
+def reconstruir(apps=apps_globais):
+    """
+    Apaga e recria a tabela inteira a partir das leituras; devolve quantas
+    linhas gravou. ``apps`` permite usar os modelos históricos numa migração.
+    """
+    Consumo = apps.get_model('despesas', 'ConsumoMensal')
+    leituras = {}
+    for *k, leitura in _todas_as_leituras(apps):
+        leituras.setdefault(tuple(k), leitura)
+    linhas = _linhas_de_consumo(Consumo, leituras, _com_mes_seguinte(leituras))
+    with transaction.atomic():
+        Consumo.objects.all().delete()
+        Consumo.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+def do_mes(tipo, mes, ano, unidade_ids=None):
+    """
+    Linhas ``ConsumoMensal`` de ``tipo`` em ``mes``/``ano`` numa consulta,
+    como ``{(unidade_id, medidor): linha}`` (medidor 0 em gás e água).
+    Unidade sem leitura no mês nem no anterior não aparece.
+    """
+    qs = ConsumoMensal.objects.filter(tipo=tipo, ano=ano, mes=mes)
+    if unidade_ids is not None:
+        qs = qs.filter(unidade_id__in=unidade_ids)
+    return {(c.unidade_id, c.medidor): c for c in qs}
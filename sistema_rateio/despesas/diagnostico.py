@@ -0,0 +1,107 @@
+"""
+Medição por fases de uma geração de arquivo (tempo, consultas e memória).
+
+Usado pela exportação XLSX quando ``XLSX_DIAGNOSTICO`` está ligado: o código
+chama ``marcar('nome da fase')`` ao fim de cada fase e cada marca guarda o
+que foi gasto desde a anterior. Desligado, ``marcar`` não faz nada.
+"""
+import logging
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class Diagnostico:
+    """
+    Use como gerenciador de contexto em volta da geração inteira::
+
+        with Diagnostico(ativo, 'XLSX 03/2025') as diag:
+            ...
+            diag.marcar('rateio (pivot)')
+
+    A memória vem do ``tracemalloc`` (ligado só durante a medição, e que
+    deixa o código bem mais lento): ``alocado`` é o saldo da fase e ``pico``
+    o máximo alocado além do que já existia no início dela.
+    """
+
+    def __init__(self, ativo=False, titulo=''):
+        self.ativo = ativo
+        self.titulo = titulo
+        self.fases = []
+        self._consultas = 0
+
+    def __enter__(self):
+        if not self.ativo:
+            return self
+        self._pilha = ExitStack()
+        self._pilha.enter_context(connection.execute_wrapper(self._contar))
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._pilha.callback(tracemalloc.stop)
+        self._inicio_fase()
+        return self
+
+    def __exit__(self, *exc):
+        if self.ativo:
+            self._pilha.close()
+            if exc[0] is None:
+                self.registrar_log()
+        return False
+
+    def _contar(self, execute, sql, params, many, context):
+        self._consultas += 1
+        return execute(sql, params, many, context)
+
+    def _inicio_fase(self):
+        tracemalloc.reset_peak()
+        self._memoria = tracemalloc.get_traced_memory()[0]
+        self._consultas_inicio = self._consultas
+        self._tempo = time.perf_counter()
+
+    def marcar(self, fase):
+        """Fecha a fase ``fase`` (desde a marca anterior) e começa a próxima."""
+        if not self.ativo:
+            return
+        tempo = time.perf_counter() - self._tempo
+        atual, pico = tracemalloc.get_traced_memory()
+        self.fases.append({
+            'fase':      fase,
+            'tempo_s':   tempo,
+            'consultas': self._consultas - self._consultas_inicio,
+            'alocado':   atual - self._memoria,
+            'pico':      max(pico - self._memoria, 0),
+        })
+        self._inicio_fase()
+
+    def linhas(self):
+        """Fases como linhas de tabela, com o total no fim."""
+        linhas = [
+            {
+                'Fase':           f['fase'],
+                'Tempo (s)':      round(f['tempo_s'], 4),
+                'Consultas':      f['consultas'],
+                'Alocado (KiB)':  round(f['alocado'] / 1024, 1),
+                'Pico (KiB)':     round(f['pico'] / 1024, 1),
+            }
+            for f in self.fases
+        ]
+        linhas.append({
+            'Fase':          'TOTAL',
+            'Tempo (s)':     round(sum(f['tempo_s'] for f in self.fases), 4),
+            'Consultas':     sum(f['consultas'] for f in self.fases),
+            'Alocado (KiB)': round(sum(f['alocado'] for f in self.fases) / 1024, 1),
+            'Pico (KiB)':    round(max((f['pico'] for f in self.fases), default=0) / 1024, 1),
+        })
+        return linhas
+
+    def registrar_log(self):
+        for f in self.fases:
+            logger.info(
+                "%s | %-24s %8.3fs %4d consultas  alocado %9.1f KiB  pico %9.1f KiB",
+                self.titulo, f['fase'], f['tempo_s'], f['consultas'],
+                f['alocado'] / 1024, f['pico'] / 1024,
+            )
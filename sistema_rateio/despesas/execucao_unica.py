@@ -0,0 +1,169 @@
+"""
+Execução única ("single flight") das gerações síncronas do admin.
+
+Quando vários pedidos iguais chegam juntos (mesma operação, mesmo período,
+mesmos dados), só o primeiro gera o arquivo; os outros esperam numa trava de
+arquivo e recebem o mesmo resultado. A trava é do sistema operacional
+(``flock``), então vale entre threads e entre processos do servidor, e é
+liberada sozinha se o processo cair no meio.
+
+O resultado fica em ``EXECUCAO_UNICA_DIR`` só pelo tempo de ser entregue a
+quem estava esperando: um pedido que chega depois da geração terminar gera
+de novo (a fila de tarefas em segundo plano tem a sua própria deduplicação).
+"""
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:             # Windows
+    fcntl = None
+    import msvcrt
+
+
+def ativo():
+    return getattr(settings, 'EXECUCAO_UNICA', False)
+
+
+def diretorio():
+    pasta = Path(getattr(settings, 'EXECUCAO_UNICA_DIR', settings.DATA_DIR / 'execucao_unica'))
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta
+
+
+def _travar(arquivo):
+    if fcntl:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+        return
+    arquivo.seek(0)
+    while True:
+        try:
+            # LK_LOCK tenta por ~10s e desiste; aqui a espera é indefinida
+            msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _destravar(arquivo):
+    if fcntl:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+    else:
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _abrir_trava(caminho):
+    # "r+b" (e não "a+b"): a marca é regravada do início, não acrescentada
+    return os.fdopen(os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+
+
+def _mesma_trava(arquivo, caminho):
+    """A trava aberta ainda é a do ``caminho`` (``_podar`` pode tê-la apagado)."""
+    try:
+        return os.path.samestat(os.fstat(arquivo.fileno()), os.stat(caminho))
+    except FileNotFoundError:
+        return False
+
+
+def _ler_marca(arquivo):
+    """``(geracao, versao)`` que o último a gerar gravou na trava."""
+    try:
+        arquivo.seek(0)
+        geracao, versao = arquivo.read().decode().split()
+        return int(geracao), versao
+    except (OSError, ValueError):
+        # trava nova (vazia), ou presa por outro processo (Windows)
+        return 0, ''
+
+
+def _gravar_marca(arquivo, geracao, versao):
+    arquivo.seek(0)
+    arquivo.truncate()
+    arquivo.write(f"{geracao} {versao}\n".encode())
+    arquivo.flush()
+
+
+def _apagar_trava_ociosa(caminho):
+    # só se ninguém estiver com ela; quem já a abriu e ainda espera percebe
+    # depois de travar (``_mesma_trava``) e abre a nova
+    with open(caminho, 'rb') as arquivo:
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        caminho.unlink()
+
+
+def _podar(pasta, manter):
+    """
+    Apaga resultados e travas sem uso há mais de ``EXECUCAO_UNICA_RETENCAO``
+    segundos.
+    """
+    limite = time.time() - getattr(settings, 'EXECUCAO_UNICA_RETENCAO', 300)
+    for caminho in pasta.iterdir():
+        # arquivos ainda sendo gravados ficam
+        if caminho.suffix == '.tmp' or caminho == manter:
+            continue
+        try:
+            if caminho.stat().st_mtime >= limite:
+                continue
+            if caminho.suffix != '.lock':
+                caminho.unlink()
+            elif fcntl:
+                # no Windows a trava aberta não pode ser apagada: fica
+                _apagar_trava_ociosa(caminho)
+        except OSError:
+            # já apagado por outro processo, ou aberto (Windows)
+            pass
+
+
+def executar_uma_vez(chave, versao, gravar):
+    """
+    Devolve aberto (``rb``) o arquivo gerado por ``gravar(destino)`` para
+    ``chave`` (operação e período, ex.: "xlsx_03-2025") e ``versao`` (hash
+    dos dados usados).
+
+    Pedidos com a mesma ``chave`` passam um de cada vez pela trava. Quem
+    gera grava na trava um contador de gerações e a ``versao``; quem estava
+    esperando e vê o contador andar, com a mesma ``versao``, usa esse
+    resultado em vez de gerar outro.
+    """
+    pasta = diretorio()
+    versao = versao[:32]
+    resultado = pasta / f"{chave}.{versao}"
+    caminho_trava = pasta / f"{chave}.lock"
+    while True:
+        trava = _abrir_trava(caminho_trava)
+        geracao_inicial, _ = _ler_marca(trava)
+        _travar(trava)
+        if _mesma_trava(trava, caminho_trava):
+            break
+        _destravar(trava)
+        trava.close()
+
+    with trava:
+        try:
+            geracao, versao_gerada = _ler_marca(trava)
+            if geracao > geracao_inicial and versao_gerada == versao:
+                try:
+                    return open(resultado, 'rb')
+                except FileNotFoundError:
+                    pass
+
+            temporario = resultado.with_name(
+                f"{resultado.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                gravar(temporario)
+                os.replace(temporario, resultado)
+            finally:
+                temporario.unlink(missing_ok=True)
+            _gravar_marca(trava, geracao + 1, versao)
+            _podar(pasta, manter=resultado)
+            return open(resultado, 'rb')
+        finally:
+            _destravar(trava)
@@ -0,0 +1,1101 @@
+"""
+Montagem da planilha de rateio do mês (XLSX).
+
+Cada aba é um cabeçalho e um gerador de linhas: os rateios vêm do banco
+com ``iterator()``, somados em centavos por unidade e tipo, e cada linha
+vai para o ``write_row`` do xlsxwriter assim que é montada, sem guardar a
+aba inteira. Dá para pedir só algumas abas (``abas``): o que só as outras
+usam nem chega a ser consultado.
+
+``escrever_xlsx`` aceita o modo ``constant_memory`` do xlsxwriter, usado
+quando a planilha vai direto para um arquivo temporário. xlsxwriter (e o
+numpy, usado só numa soma) são importados dentro das funções, só quando
+uma planilha é gerada.
+
+Com ``XLSX_DIAGNOSTICO`` ligado, cada fase da geração é medida (ver
+``diagnostico``) e o resultado vai para o log e para uma aba oculta
+"Diagnóstico" na própria planilha.
+
+No fim do módulo fica a exportação em CSV da tabela de rateios de um
+período qualquer, gerada linha a linha para ser enviada em streaming.
+"""
+import csv
+import hashlib
+import io
+import itertools
+import json
+from decimal import Decimal, ROUND_HALF_UP
+from functools import cached_property
+
+from django.conf import settings
+from django.db.models import F, IntegerField, Max, Q
+from django.db.models.functions import Cast, Round
+
+from .diagnostico import Diagnostico
+from .periodo import Periodo
+from .models import (
+    Unidade,
+    TipoDespesa,
+    Despesa,
+    Rateio,
+    Leitura,
+    DespesaGas,
+    DespesaAgua,
+    DespesaEnergia,
+    FundoReserva,
+)
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+
+# abas da planilha do mês, na ordem em que são gravadas (as de parâmetros ficam ocultas)
+ABAS_XLSX = (
+    "Parâmetros Gás",
+    "Parâmetros Energia",
+    "RATEIO",
+    "EXIBIÇÃO POR UNIDADE",
+    "DESPESAS RATEIO",
+    "Notas Fiscais",
+)
+
+
+def nome_arquivo_xlsx(mes, ano):
+    return f'RATEIOS DESPESAS {mes:02d}_{ano}.xlsx'
+
+
+def _mes_anterior(mes, ano):
+    anterior = Periodo(mes, ano).anterior()
+    return anterior.mes, anterior.ano
+
+
+_COLUNAS_LEITURA = ('tipo', 'unidade_id', 'unidade__nome', 'medidor', 'mes', 'ano', 'leitura')
+
+
+def _leituras_do_periodo(periodos, tipos=None):
+    """
+    Leituras de gás, água e energia (só de ``tipos``, se dados) nos
+    ``periodos`` [(mes, ano), ...] numa consulta só, em ordem de id, como
+    tuplas com as ``_COLUNAS_LEITURA``.
+    """
+    qs = Leitura.objects.filter(periodo__in=[Periodo(m, a) for m, a in periodos])
+    if tipos is not None:
+        qs = qs.filter(tipo__in=tipos)
+    return list(qs.order_by('id').values_list(*_COLUNAS_LEITURA))
+
+
+def _leituras(linhas, tipo, *chave):
+    """
+    Leituras de ``tipo`` entre as ``linhas`` de ``_leituras_do_periodo``
+    como ``{(*chave, mes, ano): leitura}``. Se mais de uma cair na mesma
+    chave (ex.: unidades com o mesmo nome), vale a de menor id, como no
+    ``.first()`` unidade a unidade.
+    """
+    posicoes = [_COLUNAS_LEITURA.index(c) for c in (*chave, 'mes', 'ano')]
+    mapa = {}
+    for linha in linhas:
+        if linha[0] == tipo:
+            mapa.setdefault(tuple(linha[i] for i in posicoes), linha[-1])
+    return mapa
+
+
+def _centavos(campo='valor'):
+    """``campo`` (decimal com 2 casas) em centavos inteiros, calculado no banco."""
+    return Cast(Round(F(campo) * 100), IntegerField())
+
+
+def versao_dados(ano, meses):
+    """
+    Hash do que a planilha dos ``meses`` de ``ano`` lê do banco: despesas e
+    rateios dos meses, leituras deles e do mês anterior, unidades e tipos.
+    Muda sempre que algum desses registros muda (são poucas linhas por mês).
+    """
+    meses = sorted(meses)
+    leituras = [Periodo(meses[0], ano).anterior()] + [Periodo(m, ano) for m in meses]
+    meses_despesa = [str(m) for m in meses]
+
+    h = hashlib.sha256()
+    for consulta in (
+        Despesa.objects.filter(ano=ano, mes__in=meses_despesa),
+        Rateio.objects.filter(despesa__ano=ano, despesa__mes__in=meses_despesa),
+        Leitura.objects.filter(periodo__in=leituras),
+        Unidade.objects.all(),
+        TipoDespesa.objects.all(),
+    ):
+        linhas = list(consulta.order_by('id').values_list())
+        h.update(json.dumps(linhas, default=str).encode())
+    return h.hexdigest()
+
+
+def _somar_rateios(linhas):
+    """
+    Soma os rateios ``(unidade, tipo, centavos)`` em
+    ``{unidade: {tipo: centavos}}``, em centavos inteiros: a conversão para
+    reais acontece uma única vez, na hora de gravar cada célula.
+    """
+    valores = {}
+    for nome, tipo, centavos in linhas:
+        por_tipo = valores.setdefault(nome, {})
+        por_tipo[tipo] = por_tipo.get(tipo, 0) + centavos
+    return valores
+
+
+def _linhas_rateio(valores, tipos, shares):
+    """
+    Linhas da aba RATEIO a partir de ``_somar_rateios``: uma por unidade, em
+    ordem de nome, com o valor de cada um dos ``tipos`` na ordem recebida.
+    Soma zero fica vazia e tipo sem nenhum rateio no mês fica 0. O Fundo de
+    Reserva vem de ``shares`` (cotas por unidade), 0 se a unidade não tiver.
+    """
+    com_rateio = {t for por_tipo in valores.values() for t in por_tipo}
+    for nome in sorted(valores):
+        por_tipo = valores[nome]
+        linha = [nome]
+        for t in tipos:
+            if t == 'Fundo de Reserva':
+                linha.append(float(shares.get(nome, 0)))
+            elif t in com_rateio:
+                linha.append(_ou_vazio(por_tipo.get(t, 0) / 100))
+            else:
+                linha.append(0)
+        yield linha
+
+
+def _ou_vazio(valor):
+    """``None`` (célula vazia, ou "-") no lugar de zero."""
+    return None if valor == 0 else valor
+
+
+def _arredondar(valor, casas):
+    """
+    ``valor`` com ``casas`` decimais como o numpy arredonda (multiplica,
+    arredonda para o par e divide), que nem sempre coincide com
+    ``round(valor, casas)``.
+    """
+    fator = 10 ** casas
+    return round(valor * fator) / fator
+
+
+def _consumo_energia(leituras, unidade_id, periodo, anterior):
+    """
+    Consumo somado dos dois medidores de energia da unidade e as leituras
+    ``(med1 ant., med1 atu., med2 ant., med2 atu.)``, ``None`` onde faltam.
+    """
+    la1 = leituras.get((unidade_id, 1, *anterior))
+    lk1 = leituras.get((unidade_id, 1, *periodo))
+    la2 = leituras.get((unidade_id, 2, *anterior))
+    lk2 = leituras.get((unidade_id, 2, *periodo))
+    diff1 = lk1 - (la1 or 0) if lk1 is not None else 0
+    diff2 = lk2 - (la2 or 0) if lk2 is not None else 0
+    return max(diff1, 0) + max(diff2, 0), (la1, lk1, la2, lk2)
+
+
+COLUNAS_PARAMETROS = ["Parâmetro", "Valor"]
+
+COLUNAS_DESPESAS_RATEIO = [
+    'Unidade',
+    'Água – R$ Fatura',
+    'Água – m³ total',
+    'Água – R$/m³',
+    'Água – Leitura Ant.',
+    'Água – Leitura Atu.',
+    'Água – Consumo m³',
+    'Água – R$',
+    'Gás – R$ Recarga',
+    'Gás – KG',
+    'Gás – m³/kg',
+    'Gás – R$ por m³',
+    'Gás – Leitura Ant.',
+    'Gás – Leitura Atu.',
+    'Gás – Consumo m³',
+    'Gás – R$',
+    'Energia – Fatura',
+    'Energia – kWh Total',
+    'Energia – R$ por kWh',
+    'Energia – Uso kWh',
+    'Energia – Med1 Ant.',
+    'Energia – Med1 Atu.',
+    'Energia – Med2 Ant.',
+    'Energia – Med2 Atu.',
+    'Energia – Consumo kWh',
+    'Energia – R$',
+]
+
+COLUNAS_NF = ["Tipo Despesa", "Fornecedor", "Histórico", "NF Nº", "Tipo (com/sem)", "Valor"]
+
+TIPOS_NF = [
+    "Material/Serviço de Consumo",
+    "Material Consumo (Sem Sala Comercial)",
+    "Reparos/Reforma",
+    "Reparo/Reforma (Sem a Sala)",
+]
+
+
+class _Planilhas:
+    """
+    Colunas e linhas de cada aba da planilha de ``mes``/``ano``. Cada aba é
+    ``(colunas, linhas)``, com as linhas geradas uma de cada vez enquanto a
+    aba é gravada. O que mais de uma aba usa (parâmetros, rateios somados,
+    leituras) é consultado na primeira vez que é pedido e fica guardado.
+    """
+
+    def __init__(self, mes, ano, diagnostico=None):
+        self.mes = mes
+        self.ano = ano
+        self.anterior = _mes_anterior(mes, ano)
+        # leituras do mês e do anterior
+        self.periodos = [(mes, ano), self.anterior]
+        self.diag = diagnostico or Diagnostico()
+
+    # --- 1) últimos registros de cada despesa com parâmetros ---
+    @cached_property
+    def _parametros(self):
+        mes, ano = self.mes, self.ano
+        wa = DespesaAgua.objects.filter(mes=mes, ano=ano).order_by('-id').first()
+        ga = DespesaGas.objects.filter(mes=mes, ano=ano).order_by('-id').first()
+        en = DespesaEnergia.objects.filter(mes=mes, ano=ano).order_by('-id').first()
+        self.diag.marcar('parâmetros')
+        return wa, ga, en
+
+    @cached_property
+    def _gas(self):
+        _, ga, _ = self._parametros
+        if ga and ga.gas_leituras:
+            p = ga.gas_leituras.get('params', {})
+            gas_rec    = Decimal(p.get('recarga', 0))
+            gas_kg     = Decimal(p.get('kg',      0))
+            gas_m3kg   = Decimal(p.get('m3_kg',   0))
+            gas_val_m3 = Decimal(p.get('valor_m3',0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        else:
+            gas_rec = gas_kg = gas_m3kg = gas_val_m3 = Decimal('0')
+        return gas_rec, gas_kg, gas_m3kg, gas_val_m3
+
+    @cached_property
+    def _energia(self):
+        _, _, en = self._parametros
+        if en and en.energia_leituras:
+            p = en.energia_leituras['params']
+            en_fat     = Decimal(p.get('fatura',   0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+            en_kwh_tot = Decimal(p.get('kwh_total',1)).quantize(Decimal('0.0001'), ROUND_HALF_UP)
+            en_custo   = Decimal(p.get('custo_kwh',0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+            en_uso     = Decimal(p.get('uso_kwh',  0)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        else:
+            en_fat = en_kwh_tot = en_custo = en_uso = Decimal('0')
+        return en_fat, en_kwh_tot, en_custo, en_uso
+
+    def params_gas(self):
+        gas_rec, gas_kg, gas_m3kg, gas_val_m3 = self._gas
+        return COLUNAS_PARAMETROS, [
+            ["R$ Recarga",      float(gas_rec)],
+            ["KG",              float(gas_kg)],
+            ["m³/kg",           float(gas_m3kg)],
+            ["R$ por m³ Gás",   float(gas_val_m3)],
+        ]
+
+    def params_energia(self):
+        en_fat, en_kwh_tot, en_custo, en_uso = self._energia
+        return COLUNAS_PARAMETROS, [
+            ["R$ Fatura",       float(en_fat)],
+            ["kWh Total",       float(en_kwh_tot)],
+            ["R$ por kWh",      float(en_custo)],
+            ["Uso kWh",         float(en_uso)],
+        ]
+
+    # --- 2) RATEIO ---
+    @cached_property
+    def _rateio(self):
+        mes, ano = self.mes, self.ano
+        # filtra todos os rateios do período
+        rateios = Rateio.objects.filter(
+            despesa__mes=mes,
+            despesa__ano=int(ano)
+        )
+
+        # pega apenas o FUNDOSERVA mais recente
+        fundo_tipo = TipoDespesa.objects.get(nome__iexact='Fundo de Reserva')
+        latest_fr = FundoReserva.objects.filter(
+            mes=mes,
+            ano=int(ano),
+            tipo=fundo_tipo
+        ).order_by('-id').first()
+
+        shares = {}
+
+        if latest_fr:
+            # mantém todos os rateios que NÃO são de Fundo de Reserva
+            # + apenas os rateios desse único Fundo de Reserva
+            rateios = rateios.filter(
+                Q(despesa__tipo__nome__iexact='Fundo de Reserva', despesa=latest_fr) |
+                ~Q(despesa__tipo__nome__iexact='Fundo de Reserva')
+            )
+
+        tipos = list(
+            TipoDespesa.objects
+            .order_by('id')
+            .values_list('nome', flat=True)
+        )
+
+        # cotas do Fundo de Reserva mais recente, por unidade
+        if latest_fr:
+            rateios_fundo = (
+                Rateio.objects.filter(despesa=latest_fr)
+                .order_by('id')
+                .values_list('unidade__nome', 'valor')
+            )
+            shares = {nome: float(valor) for nome, valor in rateios_fundo}
+
+        # valores por unidade e tipo, direto do cursor
+        valores = _somar_rateios(
+            rateios.values_list('unidade__nome', 'despesa__tipo__nome', _centavos()).iterator()
+        )
+        self.diag.marcar('rateio (pivot)')
+        return tipos, valores, shares
+
+    @property
+    def tipos(self):
+        return self._rateio[0]
+
+    @property
+    def _valores(self):
+        return self._rateio[1]
+
+    def rateio(self):
+        tipos, valores, shares = self._rateio
+        return ['Unidade'] + tipos, _linhas_rateio(valores, tipos, shares)
+
+    # --- consumo de energia por unidade (EXIBIÇÃO e DESPESAS RATEIO) ---
+    @cached_property
+    def unidades(self):
+        return list(Unidade.objects.order_by('nome'))
+
+    @cached_property
+    def _leituras(self):
+        # gás, água e energia do mês e do anterior, numa consulta
+        return _leituras_do_periodo(self.periodos)
+
+    @cached_property
+    def _leituras_energia(self):
+        return _leituras(self._leituras, Leitura.ENERGIA, 'unidade_id', 'medidor')
+
+    @cached_property
+    def _consumo_energia_por_nome(self):
+        consumo = {}
+        for un in self.unidades:
+            cons_en, _ = _consumo_energia(self._leituras_energia, un.id,
+                                          (self.mes, self.ano), self.anterior)
+            consumo[un.nome] = round(cons_en, 3)
+        return consumo
+
+    # --- 3) EXIBIÇÃO POR UNIDADE ---
+    @property
+    def tipos_exibicao(self):
+        # uma linha por despesa, na ordem do TipoDespesa
+        return [t for t in self.tipos if t != 'Fatura Energia Elétrica']
+
+    @cached_property
+    def _consumo_gas_agua(self):
+        mes, ano = self.mes, self.ano
+        prev_mes, prev_ano = self.anterior
+
+        # rateio de gás e leituras do mês e do anterior, de todas as unidades
+        # de uma vez; por nome, como nas colunas da aba
+        rateio_gas_por_nome = {}
+        for nome, valor in (
+            Rateio.objects
+            .filter(despesa__tipo__nome__iexact='Gás', despesa__mes=str(mes), despesa__ano=ano)
+            .order_by('id')
+            .values_list('unidade__nome', 'valor')
+        ):
+            rateio_gas_por_nome.setdefault(nome, valor)
+        gas_por_nome  = _leituras(self._leituras, Leitura.GAS,  'unidade__nome')
+        agua_por_nome = _leituras(self._leituras, Leitura.AGUA, 'unidade__nome')
+
+        # calcula consumo de gás e água por unidade
+        gas_map = {}
+        agua_map = {}
+        for un in sorted(self._valores):
+
+            rateio_gas = rateio_gas_por_nome.get(un)
+            if rateio_gas is not None and rateio_gas > Decimal('0'):
+                atual_gas = gas_por_nome.get((un, mes, ano))
+                ant_gas   = gas_por_nome.get((un, prev_mes, prev_ano))
+                if atual_gas is not None and ant_gas is not None:
+                    diff_g = atual_gas - ant_gas
+                    gas_map[un] = diff_g if diff_g > 0 else 0
+                elif atual_gas is not None:
+                    gas_map[un] = atual_gas
+                else:
+                    gas_map[un] = 0
+            else:
+                gas_map[un] = 0
+
+            # água
+            atual_a = agua_por_nome.get((un, mes, ano))
+            ant_a   = agua_por_nome.get((un, prev_mes, prev_ano))
+            if atual_a is not None and ant_a is not None:
+                diff = atual_a - ant_a
+                agua_map[un] = diff if diff > 0 else 0
+            else:
+                agua_map[un] = 0
+
+        self.diag.marcar('exibição por unidade')
+        return gas_map, agua_map
+
+    def exibicao(self):
+        # colunas: as unidades com rateio no mês, em ordem de nome
+        unidades = sorted(self._valores)
+        return ['Despesas Condomínio', *unidades, 'Total Geral'], self._linhas_exibicao(unidades)
+
+    def _linhas_exibicao(self, unidades):
+        valores = self._valores
+        for t in self.tipos_exibicao:
+            yield [t, *(valores[un].get(t, 0) / 100 for un in unidades), '']
+
+        gas_map, agua_map = self._consumo_gas_agua
+        energia = self._consumo_energia_por_nome
+        consumos = [
+            ['Consumo Gás m³', *(gas_map[un] for un in unidades), ''],
+            ['Consumo Água m³', *(agua_map[un] for un in unidades), ''],
+            ['Consumo Energia Salão', *(energia[un] for un in unidades), ''],
+        ]
+
+        # TOTAL BOLETO por unidade e, na coluna "Total Geral", a soma deles.
+        # Somados como sempre foram, para não mudar nem o último dígito: o
+        # total de cada unidade com o numpy; o geral também, a não ser que
+        # algum consumo seja Decimal, quando a soma era feita em ordem
+        totais = [
+            _somar([valores[un].get(t, 0) / 100 for t in self.tipos_exibicao])
+            for un in unidades
+        ]
+        if any(isinstance(v, Decimal) for linha in consumos for v in linha):
+            total_geral = sum(totais)
+        else:
+            total_geral = _somar(totais)
+        yield ['TOTAL BOLETO', *totais, total_geral]
+        yield from consumos
+
+    # --- 4) DESPESAS RATEIO (leituras por unidade) ---
+    def leituras(self):
+        return COLUNAS_DESPESAS_RATEIO, self._linhas_leituras()
+
+    def _linhas_leituras(self):
+        mes, ano = self.mes, self.ano
+        prev_mes, prev_ano = self.anterior
+        wa, _, _ = self._parametros
+        gas_rec, gas_kg, gas_m3kg, gas_val_m3 = self._gas
+        en_fat, en_kwh_tot, en_custo, en_uso = self._energia
+        valores = self._valores
+        # o R$ da energia do salão vem do rateio das unidades que têm rateio
+        energia_do_rateio = 'Energia Salão' in self.tipos_exibicao
+
+        # leituras de todas as unidades (a mesma consulta das outras abas)
+        agua_por_unidade    = _leituras(self._leituras, Leitura.AGUA, 'unidade_id')
+        gas_por_unidade     = _leituras(self._leituras, Leitura.GAS,  'unidade_id')
+        energia_por_unidade = self._leituras_energia
+
+        # pega os valores prontos vindos do admin (iguais para todas as unidades)
+        if wa and wa.agua_leituras:
+            agua_fat = Decimal(wa.agua_leituras.get('params', {}).get('fatura', 0))
+        else:
+            agua_fat = Decimal('0')
+
+        if wa and wa.m3_total is not None:
+            agua_m3tot = Decimal(str(wa.m3_total))
+        else:
+            agua_m3tot = Decimal('0')
+
+        if agua_m3tot:
+            valor_por_m3 = (agua_fat / agua_m3tot).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        else:
+            valor_por_m3 = Decimal('0.00')
+
+        def leitura(valor):
+            # sem leitura: vazio; leitura zero: "-"
+            return '' if valor is None else _ou_vazio(valor)
+
+        for un in self.unidades:
+            # consumo você já calcula normalmente
+            ant_wa = agua_por_unidade.get((un.id, prev_mes, prev_ano))
+            atu_wa = agua_por_unidade.get((un.id, mes,      ano))
+            if ant_wa is not None and atu_wa is not None:
+                diff_wa = atu_wa - ant_wa
+                cons_wa = diff_wa if diff_wa > 0 else 0
+            else:
+                cons_wa = 0
+
+            ant_ga = gas_por_unidade.get((un.id, prev_mes, prev_ano))
+            atu_ga = gas_por_unidade.get((un.id, mes,      ano))
+            if ant_ga is not None and atu_ga is not None:
+                diff_ga = atu_ga - ant_ga
+                cons_ga = diff_ga if diff_ga > 0 else 0
+            elif atu_ga is not None:
+                cons_ga = atu_ga
+            else:
+                cons_ga = 0
+
+            cons_en, leituras_en = _consumo_energia(
+                energia_por_unidade, un.id, (mes, ano), self.anterior)
+            _, lk1, _, lk2 = leituras_en
+            sem_leitura_en = lk1 is None and lk2 is None
+
+            rateio = valores.get(un.nome, {})
+            if energia_do_rateio and un.nome in valores:
+                energia_rs = rateio.get('Energia Salão', 0) / 100
+            elif sem_leitura_en:
+                energia_rs = None
+            else:
+                valor_dec = (Decimal(cons_en) * en_uso).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+                energia_rs = _ou_vazio(float(valor_dec))
+
+            yield [
+                un.nome,
+                _ou_vazio(float(agua_fat)),
+                _ou_vazio(float(agua_m3tot)),
+                float(valor_por_m3),
+                leitura(ant_wa),
+                leitura(atu_wa),
+                _ou_vazio(float(cons_wa)),
+                _ou_vazio(rateio.get('Água', 0) / 100),
+
+                _ou_vazio(float(gas_rec)),
+                _ou_vazio(float(gas_kg)),
+                _ou_vazio(float(gas_m3kg)),
+                _ou_vazio(float(gas_val_m3)),
+                leitura(ant_ga),
+                leitura(atu_ga),
+                _ou_vazio(cons_ga),
+                _ou_vazio(rateio.get('Gás', 0) / 100),
+
+                _ou_vazio(float(en_fat)),
+                _ou_vazio(float(en_kwh_tot)),
+                _ou_vazio(float(en_custo)),
+                _ou_vazio(float(en_uso)),
+                *(None if v is None else _ou_vazio(_arredondar(float(v), 4)) for v in leituras_en),
+                None if sem_leitura_en else _ou_vazio(_arredondar(float(cons_en), 3)),
+                energia_rs,
+            ]
+
+    # --- 5) Notas Fiscais ---
+    def nfs(self):
+        # sem nenhuma nota a aba fica vazia, nem o cabeçalho é gravado
+        linhas = self._linhas_nfs()
+        primeira = next(linhas, None)
+        if primeira is None:
+            return [], []
+        return COLUNAS_NF, itertools.chain([primeira], linhas)
+
+    def _linhas_nfs(self):
+        despesas_nf = Despesa.objects.filter(
+            mes=self.mes,
+            ano=self.ano,
+            tipo__nome__in=TIPOS_NF,
+        ).select_related('tipo')
+
+        for desp in despesas_nf.iterator():
+            for nf in desp.nf_info or []:
+                yield [
+                    desp.tipo.nome,
+                    nf.get("fornecedor", ""),
+                    nf.get("historico", ""),
+                    nf.get("numero", ""),
+                    nf.get("tipo", ""),
+                    nf.get("valor", 0),
+                ]
+
+
+def _somar(valores):
+    """Soma de floats feita pelo numpy (em pares, não em ordem)."""
+    import numpy as np
+    return float(np.sum(valores))
+
+
+# formato do cabeçalho (o mesmo do ``to_excel`` do pandas, usado antes)
+FORMATO_CABECALHO = {
+    'bold': True, 'align': 'center', 'valign': 'top',
+    'top': 1, 'right': 1, 'bottom': 1, 'left': 1,
+}
+FORMATO_MOEDA = {
+    'num_format': 'R$ #,##0.00;R$ -#,##0.00;"–";@',
+    'align':      'center',
+    'valign':     'vcenter',
+}
+# negrito + moeda para as linhas de total
+FORMATO_MOEDA_NEGRITO = {'bold': True, **FORMATO_MOEDA}
+FORMATO_TITULO = {
+    'bold':   True,
+    'align':  'center',
+    'valign': 'vcenter',
+    'bg_color':'#D3D3D3',
+}
+FORMATO_CONSUMO = {
+    'num_format': '0.000',
+    'align':      'center',
+    'valign':     'vcenter',
+}
+
+
+def _celula(valor, na_rep):
+    """
+    Valor de uma célula: ``None`` vira ``na_rep`` e o que não é número nem
+    texto (as leituras e consumos em ``Decimal``) vai como texto.
+    """
+    if valor is None:
+        return na_rep
+    if isinstance(valor, (int, float, str)):
+        return valor
+    return str(valor)
+
+
+def _escrever_aba(workbook, nome, colunas, linhas, na_rep=''):
+    """
+    Escreve o cabeçalho ``colunas`` e as ``linhas`` na aba ``nome``, uma de
+    cada vez e em ordem, como exige o modo ``constant_memory``: as linhas
+    podem vir de um gerador e nenhuma fica guardada. Nesse modo ``set_row``
+    não tem efeito em linhas já escritas, então quem chama cria a aba e
+    formata as linhas antes. Devolve a aba e o número de linhas de dados.
+    """
+    ws = workbook.get_worksheet_by_name(nome) or workbook.add_worksheet(nome)
+    cabecalho = workbook.add_format(FORMATO_CABECALHO)
+    if colunas:
+        ws.write_row(0, 0, colunas, cabecalho)
+    n = 0
+    for n, linha in enumerate(linhas, 1):
+        ws.write_row(n, 0, [_celula(v, na_rep) for v in linha])
+    return ws, n
+
+
+def _linha_total(ws, n, formatos, header_fmt):
+    """
+    Linha TOTAL logo abaixo das ``n`` linhas de dados, com ``SUM`` em cada
+    coluna de valor (uma por formato, fora a primeira).
+    """
+    from xlsxwriter.utility import xl_col_to_name
+    ws.write(n + 1, 0, 'TOTAL:', header_fmt)
+    for col_idx in range(1, len(formatos)):
+        col_letter = xl_col_to_name(col_idx)
+        formula = f"=SUM({col_letter}2:{col_letter}{n+1})"
+        ws.write_formula(n + 1, col_idx, formula, formatos[col_idx])
+
+
+def _aba_rateio(workbook, nome, colunas, linhas, currency_fmt, header_fmt, bold_currency_fmt):
+    """Aba RATEIO (unidades × tipos em R$) com a linha de TOTAL."""
+    ws = workbook.add_worksheet(nome)
+    ws.set_column(1, len(colunas) - 1, 15, currency_fmt)
+    ws.set_row(0, None, header_fmt)
+    _, n = _escrever_aba(workbook, nome, colunas, linhas, na_rep='-')
+    _linha_total(ws, n, [bold_currency_fmt] * len(colunas), header_fmt)
+    return ws
+
+
+def _aba_diagnostico(workbook, diag):
+    """Aba oculta "Diagnóstico" com as fases medidas até aqui."""
+    if not diag.ativo:
+        return
+    ws = workbook.add_worksheet("Diagnóstico")
+    ws.set_column(0, 0, 24)
+    ws.set_column(1, 4, 14)
+    linhas = diag.linhas()
+    _escrever_aba(workbook, "Diagnóstico", list(linhas[0]), (list(l.values()) for l in linhas))
+    ws.hide()
+
+
+def abas_validas(abas):
+    """
+    ``abas`` (nomes de ``ABAS_XLSX``, em qualquer ordem) na ordem da
+    planilha; vazio ou ``None`` quer dizer todas.
+    """
+    if not abas:
+        return ABAS_XLSX
+    desconhecidas = set(abas) - set(ABAS_XLSX)
+    if desconhecidas:
+        raise ValueError(f"Aba(s) desconhecida(s): {', '.join(sorted(desconhecidas))}")
+    return tuple(a for a in ABAS_XLSX if a in abas)
+
+
+def escrever_xlsx(destino, mes, ano, memoria_constante=False, diagnostico=None, abas=None):
+    """
+    Grava a planilha de rateio de ``mes``/``ano`` em ``destino`` (caminho ou
+    arquivo aberto). Com ``abas`` (ver ``ABAS_XLSX``) grava só essas abas.
+
+    Com ``memoria_constante`` o xlsxwriter descarrega cada linha num arquivo
+    temporário assim que a próxima começa, em vez de manter a planilha
+    inteira na memória até o fim.
+
+    ``diagnostico`` (padrão: ``XLSX_DIAGNOSTICO``) mede as fases e grava a
+    aba oculta "Diagnóstico"; o fechamento do arquivo, que vem depois dela,
+    só aparece no log.
+    """
+    abas = abas_validas(abas)
+    if diagnostico is None:
+        diagnostico = getattr(settings, 'XLSX_DIAGNOSTICO', False)
+    with Diagnostico(diagnostico, f'XLSX {mes:02d}/{ano}') as diag:
+        _escrever_xlsx(destino, mes, ano, memoria_constante, diag, abas)
+
+
+def _escrever_xlsx(destino, mes, ano, memoria_constante, diag, abas):
+    import xlsxwriter
+    p = _Planilhas(mes, ano, diag)
+
+    workbook = xlsxwriter.Workbook(destino, {'constant_memory': memoria_constante})
+
+    # --- formatos ---
+    currency_fmt      = workbook.add_format(FORMATO_MOEDA)
+    header_fmt        = workbook.add_format(FORMATO_TITULO)
+    number4_fmt       = workbook.add_format(FORMATO_CONSUMO)
+    bold_currency_fmt = workbook.add_format(FORMATO_MOEDA_NEGRITO)
+    fmt_agua = workbook.add_format({
+        'bg_color': '#E8F6F3',
+        'align':    'center',
+        'valign':   'vcenter',
+    })
+    fmt_gas  = workbook.add_format({
+        'bg_color': '#FEF9E7',
+        'align':    'center',
+        'valign':   'vcenter',
+    })
+    fmt_ener = workbook.add_format({
+        'bg_color': '#D6EAF8',  # cor nova
+        'align':    'center',
+        'valign':   'vcenter',
+    })
+    fmt_cons = workbook.add_format({
+        'bg_color': '#E8DAEF',
+        'align':    'center',
+        'valign':   'vcenter',
+    })
+    consumo_fmt = workbook.add_format(FORMATO_CONSUMO)
+    leitura_ener_fmt = workbook.add_format({
+        'num_format': '0.0000',
+        'align':      'center',
+        'valign':     'vcenter',
+    })
+    # cria um format só com alinhamento central
+    center_fmt = workbook.add_format({
+        'align':  'center',
+        'valign': 'vcenter',
+    })
+    bold_fmt = workbook.add_format({'bold': True, 'align':'center','valign':'vcenter'})
+
+    # --- abas de parâmetros (ocultas) ---
+    if "Parâmetros Gás" in abas:
+        ws, _ = _escrever_aba(workbook, "Parâmetros Gás", *p.params_gas())
+        ws.hide()
+    if "Parâmetros Energia" in abas:
+        ws, _ = _escrever_aba(workbook, "Parâmetros Energia", *p.params_energia())
+        ws.hide()
+
+    # --- RATEIO ---
+    if "RATEIO" in abas:
+        _aba_rateio(workbook, "RATEIO", *p.rateio(),
+                    currency_fmt, header_fmt, bold_currency_fmt).activate()
+        diag.marcar('aba RATEIO')
+
+    # --- EXIBIÇÃO POR UNIDADE ---
+    if "EXIBIÇÃO POR UNIDADE" in abas:
+        colunas, linhas = p.exibicao()
+        ws2 = workbook.add_worksheet("EXIBIÇÃO POR UNIDADE")
+        # coluna "Total Geral", a última
+        idx_tot = len(colunas) - 1
+        ws2.set_column(idx_tot, idx_tot, 15, bold_currency_fmt)
+
+        # cabeçalho
+        ws2.set_row(0, None, header_fmt)
+
+        # TOTAL BOLETO (logo depois das despesas) em negrito e moeda
+        total_row_exib = len(p.tipos_exibicao) + 1  # +1 para o cabeçalho
+        ws2.set_row(total_row_exib, None, bold_currency_fmt)
+
+        # todas as colunas de unidade (1 até última) como R$
+        total_cols = len(colunas)
+        ws2.set_column(1, total_cols-1, 15, currency_fmt)
+
+        # apenas as linhas de consumo (logo após o TOTAL BOLETO) com 3 casas:
+        # gás, água e energia do salão
+        ws2.set_row(total_row_exib + 1, None, number4_fmt)
+        ws2.set_row(total_row_exib + 2, None, number4_fmt)
+        ws2.set_row(total_row_exib + 3, None, number4_fmt)
+        _escrever_aba(workbook, "EXIBIÇÃO POR UNIDADE", colunas, linhas, na_rep='-')
+        diag.marcar('aba EXIBIÇÃO POR UNIDADE')
+
+    # --- DESPESAS RATEIO ---
+    if "DESPESAS RATEIO" in abas:
+        cols, linhas = p.leituras()
+        ws3 = workbook.add_worksheet("DESPESAS RATEIO")
+        ws3.set_row(0, None, header_fmt)
+
+        # centraliza todas as colunas, mantendo a largura automática
+        for col_idx in range(len(cols)):
+            ws3.set_column(col_idx, col_idx, None, center_fmt)
+
+        last_col = len(cols) - 1
+        ws3.set_column(last_col, last_col, 15, currency_fmt)
+
+        idx  = {c: i for i, c in enumerate(cols)}
+
+        # coluna Unidade em negrito
+        ws3.set_column(idx['Unidade'], idx['Unidade'], None, bold_fmt)
+
+        # agrupa índices por prefixo
+        agua_idx = [idx[c] for c in cols if c.startswith('Água')]
+        gas_idx  = [idx[c] for c in cols if c.startswith('Gás')]
+        ener_idx = [idx[c] for c in cols if c.startswith('Energia')]
+        cons_idx = [idx[c] for c in cols if 'Consumo' in c]
+        ener_leitura_idx = [
+            idx[c] for c in cols
+            if 'Energia' in c and 'Med' in c
+        ]
+
+        # aplica o consumo_fmt nas colunas de consumo
+        for ci in cons_idx:
+            ws3.set_column(ci, ci, 12, consumo_fmt)
+        # aplica 4 casas às leituras de energia
+        for ci in ener_leitura_idx:
+            ws3.set_column(ci, ci, 12, leitura_ener_fmt)
+
+        # determina até onde colorir (uma linha por unidade, a partir da 1; limite = 24)
+        last_row = min(len(p.unidades), 24)
+
+        # helper para pintar bloco
+        def paint(cols_idx, fmt):
+            if not cols_idx: return
+            c1, c2 = min(cols_idx), max(cols_idx)
+            ws3.conditional_format(1, c1, last_row, c2, {
+                'type':   'no_errors',
+                'format': fmt
+            })
+
+        # pinta cada bloco
+        paint(agua_idx, fmt_agua)
+        paint(gas_idx,  fmt_gas)
+        paint(ener_idx, fmt_ener)
+        paint(cons_idx, fmt_cons)
+        _escrever_aba(workbook, "DESPESAS RATEIO", cols, linhas, na_rep='-')
+        diag.marcar('aba DESPESAS RATEIO')
+
+    # --- Notas Fiscais ---
+    if "Notas Fiscais" in abas:
+        colunas, linhas = p.nfs()
+        ws_nf = workbook.add_worksheet("Notas Fiscais")
+        ws_nf.set_row(0, None, header_fmt)
+        ws_nf.set_column(0, len(colunas)-1, 20, center_fmt)
+        if 'Valor' in colunas:
+            col_val_nf = colunas.index('Valor')
+            ws_nf.set_column(col_val_nf, col_val_nf, 15, currency_fmt)
+        _escrever_aba(workbook, "Notas Fiscais", colunas, linhas)
+        diag.marcar('aba Notas Fiscais')
+
+    _aba_diagnostico(workbook, diag)
+    workbook.close()
+    diag.marcar('fechamento do arquivo')
+
+
+def escrever_planilha(destino, mes, ano, mes_final=None, abas=None):
+    """
+    Grava em ``destino`` a planilha pedida no admin: a de ``mes`` (só as
+    ``abas``, se dadas) ou, com ``mes_final``, a dos meses de ``mes`` a
+    ``mes_final``. É o que as tarefas em segundo plano, a execução única e
+    a geração direta chamam; com ``XLSX_MEMORIA_CONSTANTE`` (o padrão) usa
+    o modo ``constant_memory``.
+    """
+    memoria_constante = getattr(settings, 'XLSX_MEMORIA_CONSTANTE', False)
+    if mes_final and mes_final != mes:
+        escrever_xlsx_periodo(destino, ano, range(mes, mes_final + 1), memoria_constante)
+    else:
+        escrever_xlsx(destino, mes, ano, memoria_constante, abas=abas)
+
+
+def gerar_xlsx(mes, ano, abas=None):
+    """Devolve os bytes da planilha de rateio de ``mes``/``ano``."""
+    buffer = io.BytesIO()
+    escrever_xlsx(buffer, mes, ano, abas=abas)
+    return buffer.getvalue()
+
+
+# --- planilha de vários meses ---------------------------------------------
+
+def nome_arquivo_xlsx_periodo(mes_inicial, mes_final, ano):
+    return f'RATEIOS DESPESAS {mes_inicial:02d}-{mes_final:02d}_{ano}.xlsx'
+
+
+def _montar_periodo(ano, meses):
+    """
+    Dados da planilha de vários meses, com as consultas feitas uma vez para
+    o período inteiro. Devolve ``(tipos, rateios, resumo)``: para cada mês
+    que tem rateios, os valores somados e as cotas do Fundo de Reserva (ver
+    ``_linhas_rateio``), e as linhas do resumo por unidade (totais por tipo
+    e consumo de gás e água), acumulado na mesma passada pelos rateios.
+    """
+    meses = sorted(meses)
+    tipos = list(
+        TipoDespesa.objects
+        .order_by('id')
+        .values_list('nome', flat=True)
+    )
+    fundo_tipo = TipoDespesa.objects.get(nome__iexact='Fundo de Reserva')
+    # só o Fundo de Reserva mais recente de cada mês entra no rateio
+    ultimo_fr = dict(
+        FundoReserva.objects
+        .filter(mes__in=[str(m) for m in meses], ano=ano, tipo=fundo_tipo)
+        .values('mes')
+        .annotate(ultimo=Max('id'))
+        .values_list('mes', 'ultimo')
+    )
+
+    valores = {m: {} for m in meses}    # mês → {unidade: {tipo: centavos}}
+    shares = {m: {} for m in meses}
+    rateio_gas = {}     # primeiro rateio de gás de cada unidade no mês
+    totais = {}         # (unidade, tipo) → soma no período, em centavos
+    total_unidade = {}
+    for mes_str, despesa_id, tipo_id, tipo, nome, centavos in (
+        Rateio.objects
+        .filter(despesa__ano=ano, despesa__mes__in=[str(m) for m in meses])
+        .order_by('id')
+        .values_list('despesa__mes', 'despesa_id', 'despesa__tipo_id',
+                     'despesa__tipo__nome', 'unidade__nome', _centavos())
+        .iterator()
+    ):
+        mes = int(mes_str)
+        if tipo.lower() == 'gás':
+            rateio_gas.setdefault((mes, nome), centavos)
+        if tipo_id == fundo_tipo.id and mes_str in ultimo_fr:
+            if despesa_id != ultimo_fr[mes_str]:
+                continue
+            shares[mes][nome] = centavos / 100
+        por_tipo = valores[mes].setdefault(nome, {})
+        por_tipo[tipo] = por_tipo.get(tipo, 0) + centavos
+        chave = (nome, tipo)
+        totais[chave] = totais.get(chave, 0) + centavos
+        total_unidade[nome] = total_unidade.get(nome, 0) + centavos
+
+    periodos = [(m, ano) for m in meses] + [_mes_anterior(meses[0], ano)]
+    leituras = _leituras_do_periodo(periodos, tipos=(Leitura.GAS, Leitura.AGUA))
+    gas  = _leituras(leituras, Leitura.GAS,  'unidade__nome')
+    agua = _leituras(leituras, Leitura.AGUA, 'unidade__nome')
+
+    rateios = {}
+    consumo = {}        # unidade → [gás, água] somados nos meses em que foi rateada
+    for mes in meses:
+        if not valores[mes]:
+            continue
+        rateios[mes] = valores[mes], shares[mes]
+        ant = _mes_anterior(mes, ano)
+        for nome in valores[mes]:
+            c = consumo.setdefault(nome, [Decimal('0'), Decimal('0')])
+            atual_g, ant_g = gas.get((nome, mes, ano)), gas.get((nome, *ant))
+            r = rateio_gas.get((mes, nome))
+            if r is not None and r > 0 and atual_g is not None:
+                c[0] += max(atual_g - ant_g, 0) if ant_g is not None else atual_g
+            atual_a, ant_a = agua.get((nome, mes, ano)), agua.get((nome, *ant))
+            if atual_a is not None and ant_a is not None:
+                c[1] += max(atual_a - ant_a, 0)
+
+    def resumo():
+        for nome in sorted(total_unidade):
+            gas_m3, agua_m3 = consumo.get(nome, (0, 0))
+            yield [
+                nome,
+                *(_ou_vazio(totais.get((nome, t), 0) / 100) for t in tipos),
+                total_unidade[nome] / 100,
+                round(float(gas_m3), 3),
+                round(float(agua_m3), 3),
+            ]
+
+    return tipos, rateios, resumo()
+
+
+def escrever_xlsx_periodo(destino, ano, meses, memoria_constante=False, diagnostico=None):
+    """
+    Grava em ``destino`` a planilha de vários meses de ``ano``: uma aba de
+    resumo do período por unidade e uma aba RATEIO por mês.
+    """
+    if diagnostico is None:
+        diagnostico = getattr(settings, 'XLSX_DIAGNOSTICO', False)
+    meses = sorted(meses)
+    titulo = f'XLSX {meses[0]:02d}-{meses[-1]:02d}/{ano}' if meses else f'XLSX {ano}'
+    with Diagnostico(diagnostico, titulo) as diag:
+        _escrever_xlsx_periodo(destino, ano, meses, memoria_constante, diag)
+
+
+def _escrever_xlsx_periodo(destino, ano, meses, memoria_constante, diag):
+    import xlsxwriter
+    tipos, rateios, resumo = _montar_periodo(ano, meses)
+    diag.marcar('dados do período')
+
+    workbook = xlsxwriter.Workbook(destino, {'constant_memory': memoria_constante})
+    currency_fmt      = workbook.add_format(FORMATO_MOEDA)
+    header_fmt        = workbook.add_format(FORMATO_TITULO)
+    bold_currency_fmt = workbook.add_format(FORMATO_MOEDA_NEGRITO)
+    consumo_fmt       = workbook.add_format(FORMATO_CONSUMO)
+    bold_consumo_fmt  = workbook.add_format({'bold': True, **FORMATO_CONSUMO})
+
+    nome = f"RESUMO {ano}"
+    colunas = ['Unidade'] + tipos + ['Total', 'Consumo Gás m³', 'Consumo Água m³']
+    ws = workbook.add_worksheet(nome)
+    n_moeda = len(colunas) - 3              # tipos + Total
+    ws.set_column(1, n_moeda, 15, currency_fmt)
+    ws.set_column(n_moeda + 1, n_moeda + 2, 16, consumo_fmt)
+    ws.set_row(0, None, header_fmt)
+    _, n = _escrever_aba(workbook, nome, colunas, resumo, na_rep='-')
+    _linha_total(ws, n,
+                 [bold_currency_fmt] * (n_moeda + 1) + [bold_consumo_fmt] * 2,
+                 header_fmt)
+    ws.activate()
+
+    for mes, (valores, shares) in rateios.items():
+        _aba_rateio(workbook, f"RATEIO {mes:02d}-{ano}", ['Unidade'] + tipos,
+                    _linhas_rateio(valores, tipos, shares),
+                    currency_fmt, header_fmt, bold_currency_fmt)
+    diag.marcar('escrita das abas')
+
+    _aba_diagnostico(workbook, diag)
+    workbook.close()
+    diag.marcar('fechamento do arquivo')
+
+
+# --- CSV dos rateios -------------------------------------------------------
+
+CSV_CABECALHO = ('unidade', 'tipo', 'mes', 'ano', 'valor', 'consumo')
+
+
+def nome_arquivo_csv(mes_inicial, ano_inicial, mes_final, ano_final):
+    return f'RATEIOS {mes_inicial:02d}_{ano_inicial}-{mes_final:02d}_{ano_final}.csv'
+
+
+def _filtro_periodo(mes_inicial, ano_inicial, mes_final, ano_final, prefixo=''):
+    """``Q`` dos meses de ``mes_inicial/ano_inicial`` a ``mes_final/ano_final``."""
+    return Q(**{f'{prefixo}periodo__range': (Periodo(mes_inicial, ano_inicial),
+                                             Periodo(mes_final, ano_final))})
+
+
+def _decimal_csv(valor):
+    # vírgula decimal e ";" como separador: abre direto no Excel em português
+    return '' if valor is None else str(valor).replace('.', ',')
+
+
+class _Eco:
+    """Pseudo-arquivo do csv.writer: devolve a linha em vez de guardá-la."""
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv_rateios(mes_inicial, ano_inicial, mes_final, ano_final, chunk_size=2000):
+    """
+    Gera, já formatadas em CSV, as linhas (unidade, tipo, mes, ano, valor,
+    consumo) dos rateios do período. Os rateios vêm do banco em lotes de
+    ``chunk_size`` com ``iterator()``, sem carregar o período inteiro.
+    """
+    escritor = csv.writer(_Eco(), delimiter=';')
+    # BOM: o Excel só reconhece o UTF-8 (acentos dos tipos) com ele
+    yield '\ufeff' + escritor.writerow(CSV_CABECALHO)
+    rateios = (
+        Rateio.objects
+        .filter(_filtro_periodo(mes_inicial, ano_inicial, mes_final, ano_final, 'despesa__'))
+        .annotate(mes_num=Cast('despesa__mes', IntegerField()))
+        .order_by('despesa__ano', 'mes_num', 'unidade__nome', 'despesa__tipo__nome', 'id')
+        .values_list('unidade__nome', 'despesa__tipo__nome', 'mes_num', 'despesa__ano',
+                     'valor', 'consumo')
+    )
+    for unidade, tipo, mes, ano, valor, consumo in rateios.iterator(chunk_size=chunk_size):
+        yield escritor.writerow(
+            (unidade, tipo, mes, ano, _decimal_csv(valor), _decimal_csv(consumo))
+        )
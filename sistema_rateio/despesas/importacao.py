@@ -0,0 +1,143 @@
+"""
+Importação de leituras de gás, água e energia de um CSV com as colunas
+``unidade;tipo;medidor;mes;ano;leitura`` (comando ``importar_leituras`` e
+página "Importar leituras" do admin).
+
+Todas as linhas são validadas em memória antes de gravar; se alguma tiver
+erro, nada é gravado. As válidas vão num único ``bulk_create`` com
+``update_conflicts``: a leitura já existente do mesmo medidor no mesmo mês
+é substituída.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import consumo
+from .models import Leitura, Unidade
+
+CSV_COLUNAS = ('unidade', 'tipo', 'medidor', 'mes', 'ano', 'leitura')
+
+# aceita o valor ("gas") e o rótulo ("Gás") do tipo
+TIPOS = {}
+for _valor, _rotulo in Leitura.TIPO_CHOICES:
+    TIPOS[_valor] = TIPOS[_rotulo.lower()] = _valor
+
+# cabe em DecimalField(max_digits=10, decimal_places=4)
+LEITURA_MAXIMA = Decimal('999999.9999')
+
+
+def ler_csv(conteudo):
+    """
+    Linhas do CSV (``bytes``) como dicionários. Aceita ``;`` (o do Excel em
+    português, com vírgula decimal) ou ``,`` como separador e UTF-8 (com ou
+    sem BOM) ou Windows-1252. ``ValueError`` se faltar alguma coluna.
+    """
+    try:
+        texto = conteudo.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        texto = conteudo.decode('cp1252')
+    primeira = texto.split('\n', 1)[0]
+    leitor = csv.DictReader(io.StringIO(texto), delimiter=';' if ';' in primeira else ',')
+    colunas = [(c or '').strip().lower() for c in leitor.fieldnames or ()]
+    faltando = [c for c in CSV_COLUNAS if c not in colunas]
+    if faltando:
+        raise ValueError(f"Faltam as colunas: {', '.join(faltando)} "
+                         f"(esperado: {';'.join(CSV_COLUNAS)}).")
+    leitor.fieldnames = colunas
+    return list(leitor)
+
+
+def _inteiro(texto, campo):
+    try:
+        return int(texto)
+    except ValueError:
+        raise ValueError(f"{campo} {texto!r} não é um número inteiro") from None
+
+
+def _validar_linha(linha, unidades):
+    """``Leitura`` (sem gravar) de uma linha do CSV, ou ``ValueError``."""
+    valores = {c: (linha.get(c) or '').strip() for c in CSV_COLUNAS}
+
+    unidade_id = unidades.get(valores['unidade'])
+    if unidade_id is None:
+        raise ValueError(f"unidade {valores['unidade']!r} não existe")
+
+    tipo = TIPOS.get(valores['tipo'].lower())
+    if tipo is None:
+        raise ValueError(f"tipo {valores['tipo']!r} inválido (gas, agua ou energia)")
+
+    medidor = _inteiro(valores['medidor'] or '0', 'medidor')
+    if tipo == Leitura.ENERGIA and medidor not in (1, 2):
+        raise ValueError("energia precisa do medidor 1 ou 2")
+    if tipo != Leitura.ENERGIA and medidor != 0:
+        raise ValueError(f"{tipo} tem um medidor só (deixe o medidor vazio)")
+
+    mes = _inteiro(valores['mes'], 'mês')
+    if not 1 <= mes <= 12:
+        raise ValueError(f"mês {mes} fora de 1–12")
+    ano = _inteiro(valores['ano'], 'ano')
+    if not 2000 <= ano <= 2100:
+        raise ValueError(f"ano {ano} fora de 2000–2100")
+
+    try:
+        leitura = Decimal(valores['leitura'].replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"leitura {valores['leitura']!r} não é um número") from None
+    if not leitura.is_finite() or not 0 <= leitura <= LEITURA_MAXIMA:
+        raise ValueError(f"leitura {valores['leitura']!r} fora de 0–{LEITURA_MAXIMA}")
+    if leitura != leitura.quantize(Decimal('0.0001')):
+        raise ValueError(f"leitura {valores['leitura']!r} com mais de 4 casas decimais")
+
+    return Leitura(unidade_id=unidade_id, tipo=tipo, medidor=medidor,
+                   mes=mes, ano=ano, leitura=leitura)
+
+
+def validar(linhas):
+    """
+    Valida as ``linhas`` (de ``ler_csv``) e devolve ``(leituras, erros)``:
+    os ``Leitura`` prontos para gravar e a lista ``[(numero_da_linha,
+    mensagem), ...]``. Só consulta o banco uma vez, para as unidades.
+    """
+    # unidade pelo nome; com nomes repetidos, vale a de menor id
+    unidades = {}
+    for unidade_id, nome in Unidade.objects.order_by('-id').values_list('id', 'nome'):
+        unidades[nome.strip()] = unidade_id
+
+    leituras, erros, vistas = [], [], {}
+    # a linha 1 do arquivo é o cabeçalho
+    for numero, linha in enumerate(linhas, start=2):
+        try:
+            leitura = _validar_linha(linha, unidades)
+        except ValueError as e:
+            erros.append((numero, str(e)))
+            continue
+        chave = (leitura.tipo, leitura.unidade_id, leitura.medidor, leitura.mes, leitura.ano)
+        if chave in vistas:
+            erros.append((numero, f"mesma leitura da linha {vistas[chave]}"))
+            continue
+        vistas[chave] = numero
+        leituras.append(leitura)
+    return leituras, erros
+
+
+def importar(linhas):
+    """
+    Valida e grava as ``linhas``; devolve ``(gravadas, erros)``. Com erro
+    em qualquer linha nada é gravado.
+    """
+    leituras, erros = validar(linhas)
+    if erros:
+        return 0, erros
+    with transaction.atomic():
+        Leitura.objects.bulk_create(
+            leituras,
+            update_conflicts=True,
+            unique_fields=['tipo', 'unidade', 'mes', 'ano', 'medidor'],
+            update_fields=['leitura'],
+        )
+        # o bulk_create não dispara os signals que mantêm o ConsumoMensal:
+        # refaz só as linhas dessas leituras e as do mês seguinte
+        consumo.atualizar_varios([consumo.chave_da_leitura(leitura) for leitura in leituras])
+    return len(leituras), []
@@ -0,0 +1,250 @@
+import io
+import json
+import random
+import time
+import tracemalloc
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template.loader import get_template, render_to_string
+from django.test.utils import CaptureQueriesContext, override_settings
+from weasyprint import HTML
+
+from despesas.boletos import (
+    BOLETO_CSS,
+    BOLETO_TEMPLATE,
+    BOLETOS_MES_TEMPLATE,
+    BASE,
+    base_url_boletos,
+    escrever_zip,
+    montar_contextos,
+)
+from despesas.models import (
+    Unidade,
+    TipoDespesa,
+    Despesa,
+    Rateio,
+    LeituraGas,
+    LeituraAgua,
+    FracaoPorTipoDespesa,
+)
+from despesas.renderizacao import RenderizadorBoletos
+
+
+def _renderizar_sem_reuso(contexto, css):
+    """Como os boletos eram gerados antes: CSS embutido no HTML e nada compartilhado."""
+    html = render_to_string(BOLETO_TEMPLATE, contexto)
+    html = html.replace('</head>', f'<style>{css}</style></head>', 1)
+    return HTML(string=html, base_url=base_url_boletos()).write_pdf()
+
+
+def _popular(n_unidades, n_tipos, mes, ano, semente=0):
+    """
+    Cria no banco (de teste) ``n_unidades`` unidades + a Sala e ``n_tipos``
+    tipos de despesa com rateio para o mês, além de gás, água, Fundo de
+    Reserva e leituras do mês e do anterior. Usa bulk_create, sem sinais.
+    """
+    rnd = random.Random(semente)
+    mes_ant, ano_ant = (mes - 1, ano) if mes > 1 else (12, ano - 1)
+
+    unidades = Unidade.objects.bulk_create(
+        [Unidade(nome=f"{i:04d}") for i in range(1, n_unidades + 1)]
+        + [Unidade(nome="Sala 01")]
+    )
+
+    nomes = [n for n in BASE if n != 'Água'] + [f"Despesa {i:03d}" for i in range(n_tipos)]
+    tipos = TipoDespesa.objects.bulk_create(
+        [TipoDespesa(nome=n) for n in nomes[:n_tipos]]
+        + [TipoDespesa(nome='Água'), TipoDespesa(nome='Gás'),
+           TipoDespesa(nome='Fundo de Reserva')]
+    )
+    fundo = tipos[-1]
+
+    despesas = Despesa.objects.bulk_create([
+        Despesa(tipo=t, mes=str(mes), ano=ano,
+                valor_total=Decimal(rnd.randint(100, 50000)))
+        for t in tipos if t is not fundo
+    ])
+    Rateio.objects.bulk_create([
+        Rateio(despesa=d, unidade=u,
+               valor=(d.valor_total / len(unidades)).quantize(Decimal('0.01')))
+        for d in despesas for u in unidades
+    ], batch_size=5000)
+
+    pct = (Decimal(1) / len(unidades)).quantize(Decimal('0.000000001'))
+    FracaoPorTipoDespesa.objects.bulk_create([
+        FracaoPorTipoDespesa(tipo_despesa=fundo, unidade=u, percentual=pct)
+        for u in unidades
+    ])
+
+    for modelo in (LeituraGas, LeituraAgua):
+        leituras = []
+        for u in unidades:
+            anterior = Decimal(rnd.randint(0, 5000))
+            leituras.append(modelo(unidade=u, mes=mes_ant, ano=ano_ant, leitura=anterior))
+            leituras.append(modelo(unidade=u, mes=mes, ano=ano,
+                                   leitura=anterior + Decimal(rnd.randint(0, 30))))
+        modelo.objects.bulk_create(leituras, batch_size=5000)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a geração dos boletos. Sem --suite: compara, com os dados do "
+        "mês informado, a renderização por unidade sem e com reaproveitamento "
+        "de CSS/fontes/imagens. Com --suite: gera dados num banco de teste "
+        "(10, 100 e 1000 unidades) e mede a geração completa do ZIP."
+    )
+
+    def add_arguments(self, parser):
+        hoje = date.today()
+        parser.add_argument('--mes', type=int, default=hoje.month)
+        parser.add_argument('--ano', type=int, default=hoje.year)
+        parser.add_argument(
+            '--repeticoes', type=int, default=1,
+            help="Quantas vezes renderizar cada unidade em cada modo (padrão: 1).",
+        )
+        parser.add_argument(
+            '--suite', action='store_true',
+            help="Roda a suíte com dados gerados num banco de teste (não toca no banco real).",
+        )
+        parser.add_argument(
+            '--unidades', default='10,100,1000',
+            help="Tamanhos da suíte, separados por vírgula (padrão: 10,100,1000).",
+        )
+        parser.add_argument(
+            '--tipos', type=int, default=12,
+            help="Tipos de despesa com rateio na suíte, além de gás e água (padrão: 12).",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Processos de renderização na suíte (padrão: 1).",
+        )
+        parser.add_argument('--json', dest='arquivo_json',
+                            help="Grava os resultados da suíte neste arquivo.")
+        parser.add_argument('--rotulo', default='',
+                            help="Identificação gravada no JSON (ex.: nome do branch).")
+
+    def handle(self, *args, **opts):
+        if opts['suite']:
+            return self._suite(opts)
+        return self._comparar_renderizacao(opts)
+
+    # --- comparação de renderização com os dados reais -------------------
+
+    def _comparar_renderizacao(self, opts):
+        contextos = montar_contextos(opts['mes'], opts['ano'])
+        if not contextos:
+            raise CommandError("Nenhuma unidade cadastrada.")
+        repeticoes = max(opts['repeticoes'], 1)
+        css = get_template(BOLETO_CSS).template.source
+
+        # aquece template e imports para não pesar na primeira medição
+        _renderizar_sem_reuso(contextos[0], css)
+
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            for contexto in contextos:
+                _renderizar_sem_reuso(contexto, css)
+        antes = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        renderizador = RenderizadorBoletos()
+        for _ in range(repeticoes):
+            for contexto in contextos:
+                renderizador(contexto)
+        depois = time.perf_counter() - inicio
+
+        # PDF único: todas as unidades num só documento
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            RenderizadorBoletos()(
+                {'boletos': contextos, 'mes': opts['mes'], 'ano': opts['ano']},
+                template=BOLETOS_MES_TEMPLATE,
+            )
+        unico = time.perf_counter() - inicio
+
+        n = len(contextos) * repeticoes
+        self.stdout.write(f"{len(contextos)} unidades × {repeticoes} repetição(ões), "
+                          f"{opts['mes']:02d}/{opts['ano']}")
+        self.stdout.write(f"  antes  (sem reaproveitamento): {antes * 1000 / n:8.1f} ms/unidade  "
+                          f"({antes:.2f}s)")
+        self.stdout.write(f"  depois (RenderizadorBoletos):  {depois * 1000 / n:8.1f} ms/unidade  "
+                          f"({depois:.2f}s)")
+        self.stdout.write(f"  PDF único (todas as unidades): {unico * 1000 / n:8.1f} ms/unidade  "
+                          f"({unico:.2f}s)")
+        if depois > 0:
+            self.stdout.write(self.style.SUCCESS(f"  ganho: {antes / depois:.2f}x"))
+
+    # --- suíte com dados gerados -----------------------------------------
+
+    def _medir(self, n_unidades, opts):
+        mes, ano = opts['mes'], opts['ano']
+        _popular(n_unidades, opts['tipos'], mes, ano)
+
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            contextos = montar_contextos(mes, ano)
+            fim_dados = time.perf_counter()
+            buffer = io.BytesIO()
+            escrever_zip(buffer, contextos, mes, ano, workers=opts['workers'])
+            fim = time.perf_counter()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'unidades':           n_unidades,
+            'tipos':              opts['tipos'],
+            'consultas':          len(consultas),
+            'tempo_total_s':      round(fim - inicio, 4),
+            'tempo_dados_s':      round(fim_dados - inicio, 4),
+            'tempo_render_s':     round(fim - fim_dados, 4),
+            'ms_por_unidade':     round((fim - inicio) * 1000 / len(contextos), 2),
+            'pico_memoria_bytes': pico,
+            'tamanho_zip_bytes':  buffer.getbuffer().nbytes,
+        }
+
+    def _suite(self, opts):
+        try:
+            tamanhos = [int(x) for x in opts['unidades'].split(',') if x.strip()]
+        except ValueError:
+            raise CommandError("--unidades deve ser uma lista de números, ex.: 10,100,1000")
+
+        resultados = []
+        nome_original = connection.settings_dict['NAME']
+        # banco de teste descartável: os dados gerados nunca vão para o banco real
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # cache de PDFs desligado: a ideia é medir a renderização
+            with override_settings(BOLETOS_CACHE_MAX_BYTES=0):
+                for n in tamanhos:
+                    self.stdout.write(f"{n} unidades...")
+                    call_command('flush', interactive=False, verbosity=0)
+                    r = self._medir(n, opts)
+                    resultados.append(r)
+                    self.stdout.write(
+                        f"  {r['consultas']} consultas | dados {r['tempo_dados_s']:.3f}s | "
+                        f"render {r['tempo_render_s']:.3f}s | {r['ms_por_unidade']:.1f} ms/unidade | "
+                        f"pico {r['pico_memoria_bytes'] / 1024 / 1024:.1f} MiB"
+                    )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            # com SQLite em memória o close() de dentro do destroy é ignorado;
+            # agora, com o nome original de volta, a conexão fecha de fato
+            connection.close()
+
+        if opts['arquivo_json']:
+            saida = {
+                'rotulo':     opts['rotulo'],
+                'executado':  datetime.now().isoformat(timespec='seconds'),
+                'mes':        opts['mes'],
+                'ano':        opts['ano'],
+                'workers':    opts['workers'],
+                'resultados': resultados,
+            }
+            with open(opts['arquivo_json'], 'w', encoding='utf-8') as f:
+                json.dump(saida, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {opts['arquivo_json']}"))
@@ -0,0 +1,84 @@
+import subprocess
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from despesas.conferencia import (
+    PASTA_REFERENCIA,
+    REVISAO_BASE,
+    capturar,
+    capturar_da_base,
+    com_base,
+    comparar,
+    gravar_referencia,
+    ler_tempos,
+    popular_dados_referencia,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as planilhas XLSX e os lançamentos dos boletos a partir de dados "
+        "fixos (num banco de teste) e compara célula a célula com os arquivos "
+        "de referência em despesas/referencia/. A referência é a saída da "
+        "versão anterior às otimizações: --base confere também que ela continua "
+        "igual à dessa versão e --gravar a regrava a partir dela."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gravar', action='store_true',
+                            help="Regrava os arquivos de referência com a saída da versão de "
+                                 "base (só a aba RESUMO, que ela não tinha, vem da atual) e "
+                                 "os tempos da versão atual.")
+        parser.add_argument('--base', action='store_true',
+                            help="Confere também a referência contra a saída da versão de base.")
+        parser.add_argument('--revisao', default=REVISAO_BASE,
+                            help=f"Commit da versão de base (padrão: {REVISAO_BASE}).")
+        parser.add_argument('--max-diferencas', type=int, default=30,
+                            help="Quantas diferenças listar (padrão: 30).")
+
+    def handle(self, *args, **opts):
+        nome_original = connection.settings_dict['NAME']
+        # banco de teste descartável: os dados fixos nunca vão para o banco real
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('flush', interactive=False, verbosity=0)
+            popular_dados_referencia()
+            # nada de cache nem de aba de diagnóstico: só a geração em si
+            with override_settings(BOLETOS_CACHE_MAX_BYTES=0):
+                dados, tempos = capturar()
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            # com SQLite em memória o close() de dentro do destroy é ignorado
+            connection.close()
+
+        base = None
+        if opts['gravar'] or opts['base']:
+            try:
+                base = capturar_da_base(opts['revisao'])
+            except (OSError, subprocess.CalledProcessError, RuntimeError) as e:
+                raise CommandError(f"Não foi possível gerar pela versão {opts['revisao']}: {e}")
+
+        if opts['gravar']:
+            gravar_referencia(com_base(dados, base), tempos)
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(dados)} arquivos de referência gravados em {PASTA_REFERENCIA}"))
+            return
+
+        referencia = ler_tempos()
+        for nome, segundos in tempos.items():
+            antes = referencia.get(nome)
+            comparacao = f"  (referência {antes:.3f}s)" if antes is not None else ""
+            self.stdout.write(f"  {nome:<22} {segundos:8.3f}s{comparacao}")
+
+        diferencas = comparar(dados)
+        if base is not None:
+            diferencas += [f"versão {opts['revisao']}: {linha}"
+                           for linha in comparar(base, so_abas_presentes=True)]
+        if diferencas:
+            for linha in diferencas[:opts['max_diferencas']]:
+                self.stdout.write(f"  {linha}")
+            raise CommandError(f"{len(diferencas)} diferença(s) em relação à referência.")
+        self.stdout.write(self.style.SUCCESS("Igual à referência."))
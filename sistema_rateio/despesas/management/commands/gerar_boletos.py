@@ -0,0 +1,132 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from despesas import pool_boletos
+from despesas.boletos import (
+    COMPRESSOES,
+    assinatura_do_mes,
+    gravar_arquivo_do_mes,
+    montar_contextos,
+    nome_arquivo_pdf_unico,
+    nome_arquivo_zip,
+)
+
+# guarda, por arquivo gerado, a assinatura do conteúdo usada para gerá-lo
+MANIFESTO = ".boletos.json"
+
+
+def _meses(valor):
+    """Interpreta ``--mes``: "3", "1-12", "1,4,7-9"."""
+    meses = set()
+    try:
+        for parte in valor.split(','):
+            parte = parte.strip()
+            if not parte:
+                continue
+            if '-' in parte:
+                ini, fim = (int(x) for x in parte.split('-', 1))
+                meses.update(range(ini, fim + 1))
+            else:
+                meses.add(int(parte))
+    except ValueError:
+        raise CommandError(f"--mes inválido: {valor!r} (ex.: 3, 1-12, 1,4,7-9)")
+    if not meses or not all(1 <= m <= 12 for m in meses):
+        raise CommandError(f"--mes inválido: {valor!r} (meses de 1 a 12)")
+    return sorted(meses)
+
+
+def _ler_manifesto(pasta):
+    try:
+        return json.loads((pasta / MANIFESTO).read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _gravar_manifesto(pasta, manifesto):
+    caminho = pasta / MANIFESTO
+    temporario = caminho.with_name(caminho.name + '.tmp')
+    temporario.write_text(json.dumps(manifesto, indent=2, sort_keys=True), encoding='utf-8')
+    temporario.replace(caminho)
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera os boletos de um ou mais meses direto em disco (um ZIP ou um PDF "
+        "único por mês), sem passar pelo admin. Meses cujos dados não mudaram "
+        "desde a última execução na mesma pasta são pulados."
+    )
+
+    def add_arguments(self, parser):
+        hoje = date.today()
+        parser.add_argument(
+            '--mes', default=str(hoje.month),
+            help="Mês ou meses: 3, 1-12 ou 1,4,7-9 (padrão: mês atual).",
+        )
+        parser.add_argument('--ano', type=int, default=hoje.year)
+        parser.add_argument('--out', required=True, help="Pasta onde gravar os arquivos.")
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'BOLETOS_WORKERS', 1),
+            help="Processos de renderização (padrão: BOLETOS_WORKERS).",
+        )
+        parser.add_argument('--formato', choices=['zip', 'pdf'], default='zip')
+        parser.add_argument('--compressao', choices=list(COMPRESSOES), default='stored',
+                            help="Compressão das entradas do ZIP (padrão: stored).")
+        parser.add_argument('--forcar', action='store_true',
+                            help="Gera todos os meses, mesmo os que não mudaram.")
+
+    def handle(self, *args, **opts):
+        ano, formato = opts['ano'], opts['formato']
+        workers = max(opts['workers'], 1)
+        compressao = COMPRESSOES[opts['compressao']]
+        pasta = Path(opts['out'])
+        pasta.mkdir(parents=True, exist_ok=True)
+        manifesto = _ler_manifesto(pasta)
+        nome_arquivo = nome_arquivo_pdf_unico if formato == 'pdf' else nome_arquivo_zip
+
+        # dados de todos os meses carregados aqui; os processos só renderizam
+        pendentes = []
+        for mes in _meses(opts['mes']):
+            contextos = montar_contextos(mes, ano)
+            nome = nome_arquivo(mes, ano)
+            assinatura = assinatura_do_mes(contextos, formato, compressao)
+            if (not opts['forcar'] and manifesto.get(nome) == assinatura
+                    and (pasta / nome).exists()):
+                self.stdout.write(f"{nome}: sem alterações, mantido.")
+                continue
+            pendentes.append((mes, nome, assinatura, contextos))
+
+        if not pendentes:
+            return
+
+        if workers == 1 or len(pendentes) == 1:
+            # um mês só: o paralelismo fica entre as unidades do mês
+            for mes, nome, assinatura, contextos in pendentes:
+                gravar_arquivo_do_mes(pasta / nome, contextos, mes, ano, formato,
+                                      workers=workers, compressao=compressao)
+                self._concluido(pasta, manifesto, nome, assinatura, len(contextos))
+            return
+
+        # vários meses: cada processo gera um mês inteiro
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(pendentes)), mp_context=ctx,
+                                 initializer=pool_boletos.iniciar) as pool:
+            futuros = [
+                (pool.submit(gravar_arquivo_do_mes, pasta / nome, contextos, mes, ano,
+                             formato, 1, compressao), nome, assinatura, len(contextos))
+                for mes, nome, assinatura, contextos in pendentes
+            ]
+            for futuro, nome, assinatura, n in futuros:
+                futuro.result()
+                self._concluido(pasta, manifesto, nome, assinatura, n)
+
+    def _concluido(self, pasta, manifesto, nome, assinatura, n_unidades):
+        # manifesto regravado a cada mês: uma falha no meio não perde os anteriores
+        manifesto[nome] = assinatura
+        _gravar_manifesto(pasta, manifesto)
+        self.stdout.write(self.style.SUCCESS(f"{nome}: {n_unidades} boleto(s) gerado(s)."))
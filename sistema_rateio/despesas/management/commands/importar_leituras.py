@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from despesas.importacao import CSV_COLUNAS, importar, ler_csv, validar
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa leituras de gás, água e energia de um CSV com as colunas "
+        f"{';'.join(CSV_COLUNAS)}. Valida todas as linhas antes de gravar: "
+        "com qualquer erro nada é gravado. Leituras que já existem (mesma "
+        "unidade, tipo, medidor e mês) são substituídas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do CSV.")
+        parser.add_argument('--so-validar', action='store_true',
+                            help="Só confere o arquivo, sem gravar nada.")
+
+    def handle(self, *args, **opts):
+        try:
+            with open(opts['arquivo'], 'rb') as f:
+                linhas = ler_csv(f.read())
+        except OSError as e:
+            raise CommandError(f"Não foi possível ler {opts['arquivo']}: {e}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if opts['so_validar']:
+            leituras, erros = validar(linhas)
+            gravadas = 0
+        else:
+            gravadas, erros = importar(linhas)
+        for numero, mensagem in erros:
+            self.stderr.write(f"  linha {numero}: {mensagem}")
+        if erros:
+            raise CommandError(f"{len(erros)} linha(s) com erro; nada foi gravado.")
+
+        if opts['so_validar']:
+            self.stdout.write(self.style.SUCCESS(f"{len(leituras)} leitura(s) válida(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{gravadas} leitura(s) gravada(s)."))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from despesas.tarefas import executar, marcar_interrompidas, reservar_proxima
+
+
+class Command(BaseCommand):
+    help = "Executa as tarefas em segundo plano (boletos, XLSX) enfileiradas pelo admin."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uma-vez', action='store_true',
+            help="Esvazia a fila e termina, em vez de continuar aguardando novas tarefas.",
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=2.0,
+            help="Segundos entre consultas à fila quando ela está vazia (padrão: 2).",
+        )
+
+    def handle(self, *args, **opts):
+        interrompidas = marcar_interrompidas()
+        if interrompidas:
+            self.stdout.write(self.style.WARNING(
+                f"{interrompidas} tarefa(s) interrompida(s) marcada(s) como erro."
+            ))
+
+        try:
+            while True:
+                tarefa = reservar_proxima()
+                if tarefa is None:
+                    if opts['uma_vez']:
+                        return
+                    time.sleep(opts['intervalo'])
+                    continue
+
+                self.stdout.write(f"Executando: {tarefa}")
+                executar(tarefa)
+                if tarefa.status == tarefa.CONCLUIDA:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"  concluída em {tarefa.duracao:.1f}s → {tarefa.arquivo}"
+                    ))
+                else:
+                    self.stderr.write(self.style.ERROR(
+                        f"  erro:\n{tarefa.erro}"
+                    ))
+        except KeyboardInterrupt:
+            self.stdout.write("Encerrando.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from despesas.consumo import reconstruir
+
+
+class Command(BaseCommand):
+    help = (
+        "Refaz a tabela de consumo mensal (ConsumoMensal) a partir de todas as "
+        "leituras de gás, água e energia. Só é preciso depois de alterar "
+        "leituras sem passar pelo save()/delete() (bulk_create, update, SQL)."
+    )
+
+    def handle(self, *args, **opts):
+        linhas = reconstruir()
+        self.stdout.write(self.style.SUCCESS(f"{linhas} linha(s) de consumo gravada(s)."))
@@ -0,0 +1,304 @@
+# Generated by Django 5.2 on 2026-10-16 22:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('despesas', '0006_leituraagua_leituraenergia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FundosCsv',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Fundos CSV',
+                'verbose_name_plural': 'Fundos CSV',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ParametroGas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.IntegerField()),
+                ('ano', models.IntegerField()),
+                ('recarga', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='R$ Recarga')),
+                ('kg', models.DecimalField(decimal_places=3, max_digits=12, verbose_name='KG')),
+                ('m3_kg', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='m³/kg')),
+                ('valor_m3', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='R$ por m³ Gás')),
+            ],
+            options={
+                'verbose_name': 'Parâmetro de Gás',
+                'verbose_name_plural': 'Parâmetros de Gás',
+            },
+        ),
+        migrations.CreateModel(
+            name='Boleto',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Boleto',
+                'verbose_name_plural': 'Boletos',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.unidade',),
+        ),
+        migrations.CreateModel(
+            name='DespesaAgua',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Parâmetro de Água',
+                'verbose_name_plural': 'Parâmetros de Água',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaAreasComuns',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Energia Áreas Comuns',
+                'verbose_name_plural': 'Energia Áreas Comuns',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaComSala',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Material/Serviço de Consumo (Com Sala)',
+                'verbose_name_plural': 'Material/Serviço de Consumo (Com Sala)',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaEnergia',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Parâmetro de Energia',
+                'verbose_name_plural': 'Parâmetros de Energia',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaGas',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Parâmetro de Gás',
+                'verbose_name_plural': 'Parâmetros de Gás',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaReparoComSala',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Reparos/Reforma (Com Sala)',
+                'verbose_name_plural': 'Reparos/Reforma (Com Sala)',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaReparoSemSala',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Reparos/Reforma (Sem Sala)',
+                'verbose_name_plural': 'Reparos/Reforma (Sem Sala)',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='DespesaSemSala',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Material Consumo (Sem Sala Comercial)',
+                'verbose_name_plural': 'Material Consumo (Sem Sala Comercial)',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='ExportarXlsx',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Exportar XLSX',
+                'verbose_name_plural': 'Exportar XLSX',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.CreateModel(
+            name='FundoReserva',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Fundo de Reserva',
+                'verbose_name_plural': 'Fundos de Reserva',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.despesa',),
+        ),
+        migrations.AlterModelOptions(
+            name='tipodespesa',
+            options={'ordering': ['ordem', 'nome']},
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='agua_leituras',
+            field=models.JSONField(blank=True, null=True, verbose_name='Leituras de Água'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='ativo',
+            field=models.BooleanField(default=True, help_text='Visível na lista de despesas'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='descricao',
+            field=models.CharField(blank=True, max_length=350, null=True, verbose_name='Descrição única'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='energia_leituras',
+            field=models.JSONField(blank=True, null=True, verbose_name='Leituras de Energia'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='fatura_agua',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='R$ Fatura'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='m3_total_agua',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True, verbose_name='m³ Total'),
+        ),
+        migrations.AddField(
+            model_name='despesa',
+            name='nf_info',
+            field=models.JSONField(blank=True, null=True, verbose_name='Notas Fiscais'),
+        ),
+        migrations.AddField(
+            model_name='rateio',
+            name='consumo',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Só para despesas de gás, a diferença de leituras', max_digits=10, null=True, verbose_name='Consumo (m³)'),
+        ),
+        migrations.AddField(
+            model_name='tipodespesa',
+            name='ordem',
+            field=models.PositiveIntegerField(default=100, help_text='Número para definir a posição (menor→aparece primeiro).'),
+        ),
+        migrations.AddField(
+            model_name='unidade',
+            name='fracao',
+            field=models.DecimalField(blank=True, decimal_places=8, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='FracaoPorTipoDespesa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('percentual', models.DecimalField(decimal_places=9, max_digits=10)),
+                ('tipo_despesa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fracoes', to='despesas.tipodespesa')),
+                ('unidade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='despesas.unidade')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LogAlteracao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=100)),
+                ('objeto_id', models.CharField(max_length=50)),
+                ('acao', models.CharField(max_length=20)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('descricao', models.TextField(blank=True)),
+                ('valor', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('mes_referencia', models.CharField(blank=True, max_length=2, null=True)),
+                ('ano_referencia', models.IntegerField(blank=True, null=True)),
+                ('snapshot', models.JSONField(blank=True, null=True)),
+                ('despesa', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='despesas.despesa')),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Log de Alteração',
+                'verbose_name_plural': 'Logs de Alterações',
+                'ordering': ['-criado_em'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ParametroAgua',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.IntegerField(choices=[(1, 1), (2, 2), (3, 3), (4, 4), (5, 5), (6, 6), (7, 7), (8, 8), (9, 9), (10, 10), (11, 11), (12, 12)])),
+                ('ano', models.IntegerField()),
+                ('fatura', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='R$ Fatura')),
+                ('m3_total', models.DecimalField(decimal_places=4, max_digits=10, verbose_name='m³ Total')),
+                ('valor_m3', models.DecimalField(decimal_places=4, max_digits=10, verbose_name='R$ por m³ Água')),
+            ],
+            options={
+                'verbose_name': 'Parâmetro de Água',
+                'verbose_name_plural': 'Parâmetros de Água',
+                'unique_together': {('mes', 'ano')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ParametroEnergia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.IntegerField()),
+                ('ano', models.IntegerField()),
+                ('fatura', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='R$ Fatura')),
+                ('kwh_total', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='kWh Total')),
+                ('custo_kwh', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='R$ Custo kWh')),
+                ('uso_kwh', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='R$ Uso kWh')),
+            ],
+            options={
+                'verbose_name': 'Parâmetro de Energia',
+                'verbose_name_plural': 'Parâmetros de Energia',
+                'unique_together': {('mes', 'ano')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-16 22:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('despesas', '0007_sincroniza_modelos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('boletos', 'Boletos'), ('xlsx', 'Planilha XLSX')], max_length=20)),
+                ('mes', models.PositiveSmallIntegerField()),
+                ('ano', models.IntegerField()),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('executando', 'Em execução'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('progresso', models.PositiveSmallIntegerField(default=0, verbose_name='Progresso (%)')),
+                ('erro', models.TextField(blank=True)),
+                ('arquivo', models.CharField(blank=True, max_length=255, verbose_name='Arquivo gerado')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Tarefa em segundo plano',
+                'verbose_name_plural': 'Tarefas em segundo plano',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'tipo', 'mes', 'ano'], name='despesas_ta_status_97fb91_idx')],
+            },
+        ),
+    ]
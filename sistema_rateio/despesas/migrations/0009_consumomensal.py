@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-16 23:22
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def preencher_consumo(apps, schema_editor):
+    from despesas.consumo import reconstruir
+    reconstruir(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('despesas', '0008_tarefa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('gas', 'Gás'), ('agua', 'Água'), ('energia', 'Energia')], max_length=10)),
+                ('medidor', models.PositiveSmallIntegerField(default=0)),
+                ('mes', models.IntegerField()),
+                ('ano', models.IntegerField()),
+                ('leitura_anterior', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('leitura_atual', models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True)),
+                ('consumo', models.DecimalField(decimal_places=4, default=Decimal('0'), help_text='Atual − anterior (nunca negativo); só a atual se não há anterior', max_digits=10)),
+                ('unidade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='despesas.unidade')),
+            ],
+            options={
+                'verbose_name': 'Consumo mensal',
+                'verbose_name_plural': 'Consumos mensais',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'ano', 'mes', 'unidade', 'medidor'), name='consumo_mensal_unico')],
+            },
+        ),
+        migrations.RunPython(preencher_consumo, migrations.RunPython.noop),
+    ]
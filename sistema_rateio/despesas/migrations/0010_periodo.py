@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-16 23:25
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('despesas', '0009_consumomensal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='despesa',
+            name='periodo',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('ano'), '*', models.Value(12)), '+', django.db.models.functions.comparison.Cast(models.F('mes'), models.IntegerField())), '-', models.Value(1)), output_field=models.IntegerField()),
+        ),
+        migrations.AddField(
+            model_name='leituraagua',
+            name='periodo',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('ano'), '*', models.Value(12)), '+', models.F('mes')), '-', models.Value(1)), output_field=models.IntegerField()),
+        ),
+        migrations.AddField(
+            model_name='leituraenergia',
+            name='periodo',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('ano'), '*', models.Value(12)), '+', models.F('mes')), '-', models.Value(1)), output_field=models.IntegerField()),
+        ),
+        migrations.AddField(
+            model_name='leituragas',
+            name='periodo',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('ano'), '*', models.Value(12)), '+', models.F('mes')), '-', models.Value(1)), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['tipo', 'periodo'], name='despesas_de_tipo_id_2f82ff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='despesa',
+            index=models.Index(fields=['periodo'], name='despesas_de_periodo_ae2d4d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leituraagua',
+            index=models.Index(fields=['unidade', 'periodo'], name='despesas_le_unidade_60fafe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leituraagua',
+            index=models.Index(fields=['periodo'], name='despesas_le_periodo_e9109e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leituraenergia',
+            index=models.Index(fields=['unidade', 'periodo', 'medidor'], name='despesas_le_unidade_e201c2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leituraenergia',
+            index=models.Index(fields=['periodo'], name='despesas_le_periodo_8cd320_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leituragas',
+            index=models.Index(fields=['unidade', 'periodo'], name='despesas_le_unidade_7b230c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leituragas',
+            index=models.Index(fields=['periodo'], name='despesas_le_periodo_d39014_idx'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2 on 2026-10-16 23:28
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+MODELOS_ANTIGOS = (('gas', 'LeituraGas'), ('agua', 'LeituraAgua'), ('energia', 'LeituraEnergia'))
+
+
+def copiar_leituras(apps, schema_editor):
+    # as três tabelas antigas viram linhas de Leitura com o tipo no lugar do modelo
+    Leitura = apps.get_model('despesas', 'Leitura')
+    for tipo, nome_modelo in MODELOS_ANTIGOS:
+        modelo = apps.get_model('despesas', nome_modelo)
+        Leitura.objects.bulk_create([
+            Leitura(tipo=tipo, unidade_id=antiga.unidade_id, medidor=getattr(antiga, 'medidor', 0),
+                    mes=antiga.mes, ano=antiga.ano, leitura=antiga.leitura)
+            for antiga in modelo.objects.order_by('id')
+        ], batch_size=1000)
+
+
+def devolver_leituras(apps, schema_editor):
+    Leitura = apps.get_model('despesas', 'Leitura')
+    for tipo, nome_modelo in MODELOS_ANTIGOS:
+        modelo = apps.get_model('despesas', nome_modelo)
+        campos = ['unidade_id', 'mes', 'ano', 'leitura'] + (['medidor'] if tipo == 'energia' else [])
+        modelo.objects.bulk_create([
+            modelo(**dict(zip(campos, valores)))
+            for valores in Leitura.objects.filter(tipo=tipo).order_by('id').values_list(*campos)
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('despesas', '0010_periodo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leitura',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('gas', 'Gás'), ('agua', 'Água'), ('energia', 'Energia')], editable=False, max_length=10)),
+                ('medidor', models.PositiveSmallIntegerField(choices=[(0, 'Único'), (1, 'Medidor 1'), (2, 'Medidor 2')], default=0)),
+                ('mes', models.IntegerField()),
+                ('ano', models.IntegerField()),
+                ('leitura', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('periodo', models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('ano'), '*', models.Value(12)), '+', models.F('mes')), '-', models.Value(1)), output_field=models.IntegerField())),
+                ('unidade', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='despesas.unidade')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['periodo', 'tipo'], name='despesas_le_periodo_e26c00_idx'),
+                    models.Index(fields=['unidade', 'periodo', 'medidor'], name='despesas_le_unidade_e0fbb5_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('tipo', 'unidade', 'mes', 'ano', 'medidor'), name='leitura_unica'),
+                ],
+            },
+        ),
+        migrations.RunPython(copiar_leituras, devolver_leituras),
+        migrations.DeleteModel(
+            name='LeituraAgua',
+        ),
+        migrations.DeleteModel(
+            name='LeituraEnergia',
+        ),
+        migrations.DeleteModel(
+            name='LeituraGas',
+        ),
+        migrations.CreateModel(
+            name='LeituraAgua',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.leitura', models.Model),
+        ),
+        migrations.CreateModel(
+            name='LeituraEnergia',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.leitura', models.Model),
+        ),
+        migrations.CreateModel(
+            name='LeituraGas',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('despesas.leitura', models.Model),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-16 23:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def encerrar_duplicadas(apps, schema_editor):
+    # das tarefas ativas iguais criadas antes da constraint, fica a mais antiga
+    Tarefa = apps.get_model('despesas', 'Tarefa')
+    vistas = set()
+    for tarefa in Tarefa.objects.filter(status__in=['pendente', 'executando']).order_by('criado_em', 'id'):
+        chave = (tarefa.tipo, tarefa.mes, tarefa.ano, repr(tarefa.parametros))
+        if chave in vistas:
+            tarefa.status = 'erro'
+            tarefa.erro = "Tarefa duplicada (encerrada na migração)."
+            tarefa.save(update_fields=['status', 'erro'])
+        vistas.add(chave)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('despesas', '0011_leitura'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(encerrar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tarefa',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pendente', 'executando'])), fields=('tipo', 'mes', 'ano', 'parametros'), name='tarefa_ativa_unica'),
+        ),
+    ]
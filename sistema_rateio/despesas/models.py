@@ -1,9 +1,12 @@
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Case, F, Sum, Value, When, Window
+from django.db.models.functions import Greatest, Lag
 from decimal import Decimal
 from django.db.models import JSONField
 from django.conf import settings
 
+from .periodo import expressao_periodo
+
 MESES_CHOICES = [
     ('1', 'Janeiro'), ('2', 'Fevereiro'), ('3', 'Março'),
     ('4', 'Abril'), ('5', 'Maio'), ('6', 'Junho'),
@@ -33,29 +36,139 @@ class Unidade(models.Model):
     def __str__(self):
         return self.nome
 
-class LeituraGas(models.Model):
+class LeituraQuerySet(models.QuerySet):
+
+    def com_consumo(self, periodos):
+        """
+        Leituras de ``periodos`` (``(inicio, fim)``, como em ``periodo__range``)
+        com ``leitura_anterior`` (a do mesmo medidor no mês anterior, ou
+        ``None``) e ``consumo`` (atual − anterior, nunca negativo; sem
+        anterior, a própria atual), calculados numa consulta só com
+        ``LAG`` por unidade e medidor.
+
+        A janela só enxerga as linhas deste queryset: filtre unidade, tipo
+        ou medidor antes, mas não mês/ano (o mês anterior sumiria da conta).
+        """
+        inicio, fim = periodos
+        janela = dict(partition_by=[F('tipo'), F('unidade_id'), F('medidor')],
+                      order_by=F('periodo').asc())
+        decimal = models.DecimalField(max_digits=10, decimal_places=4)
+        return (
+            self.filter(periodo__range=(inicio - 1, fim))
+            .annotate(periodo_anterior=Window(Lag('periodo'), **janela))
+            .annotate(
+                leitura_anterior=Case(
+                    When(periodo_anterior=F('periodo') - 1,
+                         then=Window(Lag('leitura'), **janela)),
+                    output_field=decimal,
+                ),
+            )
+            .annotate(
+                consumo=Case(
+                    When(leitura_anterior__isnull=True, then=F('leitura')),
+                    default=Greatest(F('leitura') - F('leitura_anterior'), Value(0)),
+                    output_field=decimal,
+                ),
+            )
+            # as leituras do mês antes de ``inicio`` só entram como anterior;
+            # são sempre as primeiras da partição. O filtro usa a janela para
+            # ser aplicado depois dela (e não no WHERE, antes do LAG)
+            .exclude(periodo=inicio - 1, periodo_anterior__isnull=True)
+        )
+
+
+class Leitura(models.Model):
+    """
+    Leituras de gás, água e energia numa tabela só, separadas por ``tipo``.
+    O dia a dia usa os proxies ``LeituraGas``, ``LeituraAgua`` e
+    ``LeituraEnergia``; aqui dá para ler todos os medidores de um mês numa
+    consulta (``Leitura.objects.filter(periodo=...)``).
+    """
+    GAS     = 'gas'
+    AGUA    = 'agua'
+    ENERGIA = 'energia'
+    TIPO_CHOICES = [
+        (GAS,     'Gás'),
+        (AGUA,    'Água'),
+        (ENERGIA, 'Energia'),
+    ]
+    MEDIDOR_CHOICES = (
+        (0, "Único"),
+        (1, "Medidor 1"),
+        (2, "Medidor 2"),
+    )
+
     unidade = models.ForeignKey(Unidade, on_delete=models.CASCADE)
+    tipo    = models.CharField(max_length=10, choices=TIPO_CHOICES, editable=False)
+    # gás e água têm um medidor só: 0
+    medidor = models.PositiveSmallIntegerField(choices=MEDIDOR_CHOICES, default=0)
     mes     = models.IntegerField()
     ano     = models.IntegerField()
     leitura = models.DecimalField(max_digits=10, decimal_places=4)
+    # ano * 12 + mes - 1, calculado pelo banco (ver periodo.Periodo)
+    periodo = models.GeneratedField(
+        expression=expressao_periodo(), output_field=models.IntegerField(), db_persist=True,
+    )
+
+    objects = LeituraQuerySet.as_manager()
 
     class Meta:
-        unique_together = ('unidade', 'mes', 'ano')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tipo', 'unidade', 'mes', 'ano', 'medidor'],
+                name='leitura_unica',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['periodo', 'tipo']),
+            models.Index(fields=['unidade', 'periodo', 'medidor']),
+        ]
 
     def __str__(self):
         return f"{self.unidade.nome} - {self.mes}/{self.ano} - {self.leitura}"
 
-class LeituraAgua(models.Model):
-    unidade = models.ForeignKey(Unidade, on_delete=models.CASCADE)
-    mes     = models.IntegerField()
-    ano     = models.IntegerField()
-    leitura = models.DecimalField(max_digits=10, decimal_places=4)
+
+class LeiturasDoTipo(models.Manager.from_queryset(LeituraQuerySet)):
+    """Manager dos proxies de ``Leitura``: só as leituras do ``TIPO`` do modelo."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(tipo=self.model.TIPO)
+
+
+class _LeituraDoTipo(models.Model):
+    """Base dos proxies ``LeituraGas``, ``LeituraAgua`` e ``LeituraEnergia``."""
+    TIPO = None
+
+    objects = LeiturasDoTipo()
 
     class Meta:
-        unique_together = ('unidade','mes','ano')
+        abstract = True
 
-    def __str__(self):
-        return f"{self.unidade.nome} - {self.mes}/{self.ano} - {self.leitura}"
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # vale também para bulk_create, que não passa pelo save()
+        if not self.__dict__.get('tipo'):
+            self.tipo = self.TIPO
+
+    def validate_constraints(self, exclude=None):
+        # tipo (e medidor, em gás e água) não vêm do formulário, mas contam
+        # na unicidade: sem isto a duplicata só apareceria como IntegrityError
+        exclude = set(exclude or ()) - {'tipo', 'medidor'}
+        super().validate_constraints(exclude=exclude)
+
+
+class LeituraGas(_LeituraDoTipo, Leitura):
+    TIPO = Leitura.GAS
+
+    class Meta:
+        proxy = True
+
+
+class LeituraAgua(_LeituraDoTipo, Leitura):
+    TIPO = Leitura.AGUA
+
+    class Meta:
+        proxy = True
 
 class TipoDespesa(models.Model):
     nome = models.CharField(max_length=100)
@@ -110,6 +223,19 @@ class Despesa(models.Model):
     energia_leituras = JSONField("Leituras de Energia", blank=True, null=True)
     nf_info = JSONField("Notas Fiscais", blank=True, null=True)
 
+    # ano * 12 + mes - 1, calculado pelo banco (ver periodo.Periodo); o mês
+    # aqui é texto, por isso o cast
+    periodo = models.GeneratedField(
+        expression=expressao_periodo(mes_texto=True),
+        output_field=models.IntegerField(), db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tipo', 'periodo']),
+            models.Index(fields=['periodo']),
+        ]
+
     def save(self, *args, **kwargs):
         """Reativa registro inativo caso já exista para o mesmo tipo/mês/ano."""
         if not self.pk:
@@ -142,28 +268,14 @@ class Despesa(models.Model):
         except (TypeError, ValueError):
             return None
 
-        # calcula mês/ano anterior
-        if mes_int > 1:
-            mes_ant, ano_ant = mes_int - 1, ano_int
-        else:
-            mes_ant, ano_ant = 12, ano_int - 1
-
+        # leituras anterior e atual de cada medidor, numa consulta só
         total = 0
-        from .models import LeituraEnergia, Unidade
-
-        for u in Unidade.objects.all():
-            for medidor in (1, 2):
-                ant = LeituraEnergia.objects.filter(
-                    unidade=u, medidor=medidor,
-                    mes=mes_ant, ano=ano_ant
-                ).first()
-                atu = LeituraEnergia.objects.filter(
-                    unidade=u, medidor=medidor,
-                    mes=mes_int, ano=ano_int
-                ).first()
-                la = float(ant.leitura) if ant else 0
-                lk = float(atu.leitura) if atu else 0
-                total += (lk - la)
+        for ant, atu in ConsumoMensal.objects.filter(
+            tipo=ConsumoMensal.ENERGIA, mes=mes_int, ano=ano_int, medidor__in=(1, 2),
+        ).values_list('leitura_anterior', 'leitura_atual'):
+            la = float(ant) if ant is not None else 0
+            lk = float(atu) if atu is not None else 0
+            total += (lk - la)
 
         return round(total, 4)
 
@@ -338,23 +450,54 @@ class Rateio(models.Model):
     def __str__(self):
         return f"{self.despesa.tipo.nome} — {self.unidade.nome} — R$ {self.valor:.2f}"
 
-class LeituraEnergia(models.Model):
-    MEDIDOR_CHOICES = (
-        (1, "Medidor 1"),
-        (2, "Medidor 2"),
-    )
+class LeituraEnergia(_LeituraDoTipo, Leitura):
+    TIPO = Leitura.ENERGIA
+    MEDIDOR_CHOICES = Leitura.MEDIDOR_CHOICES[1:]
+
+    class Meta:
+        proxy = True
+
+    def __str__(self):
+        return f"{self.unidade.nome} - M{self.medidor}: {self.leitura}"
+
+class ConsumoMensal(models.Model):
+    """
+    Leitura anterior, leitura atual e consumo de cada medidor por unidade e
+    mês, mantidos por ``consumo.atualizar`` sempre que uma leitura de gás,
+    água ou energia é gravada ou apagada (ver ``signals``). Há linha quando
+    existe a leitura do mês ou a do mês anterior.
+    """
+    GAS     = Leitura.GAS
+    AGUA    = Leitura.AGUA
+    ENERGIA = Leitura.ENERGIA
+    TIPO_CHOICES = Leitura.TIPO_CHOICES
 
     unidade = models.ForeignKey(Unidade, on_delete=models.CASCADE)
+    tipo    = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # gás e água têm um medidor só: 0
+    medidor = models.PositiveSmallIntegerField(default=0)
     mes     = models.IntegerField()
     ano     = models.IntegerField()
-    leitura = models.DecimalField(max_digits=10, decimal_places=4)
-    medidor = models.IntegerField(choices=MEDIDOR_CHOICES)
+    leitura_anterior = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
+    leitura_atual    = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
+    consumo = models.DecimalField(
+        max_digits=10, decimal_places=4, default=Decimal('0'),
+        help_text="Atual − anterior (nunca negativo); só a atual se não há anterior"
+    )
 
     class Meta:
-        unique_together = ('unidade', 'mes', 'ano', 'medidor')
+        verbose_name = "Consumo mensal"
+        verbose_name_plural = "Consumos mensais"
+        constraints = [
+            # também é o índice das consultas "consumo do mês"
+            models.UniqueConstraint(
+                fields=['tipo', 'ano', 'mes', 'unidade', 'medidor'],
+                name='consumo_mensal_unico',
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.unidade.nome} - M{self.medidor}: {self.leitura}"
+        return f"{self.unidade.nome} - {self.get_tipo_display()} {self.mes}/{self.ano}: {self.consumo}"
 
 class Boleto(Unidade):
     class Meta:
@@ -470,3 +613,82 @@ class LogAlteracao(models.Model):
             # Converte MESES_CHOICES para um dicionário para busca fácil
             return dict(MESES_CHOICES).get(self.mes_referencia)
         return ""
+
+
+class Tarefa(models.Model):
+    """
+    Geração demorada (ZIP de boletos, planilha XLSX) executada fora da
+    requisição pelo comando ``processar_tarefas``.
+    """
+    BOLETOS = 'boletos'
+    XLSX    = 'xlsx'
+    TIPO_CHOICES = [
+        (BOLETOS, 'Boletos'),
+        (XLSX,    'Planilha XLSX'),
+    ]
+
+    PENDENTE   = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDA  = 'concluida'
+    ERRO       = 'erro'
+    STATUS_CHOICES = [
+        (PENDENTE,   'Na fila'),
+        (EXECUTANDO, 'Em execução'),
+        (CONCLUIDA,  'Concluída'),
+        (ERRO,       'Erro'),
+    ]
+    # na fila ou em execução: no máximo uma por tipo/mês/ano/parâmetros
+    ATIVAS = [PENDENTE, EXECUTANDO]
+
+    tipo       = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    mes        = models.PositiveSmallIntegerField()
+    ano        = models.IntegerField()
+    parametros = models.JSONField(default=dict, blank=True)
+
+    status    = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    progresso = models.PositiveSmallIntegerField("Progresso (%)", default=0)
+    erro      = models.TextField(blank=True)
+    arquivo   = models.CharField("Arquivo gerado", max_length=255, blank=True)
+
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name="Usuário",
+    )
+    criado_em    = models.DateTimeField(auto_now_add=True)
+    iniciado_em  = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarefa em segundo plano"
+        verbose_name_plural = "Tarefas em segundo plano"
+        ordering = ["-criado_em"]
+        indexes = [
+            models.Index(fields=['status', 'tipo', 'mes', 'ano']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['tipo', 'mes', 'ano', 'parametros'],
+                condition=models.Q(status__in=['pendente', 'executando']),
+                name='tarefa_ativa_unica',
+            ),
+        ]
+
+    def __str__(self):
+        periodo = f"{self.mes:02d}"
+        if self.parametros.get('mes_final'):
+            periodo += f"-{self.parametros['mes_final']:02d}"
+        return f"{self.get_tipo_display()} {periodo}/{self.ano} ({self.get_status_display()})"
+
+    @property
+    def finalizada(self):
+        return self.status in (self.CONCLUIDA, self.ERRO)
+
+    @property
+    def duracao(self):
+        """Tempo de execução em segundos (ou ``None`` se ainda não terminou)."""
+        if self.iniciado_em and self.concluido_em:
+            return (self.concluido_em - self.iniciado_em).total_seconds()
+        return None
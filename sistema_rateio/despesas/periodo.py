@@ -0,0 +1,52 @@
+"""
+Mês/ano como um inteiro só: ``ano * 12 + mes - 1``.
+
+É o valor da coluna ``periodo`` de ``Despesa`` e das leituras, calculada
+pelo próprio banco. Meses seguidos são inteiros seguidos, então "mês
+anterior" é ``periodo - 1`` (também na virada do ano) e um intervalo de
+meses é um ``periodo__range``.
+"""
+from django.db.models import F, IntegerField
+from django.db.models.functions import Cast
+
+
+class Periodo(int):
+    """
+    ``Periodo(3, 2025)`` é um ``int`` e pode ir direto num filtro
+    (``periodo=p``, ``periodo__range=(p.anterior(), p)``)::
+
+        >>> p = Periodo(1, 2025)
+        >>> p.anterior().mes, p.anterior().ano
+        (12, 2024)
+    """
+
+    def __new__(cls, mes, ano):
+        return super().__new__(cls, int(ano) * 12 + int(mes) - 1)
+
+    @classmethod
+    def do_inteiro(cls, valor):
+        ano, mes = divmod(int(valor), 12)
+        return cls(mes + 1, ano)
+
+    @property
+    def mes(self):
+        return int(self) % 12 + 1
+
+    @property
+    def ano(self):
+        return int(self) // 12
+
+    def anterior(self, meses=1):
+        return Periodo.do_inteiro(int(self) - meses)
+
+    def seguinte(self, meses=1):
+        return Periodo.do_inteiro(int(self) + meses)
+
+    def __repr__(self):
+        return f"Periodo({self.mes}, {self.ano})"
+
+
+def expressao_periodo(mes='mes', ano='ano', mes_texto=False):
+    """Expressão do banco para a coluna ``periodo`` (``GeneratedField``)."""
+    mes = Cast(F(mes), IntegerField()) if mes_texto else F(mes)
+    return F(ano) * 12 + mes - 1
@@ -0,0 +1,24 @@
+"""
+Funções executadas nos processos filhos da renderização de boletos.
+
+Processos criados com "spawn" importam o initializer antes de configurar o
+Django, por isso este módulo não pode importar os models (nem ``boletos``)
+no topo.
+"""
+import django
+from django.apps import apps
+
+# renderizador de cada processo do pool, criado no initializer
+_renderizador = None
+
+
+def iniciar():
+    global _renderizador
+    if not apps.ready:
+        django.setup()
+    from .renderizacao import RenderizadorBoletos
+    _renderizador = RenderizadorBoletos()
+
+
+def renderizar(contexto):
+    return _renderizador(contexto)
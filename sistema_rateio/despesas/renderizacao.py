@@ -0,0 +1,82 @@
+"""
+Renderização dos boletos em PDF com o WeasyPrint.
+
+Fica num módulo à parte para que o WeasyPrint (pesado de importar) só seja
+carregado por quem realmente gera PDFs, e não em todo processo que importa
+o admin ou os comandos.
+"""
+import mimetypes
+from pathlib import Path
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+from .boletos import BOLETO_CSS, BOLETO_TEMPLATE, base_url_boletos
+
+
+class FetcherEstaticos(URLFetcher):
+    """
+    Serve da memória os arquivos estáticos usados pelo boleto (logos): cada
+    arquivo é lido do disco uma única vez por lote. URLs fora de
+    ``STATIC_ROOT`` seguem o caminho normal do WeasyPrint.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._arquivos = {}
+
+    def fetch(self, url, headers=None):
+        if not url.startswith('file:'):
+            return super().fetch(url, headers)
+        caminho = Path(url2pathname(urlsplit(url).path))
+        if not caminho.is_relative_to(settings.STATIC_ROOT):
+            return super().fetch(url, headers)
+
+        if caminho not in self._arquivos:
+            try:
+                self._arquivos[caminho] = caminho.read_bytes()
+            except OSError:
+                # guarda a falha também, para não tentar de novo a cada unidade
+                self._arquivos[caminho] = None
+
+        dados = self._arquivos[caminho]
+        if dados is None:
+            raise FileNotFoundError(url)
+        tipo = mimetypes.guess_type(caminho.name)[0] or 'application/octet-stream'
+        return URLFetcherResponse(url, dados, {'Content-Type': tipo})
+
+
+class RenderizadorBoletos:
+    """
+    Renderiza boletos reaproveitando, entre as unidades de um mesmo lote, a
+    folha de estilo já interpretada, a configuração de fontes, as imagens
+    decodificadas e os arquivos estáticos lidos do disco.
+    """
+
+    def __init__(self):
+        self.font_config = FontConfiguration()
+        self.url_fetcher = FetcherEstaticos()
+        self.cache_imagens = {}
+        self.css = CSS(
+            string=get_template(BOLETO_CSS).template.source,
+            base_url=base_url_boletos(),
+            url_fetcher=self.url_fetcher,
+            font_config=self.font_config,
+        )
+
+    def __call__(self, contexto, template=BOLETO_TEMPLATE):
+        html = render_to_string(template, contexto)
+        return HTML(
+            string=html,
+            base_url=base_url_boletos(),
+            url_fetcher=self.url_fetcher,
+        ).write_pdf(
+            stylesheets=[self.css],
+            font_config=self.font_config,
+            cache=self.cache_imagens,
+        )
@@ -1,5 +1,5 @@
 # despesas/signals.py
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from decimal import Decimal, ROUND_HALF_UP
 from django.db import transaction
@@ -13,8 +13,11 @@ from .models import (
     FracaoPorTipoDespesa,
     Unidade,
     LeituraEnergia,
-    LeituraAgua
+    LeituraAgua,
+    LeituraGas,
+    Leitura,
 )
+from . import consumo
 
 BASE_TIPOS = [
     'Reparos/Reforma',
@@ -284,3 +287,34 @@ def criar_energia_areas_comuns(sender, instance, created, **kwargs):
                 unidade=unidade_obj,
                 valor=valor_unitario
             )
+
+
+# --- tabela ConsumoMensal ---
+
+@receiver(pre_save, sender=Leitura)
+@receiver(pre_save, sender=LeituraGas)
+@receiver(pre_save, sender=LeituraAgua)
+@receiver(pre_save, sender=LeituraEnergia)
+def guardar_chave_antiga_da_leitura(sender, instance, **kwargs):
+    # se a edição mudar unidade, mês ou medidor, o consumo antigo também muda
+    instance._chave_consumo_antiga = None
+    if instance.pk:
+        antiga = sender.objects.filter(pk=instance.pk).first()
+        if antiga:
+            instance._chave_consumo_antiga = consumo.chave_da_leitura(antiga)
+
+
+@receiver(post_save, sender=Leitura)
+@receiver(post_save, sender=LeituraGas)
+@receiver(post_save, sender=LeituraAgua)
+@receiver(post_save, sender=LeituraEnergia)
+@receiver(post_delete, sender=Leitura)
+@receiver(post_delete, sender=LeituraGas)
+@receiver(post_delete, sender=LeituraAgua)
+@receiver(post_delete, sender=LeituraEnergia)
+def atualizar_consumo_mensal(sender, instance, **kwargs):
+    chave = consumo.chave_da_leitura(instance)
+    consumo.atualizar(*chave)
+    antiga = getattr(instance, '_chave_consumo_antiga', None)
+    if antiga and antiga != chave:
+        consumo.atualizar(*antiga)
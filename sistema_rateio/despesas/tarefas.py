@@ -0,0 +1,179 @@
+"""
+Fila de tarefas em segundo plano, guardada no próprio banco (modelo
+``Tarefa``).
+
+O admin só enfileira; quem executa é o comando ``processar_tarefas``, que
+grava o arquivo gerado em ``TAREFAS_DIR`` para ser baixado depois.
+"""
+import logging
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .boletos import (
+    COMPRESSOES,
+    gerar_pdf_unico,
+    gerar_zip_de_boletos,
+    nome_arquivo_pdf_unico,
+    nome_arquivo_zip,
+)
+from .exportacao import (
+    escrever_planilha,
+    nome_arquivo_xlsx,
+    nome_arquivo_xlsx_periodo,
+)
+from .models import Tarefa
+
+logger = logging.getLogger(__name__)
+
+def diretorio_tarefas():
+    pasta = Path(getattr(settings, 'TAREFAS_DIR', settings.DATA_DIR / 'tarefas'))
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta
+
+
+def nome_download(tarefa):
+    if tarefa.tipo == Tarefa.BOLETOS:
+        if tarefa.parametros.get('formato') == 'pdf':
+            return nome_arquivo_pdf_unico(tarefa.mes, tarefa.ano)
+        return nome_arquivo_zip(tarefa.mes, tarefa.ano)
+    if tarefa.parametros.get('mes_final'):
+        return nome_arquivo_xlsx_periodo(tarefa.mes, tarefa.parametros['mes_final'], tarefa.ano)
+    return nome_arquivo_xlsx(tarefa.mes, tarefa.ano)
+
+
+def caminho_arquivo(tarefa):
+    return diretorio_tarefas() / tarefa.arquivo if tarefa.arquivo else None
+
+
+def enfileirar(tipo, mes, ano, parametros=None, usuario=None):
+    """
+    Coloca uma tarefa na fila e devolve ``(tarefa, criada)``.
+
+    Se já existe uma tarefa idêntica na fila ou em execução, ela é
+    reaproveitada em vez de gerar o mesmo arquivo duas vezes. Quem garante
+    isso é a constraint ``tarefa_ativa_unica``: de dois pedidos simultâneos,
+    o segundo INSERT falha e devolve a tarefa do primeiro.
+    """
+    parametros = parametros or {}
+    ativas = Tarefa.objects.filter(tipo=tipo, mes=mes, ano=ano, parametros=parametros,
+                                   status__in=Tarefa.ATIVAS)
+    while True:
+        existente = ativas.first()
+        if existente:
+            return existente, False
+        try:
+            with transaction.atomic():
+                tarefa = Tarefa.objects.create(
+                    tipo=tipo, mes=mes, ano=ano,
+                    parametros=parametros, usuario=usuario,
+                )
+        except IntegrityError:
+            # outro pedido igual entrou entre a consulta e o INSERT (ou já
+            # terminou: então tenta de novo)
+            continue
+        return tarefa, True
+
+
+def reservar_proxima():
+    """
+    Marca como "em execução" a tarefa mais antiga da fila e a devolve.
+
+    A reserva é um UPDATE condicionado ao status, então dois processadores
+    rodando ao mesmo tempo nunca pegam a mesma tarefa.
+    """
+    while True:
+        pk = (
+            Tarefa.objects
+            .filter(status=Tarefa.PENDENTE)
+            .order_by('criado_em', 'id')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if pk is None:
+            return None
+        reservada = Tarefa.objects.filter(pk=pk, status=Tarefa.PENDENTE).update(
+            status=Tarefa.EXECUTANDO,
+            iniciado_em=timezone.now(),
+        )
+        if reservada:
+            return Tarefa.objects.get(pk=pk)
+
+
+def marcar_interrompidas(tempo_maximo=None):
+    """
+    Tarefas "em execução" há mais de ``tempo_maximo`` segundos (processador
+    que caiu no meio) passam para erro, liberando a fila e a deduplicação.
+    """
+    if tempo_maximo is None:
+        tempo_maximo = getattr(settings, 'TAREFAS_TEMPO_MAXIMO', 3600)
+    limite = timezone.now() - timedelta(seconds=tempo_maximo)
+    return Tarefa.objects.filter(
+        status=Tarefa.EXECUTANDO,
+        iniciado_em__lt=limite,
+    ).update(
+        status=Tarefa.ERRO,
+        erro="Tarefa interrompida (tempo máximo excedido).",
+        concluido_em=timezone.now(),
+    )
+
+
+def _atualizar_progresso(tarefa, feitos, total):
+    pct = int(feitos * 100 / total) if total else 100
+    # 100% só quando o arquivo estiver gravado
+    pct = min(pct, 99)
+    if pct != tarefa.progresso:
+        tarefa.progresso = pct
+        Tarefa.objects.filter(pk=tarefa.pk).update(progresso=pct)
+
+
+def _gravar_arquivo(tarefa, destino):
+    if tarefa.tipo == Tarefa.BOLETOS:
+        p = tarefa.parametros
+        if p.get('formato') == 'pdf':
+            destino.write_bytes(gerar_pdf_unico(tarefa.mes, tarefa.ano))
+            return
+        destino.write_bytes(gerar_zip_de_boletos(
+            tarefa.mes, tarefa.ano,
+            compressao=COMPRESSOES[p.get('compressao', 'stored')],
+            nivel=p.get('nivel'),
+            progresso=lambda feitos, total: _atualizar_progresso(tarefa, feitos, total),
+        ))
+        return
+    if tarefa.tipo == Tarefa.XLSX:
+        escrever_planilha(destino, tarefa.mes, tarefa.ano,
+                          mes_final=tarefa.parametros.get('mes_final'),
+                          abas=tarefa.parametros.get('abas'))
+        return
+    raise ValueError(f"Tipo de tarefa desconhecido: {tarefa.tipo}")
+
+
+def executar(tarefa):
+    """
+    Executa uma tarefa já reservada e registra o resultado. Com erro, o
+    traceback vai para o log e a tarefa guarda só a mensagem.
+    """
+    nome = f"{tarefa.pk}_{nome_download(tarefa)}"
+    destino = diretorio_tarefas() / nome
+    temporario = destino.with_name(destino.name + '.tmp')
+    try:
+        _gravar_arquivo(tarefa, temporario)
+        os.replace(temporario, destino)
+    except Exception as e:
+        logger.exception("Tarefa %s falhou", tarefa.pk)
+        tarefa.status = Tarefa.ERRO
+        tarefa.erro = f"{type(e).__name__}: {e}"
+    else:
+        tarefa.status = Tarefa.CONCLUIDA
+        tarefa.arquivo = nome
+        tarefa.progresso = 100
+    finally:
+        # arquivo pela metade de uma geração que falhou
+        temporario.unlink(missing_ok=True)
+    tarefa.concluido_em = timezone.now()
+    tarefa.save(update_fields=['status', 'erro', 'arquivo', 'progresso', 'concluido_em'])
+    return tarefa
@@ -1,3 +1,737 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import zipfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from . import cache_boletos
+from .boletos import (
+    boleto_da_unidade,
+    carregar_razao_mensal,
+    iterar_zip_de_boletos,
+    montar_contextos,
+    nome_arquivo_boleto,
+    pdf_da_unidade,
+    renderizar_boletos,
+)
+from .cache_boletos import versao_boleto
+from .conferencia import capturar, comparar, popular_dados_referencia
+from .conferencia_dados import celulas_xlsx
+from .consumo import reconstruir
+from .execucao_unica import diretorio, executar_uma_vez
+from .exportacao import escrever_xlsx_periodo, gerar_xlsx, linhas_csv_rateios
+from .importacao import importar, ler_csv
+from .models import (
+    ConsumoMensal,
+    Leitura,
+    Unidade,
+    TipoDespesa,
+    Despesa,
+    FracaoPorTipoDespesa,
+    Rateio,
+    Tarefa,
+    LeituraGas,
+    LeituraAgua,
+    LeituraEnergia,
+)
+from .periodo import Periodo
+from .tarefas import enfileirar, executar, reservar_proxima
+
+MES, ANO = 3, 2025
+
+
+def _popular_mes(unidades, mes=MES, ano=ANO):
+    """Despesas rateadas entre ``unidades`` e leituras do mês e do anterior."""
+    tipos = {t.nome: t for t in TipoDespesa.objects.all()}
+    despesas = Despesa.objects.bulk_create([
+        Despesa(tipo=t, mes=str(mes), ano=ano, valor_total=Decimal('300.00'))
+        for t in tipos.values()
+    ])
+    Rateio.objects.bulk_create([
+        Rateio(despesa=d, unidade=u, valor=Decimal('10.00') + i)
+        for d in despesas for i, u in enumerate(unidades)
+    ])
+    for i, u in enumerate(unidades):
+        for m in (mes - 1, mes):
+            LeituraGas.objects.create(unidade=u, mes=m, ano=ano, leitura=Decimal(i + m))
+            LeituraAgua.objects.create(unidade=u, mes=m, ano=ano, leitura=Decimal(2 * i + m))
+            for medidor in (1, 2):
+                LeituraEnergia.objects.create(unidade=u, mes=m, ano=ano,
+                                              medidor=medidor, leitura=Decimal(i + m))
+
+
+class ExportacaoXlsxConsultasTests(TestCase):
+    """A planilha do mês faz o mesmo número de consultas com 3 ou 30 unidades."""
+
+    @classmethod
+    def setUpTestData(cls):
+        TipoDespesa.objects.bulk_create([
+            TipoDespesa(nome=n)
+            for n in ('Elevador', 'Gás', 'Água', 'Energia Salão', 'Fundo de Reserva')
+        ])
+
+    def _consultas(self, n_unidades):
+        unidades = Unidade.objects.bulk_create(
+            [Unidade(nome=f"{100 + i}") for i in range(n_unidades)]
+        )
+        _popular_mes(unidades)
+        with CaptureQueriesContext(connection) as consultas:
+            conteudo = gerar_xlsx(MES, ANO)
+        self.assertTrue(conteudo.startswith(b'PK'))
+        return len(consultas)
+
+    def test_consultas_nao_dependem_do_numero_de_unidades(self):
+        poucas = self._consultas(3)
+        Despesa.objects.all().delete()
+        Unidade.objects.all().delete()
+        muitas = self._consultas(30)
+        self.assertEqual(poucas, muitas)
+
+    def test_numero_de_consultas(self):
+        unidades = Unidade.objects.bulk_create([Unidade(nome="101"), Unidade(nome="102")])
+        _popular_mes(unidades)
+        with self.assertNumQueries(12):
+            gerar_xlsx(MES, ANO)
+
+    def test_so_abas_pedidas(self):
+        unidades = Unidade.objects.bulk_create([Unidade(nome="101"), Unidade(nome="102")])
+        _popular_mes(unidades)
+        # só as do RATEIO: tipo, último Fundo de Reserva e suas cotas, tipos e rateios
+        with self.assertNumQueries(5):
+            conteudo = gerar_xlsx(MES, ANO, abas=['RATEIO'])
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as z:
+            workbook = z.read('xl/workbook.xml').decode()
+        self.assertRegex(workbook, r'<sheets><sheet name="RATEIO" sheetId="1" r:id="rId1"/></sheets>')
+        with self.assertRaises(ValueError):
+            gerar_xlsx(MES, ANO, abas=['RESUMO'])
+
+    def test_aba_diagnostico_oculta(self):
+        unidades = Unidade.objects.bulk_create([Unidade(nome="101"), Unidade(nome="102")])
+        _popular_mes(unidades)
+
+        def abas(diagnostico):
+            with override_settings(XLSX_DIAGNOSTICO=diagnostico):
+                conteudo = gerar_xlsx(MES, ANO)
+            with zipfile.ZipFile(io.BytesIO(conteudo)) as z:
+                return z.read('xl/workbook.xml').decode()
+
+        with self.assertLogs('despesas.diagnostico', 'INFO') as log:
+            workbook = abas(True)
+        self.assertRegex(workbook, r'<sheet name="Diagnóstico" sheetId="\d+" state="hidden"')
+        self.assertTrue(any('rateio (pivot)' in linha for linha in log.output))
+        self.assertNotIn('Diagnóstico', abas(False))
+
+    def test_periodo_consultas_nao_dependem_do_numero_de_meses(self):
+        unidades = Unidade.objects.bulk_create([Unidade(nome="101"), Unidade(nome="102")])
+        for mes in (2, 4):
+            _popular_mes(unidades, mes=mes)
+
+        def consultas(meses):
+            with CaptureQueriesContext(connection) as c:
+                escrever_xlsx_periodo(io.BytesIO(), ANO, meses)
+            return len(c)
+
+        self.assertEqual(consultas([2]), consultas(range(1, 13)))
+
+    def test_exportar_rejeita_mes_invalido(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        for params in (
+            {'mes': MES, 'ano': ANO, 'mes_final': 2},
+            {'mes': MES, 'ano': ANO, 'mes_final': 13},
+            {'mes': 0, 'ano': ANO},
+            {'mes': 13, 'ano': ANO},
+            {'mes': 'mar', 'ano': ANO},
+            {'mes': MES, 'ano': '2025a'},
+            {'mes': MES, 'ano': ANO, 'mes_final': 'dez'},
+            {'ano': ANO},
+        ):
+            resposta = self.client.get('/admin/despesas/exportarxlsx/exportar-xlsx/', params)
+            self.assertEqual(resposta.status_code, 400, params)
+
+    def test_exportar_em_memoria_constante_em_todos_os_caminhos(self):
+        # tarefa na fila, execução única e geração direta: o mesmo arquivo,
+        # gravado com constant_memory (textos inline, sem sharedStrings)
+        unidades = Unidade.objects.bulk_create([Unidade(nome="101"), Unidade(nome="102")])
+        _popular_mes(unidades)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        url = '/admin/despesas/exportarxlsx/exportar-xlsx/'
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+
+        def baixar(url, **params):
+            resposta = self.client.get(url, params)
+            self.assertEqual(resposta.status_code, 200)
+            return b''.join(resposta.streaming_content)
+
+        arquivos = []
+        with override_settings(TAREFAS_EM_SEGUNDO_PLANO=True, EXECUCAO_UNICA=True,
+                               XLSX_MEMORIA_CONSTANTE=True, TAREFAS_DIR=pasta.name,
+                               EXECUCAO_UNICA_DIR=pasta.name):
+            self.assertEqual(self.client.get(url, {'mes': MES, 'ano': ANO}).status_code, 302)
+            tarefa = executar(reservar_proxima())
+            arquivos.append(baixar(f'/admin/despesas/tarefa/{tarefa.pk}/download/'))
+            with override_settings(TAREFAS_EM_SEGUNDO_PLANO=False):
+                arquivos.append(baixar(url, mes=MES, ano=ANO))
+                with override_settings(EXECUCAO_UNICA=False):
+                    arquivos.append(baixar(url, mes=MES, ano=ANO))
+
+        esperado = celulas_xlsx(gerar_xlsx(MES, ANO))
+        for arquivo in arquivos:
+            with zipfile.ZipFile(io.BytesIO(arquivo)) as z:
+                self.assertNotIn('xl/sharedStrings.xml', z.namelist())
+            self.assertEqual(celulas_xlsx(arquivo), esperado)
+
+
+class ConsumoMensalTests(TestCase):
+    """A tabela de consumo acompanha cada leitura gravada, editada ou apagada."""
+
+    def _consumos(self):
+        return sorted(ConsumoMensal.objects.values_list(
+            'tipo', 'unidade__nome', 'medidor', 'ano', 'mes',
+            'leitura_anterior', 'leitura_atual', 'consumo'))
+
+    def test_mantida_nas_gravacoes_e_igual_a_reconstrucao(self):
+        a, b = Unidade.objects.bulk_create([Unidade(nome="101"), Unidade(nome="102")])
+        dez = LeituraGas.objects.create(unidade=a, mes=12, ano=2024, leitura=Decimal('10'))
+        LeituraGas.objects.create(unidade=a, mes=1, ano=2025, leitura=Decimal('14.5'))
+        LeituraEnergia.objects.create(unidade=b, mes=1, ano=2025, medidor=2, leitura=Decimal('7'))
+        self.assertEqual(
+            ConsumoMensal.objects.get(tipo='gas', unidade=a, mes=1, ano=2025).consumo,
+            Decimal('4.5'))
+
+        # leitura menor que a anterior: consumo zero, nunca negativo
+        dez.leitura = Decimal('20')
+        dez.save()
+        self.assertEqual(
+            ConsumoMensal.objects.get(tipo='gas', unidade=a, mes=1, ano=2025).consumo, 0)
+
+        # mudar o mês da leitura refaz também as linhas do mês antigo
+        dez.mes, dez.ano = 2, 2025
+        dez.save()
+        self.assertFalse(ConsumoMensal.objects.filter(mes=12, ano=2024).exists())
+        self.assertEqual(
+            ConsumoMensal.objects.get(tipo='gas', unidade=a, mes=2, ano=2025).consumo,
+            Decimal('5.5'))
+
+        LeituraAgua.objects.create(unidade=b, mes=3, ano=2025, leitura=Decimal('3'))
+        LeituraAgua.objects.get(unidade=b).delete()
+        self.assertFalse(ConsumoMensal.objects.filter(tipo='agua').exists())
+
+        incremental = self._consumos()
+        reconstruir()
+        self.assertEqual(self._consumos(), incremental)
+
+
+class LeituraTests(TestCase):
+    """Os proxies de gás, água e energia dividem a tabela ``Leitura``."""
+
+    def test_proxies_separados_por_tipo(self):
+        unidade = Unidade.objects.create(nome='101')
+        LeituraGas.objects.bulk_create([LeituraGas(unidade=unidade, mes=1, ano=2025, leitura=1)])
+        LeituraAgua.objects.create(unidade=unidade, mes=1, ano=2025, leitura=2)
+        LeituraEnergia.objects.create(unidade=unidade, mes=1, ano=2025, medidor=2, leitura=3)
+
+        self.assertEqual(LeituraGas.objects.get().leitura, 1)
+        self.assertEqual(LeituraAgua.objects.get().tipo, Leitura.AGUA)
+        self.assertEqual(LeituraEnergia.objects.get().medidor, 2)
+        with self.assertNumQueries(1):
+            mes = set(Leitura.objects.filter(periodo=Periodo(1, 2025))
+                      .values_list('tipo', 'medidor', 'leitura'))
+        self.assertEqual(mes, {('gas', 0, 1), ('agua', 0, 2), ('energia', 2, 3)})
+
+    def test_com_consumo(self):
+        unidade = Unidade.objects.create(nome='101')
+        for mes, ano, leitura in ((11, 2024, 5), (12, 2024, 10), (1, 2025, 8), (3, 2025, 12)):
+            LeituraGas.objects.create(unidade=unidade, mes=mes, ano=ano, leitura=leitura)
+        LeituraEnergia.objects.create(unidade=unidade, mes=12, ano=2024, medidor=1, leitura=1)
+        LeituraEnergia.objects.create(unidade=unidade, mes=1, ano=2025, medidor=2, leitura=4)
+
+        with self.assertNumQueries(1):
+            linhas = list(
+                Leitura.objects.com_consumo((Periodo(12, 2024), Periodo(3, 2025)))
+                .order_by('tipo', 'medidor', 'periodo')
+                .values_list('tipo', 'medidor', 'mes', 'leitura_anterior', 'consumo'))
+        self.assertEqual(linhas, [
+            # energia: cada medidor tem a sua anterior
+            ('energia', 1, 12, None, 1),
+            ('energia', 2, 1, None, 4),
+            # novembro só entra como anterior; leitura menor: consumo 0;
+            # fevereiro sem leitura: março fica sem anterior
+            ('gas', 0, 12, 5, 5),
+            ('gas', 0, 1, 10, 0),
+            ('gas', 0, 3, None, 12),
+        ])
+
+
+class ImportacaoLeiturasTests(TestCase):
+    """CSV de leituras: tudo ou nada, com upsert e a tabela de consumo em dia."""
+
+    def setUp(self):
+        self.unidade = Unidade.objects.create(nome='101')
+        LeituraGas.objects.create(unidade=self.unidade, mes=1, ano=2025, leitura=Decimal('10'))
+
+    def test_grava_e_substitui(self):
+        linhas = ler_csv(
+            '\ufeffunidade;tipo;medidor;mes;ano;leitura\n'
+            '101;Gás;;1;2025;12,5\n'
+            '101;gas;;2;2025;20\n'
+            '101;energia;2;2;2025;7\n'.encode())
+        # o consumo de quem não está no arquivo não é refeito
+        outra = Unidade.objects.create(nome='102')
+        LeituraAgua.objects.create(unidade=outra, mes=1, ano=2025, leitura=Decimal('5'))
+        ConsumoMensal.objects.filter(unidade=outra).update(consumo=Decimal('99'))
+        # unidades, upsert das leituras, leituras vizinhas, upsert do consumo
+        # e os savepoints: não depende do número de linhas
+        with self.assertNumQueries(6):
+            self.assertEqual(importar(linhas), (3, []))
+        self.assertEqual(LeituraGas.objects.get(mes=1).leitura, Decimal('12.5'))
+        self.assertEqual(
+            ConsumoMensal.objects.get(tipo='gas', mes=2, ano=2025).consumo, Decimal('7.5'))
+        self.assertEqual(
+            ConsumoMensal.objects.get(tipo='energia', mes=3, ano=2025).leitura_anterior, Decimal('7'))
+        self.assertEqual(
+            ConsumoMensal.objects.get(unidade=outra, mes=1, ano=2025).consumo, Decimal('99'))
+
+    def test_erros_por_linha_sem_gravar_nada(self):
+        linhas = ler_csv(
+            b'unidade,tipo,medidor,mes,ano,leitura\n'
+            b'101,gas,,2,2025,20\n'
+            b'999,gas,,2,2025,1\n'
+            b'101,energia,,2,2025,1\n'
+            b'101,agua,,13,2025,1\n'
+            b'101,gas,,2,2025,21\n')
+        gravadas, erros = importar(linhas)
+        self.assertEqual(gravadas, 0)
+        self.assertEqual([numero for numero, _ in erros], [3, 4, 5, 6])
+        self.assertIn("'999'", erros[0][1])
+        self.assertEqual(LeituraGas.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            ler_csv(b'unidade;mes;ano\n')
+
+
+class PeriodoTests(TestCase):
+    """A coluna ``periodo`` é preenchida pelo banco e bate com ``Periodo``."""
+
+    def test_virada_do_ano(self):
+        p = Periodo(1, 2025)
+        self.assertEqual((p.anterior().mes, p.anterior().ano), (12, 2024))
+        self.assertEqual(p.anterior().seguinte(), p)
+        self.assertEqual(Periodo.do_inteiro(p + 14), Periodo(3, 2026))
+
+    def test_coluna_gerada(self):
+        unidade = Unidade.objects.create(nome='101')
+        tipo = TipoDespesa.objects.create(nome='Elevador')
+        LeituraGas.objects.bulk_create([
+            LeituraGas(unidade=unidade, mes=m, ano=a, leitura=Decimal(m))
+            for m, a in ((11, 2024), (12, 2024), (1, 2025))
+        ])
+        Despesa.objects.create(tipo=tipo, mes='12', ano=2024, valor_total=Decimal('1'))
+        p = Periodo(1, 2025)
+        self.assertEqual(
+            list(LeituraGas.objects.filter(periodo__range=(p.anterior(), p))
+                 .order_by('periodo').values_list('mes', flat=True)),
+            [12, 1])
+        self.assertEqual(Despesa.objects.get().periodo, p.anterior())
+
+
+class ExportacaoCsvTests(TestCase):
+    """CSV dos rateios de um período que cruza o ano."""
+
+    def test_periodo_entre_anos(self):
+        tipo = TipoDespesa.objects.create(nome='Elevador')
+        unidade = Unidade.objects.create(nome='101')
+        for mes, ano in ((10, 2024), (11, 2024), (2, 2025), (3, 2025)):
+            despesa = Despesa.objects.create(tipo=tipo, mes=str(mes), ano=ano,
+                                             valor_total=Decimal('100.00'))
+            Rateio.objects.create(despesa=despesa, unidade=unidade,
+                                  valor=Decimal(mes) + Decimal('0.50'))
+
+        linhas = list(linhas_csv_rateios(11, 2024, 2, 2025, chunk_size=1))
+        self.assertEqual(linhas[0], '\ufeffunidade;tipo;mes;ano;valor;consumo\r\n')
+        self.assertEqual(linhas[1:], [
+            '101;Elevador;11;2024;11,50;\r\n',
+            '101;Elevador;2;2025;2,50;\r\n',
+        ])
+
+
+class BoletosTests(TestCase):
+    """Contexto dos boletos do mês."""
+
+    def setUp(self):
+        self.tipos = {t.nome: t for t in TipoDespesa.objects.bulk_create([
+            TipoDespesa(nome=n) for n in ('Elevador', 'Fundo de Reserva')
+        ])}
+        self.unidade = Unidade.objects.create(nome='101')
+        FracaoPorTipoDespesa.objects.create(tipo_despesa=self.tipos['Fundo de Reserva'],
+                                            unidade=self.unidade, percentual=Decimal('1'))
+
+    def test_despesa_repetida_usa_a_mais_recente(self):
+        # como na versão anterior: o boleto usa a última despesa do tipo, mesmo
+        # desativada, e o fundo de reserva soma todas (sem sinais: segue inativa)
+        antiga, _ = Despesa.objects.bulk_create([
+            Despesa(tipo=self.tipos['Elevador'], mes=str(MES), ano=ANO,
+                    valor_total=Decimal('1000.00')),
+            Despesa(tipo=self.tipos['Elevador'], mes=str(MES), ano=ANO,
+                    valor_total=Decimal('500.00'), ativo=False),
+        ])
+        Rateio.objects.create(despesa=antiga, unidade=self.unidade, valor=Decimal('1000.00'))
+
+        contexto = carregar_razao_mensal(MES, ANO)[self.unidade.id]
+        self.assertEqual(
+            [(l['descricao'], l['valor']) for l in contexto['lancamentos']],
+            [('Elevador', Decimal('0.00')), ('Fundo de Reserva', Decimal('150.00'))],
+        )
+
+    def test_pdf_da_unidade_com_etag(self):
+        despesa = Despesa.objects.bulk_create([Despesa(
+            tipo=self.tipos['Elevador'], mes=str(MES), ano=ANO, valor_total=Decimal('1000.00'))])[0]
+        rateio = Rateio.objects.create(despesa=despesa, unidade=self.unidade, valor=Decimal('10.00'))
+        self.client.force_login(User.objects.create_superuser('admin'))
+        url = f'/admin/despesas/boleto/{self.unidade.pk}/{MES}/{ANO}.pdf'
+
+        with mock.patch('despesas.admin.pdf_da_unidade', return_value=b'%PDF') as renderizar:
+            primeira = self.client.get(url)
+            etag = primeira['ETag']
+            self.assertFalse(primeira.has_header('Last-Modified'))
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resposta.status_code, 304)
+            self.assertEqual(renderizar.call_count, 1)
+
+            # os dados da unidade mudaram: outra ETag, o navegador baixa de novo
+            Rateio.objects.filter(pk=rateio.pk).update(valor=Decimal('12.00'))
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_versao_boleto_so_recalcula_se_os_arquivos_mudam(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        imagem = Path(pasta.name) / 'img' / 'logo.png'
+        imagem.parent.mkdir()
+        imagem.write_bytes(b'logo 1')
+        with override_settings(STATIC_ROOT=pasta.name):
+            versao = versao_boleto('boletos/boleto.css')
+            with mock.patch.object(Path, 'read_bytes', side_effect=AssertionError):
+                self.assertEqual(versao_boleto('boletos/boleto.css'), versao)
+
+            imagem.write_bytes(b'logo 2')
+            os.utime(imagem, ns=(0, imagem.stat().st_mtime_ns + 1))
+            self.assertNotEqual(versao_boleto('boletos/boleto.css'), versao)
+
+    def _usar_cache(self, limite=10 ** 6):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(BOLETOS_CACHE_DIR=pasta.name,
+                                         BOLETOS_CACHE_MAX_BYTES=limite)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_cache_de_pdf_segue_o_conteudo(self):
+        self._usar_cache()
+        despesa = Despesa.objects.bulk_create([Despesa(
+            tipo=self.tipos['Elevador'], mes=str(MES), ano=ANO, valor_total=Decimal('1000.00'))])[0]
+        rateio = Rateio.objects.create(despesa=despesa, unidade=self.unidade, valor=Decimal('10.00'))
+
+        with mock.patch('despesas.boletos.renderizar_boleto',
+                        side_effect=lambda contexto: f"{contexto['total']}".encode()) as renderizar:
+            # total: o rateio mais o Fundo de Reserva (10% de 1000,00)
+            for _ in range(2):
+                self.assertEqual(pdf_da_unidade(*boleto_da_unidade(self.unidade.pk, MES, ANO)),
+                                 b'110.00')
+            self.assertEqual(renderizar.call_count, 1)
+
+            Rateio.objects.filter(pk=rateio.pk).update(valor=Decimal('12.00'))
+            self.assertEqual(pdf_da_unidade(*boleto_da_unidade(self.unidade.pk, MES, ANO)),
+                             b'112.00')
+            self.assertEqual(renderizar.call_count, 2)
+
+    def test_podar_apaga_os_usados_ha_mais_tempo(self):
+        self._usar_cache()
+        chaves = [f'{i:02d}' * 32 for i in range(3)]
+        for usado_em, chave in enumerate(chaves, start=1):
+            cache_boletos.gravar(chave, b'x' * 100)
+            caminho = cache_boletos._caminho(chave)
+            os.utime(caminho, (usado_em, caminho.stat().st_mtime))
+        # ler marca como usado agora: o primeiro passa a ser o mais recente
+        cache_boletos.ler(chaves[0])
+
+        self.assertEqual(cache_boletos.podar(250), 1)
+        self.assertEqual([cache_boletos.existe(c) for c in chaves], [True, False, True])
+
+    @override_settings(BOLETOS_CACHE_MAX_BYTES=0)
+    def test_zip_em_streaming(self):
+        outra = Unidade.objects.create(nome='102')
+        despesa = Despesa.objects.bulk_create([Despesa(
+            tipo=self.tipos['Elevador'], mes=str(MES), ano=ANO, valor_total=Decimal('1000.00'))])[0]
+        Rateio.objects.bulk_create([Rateio(despesa=despesa, unidade=u, valor=Decimal('10.00'))
+                                    for u in (self.unidade, outra)])
+
+        with mock.patch('despesas.renderizacao.RenderizadorBoletos',
+                        return_value=lambda contexto: f"PDF {contexto['unidade'].nome}".encode()):
+            partes = list(iterar_zip_de_boletos(MES, ANO, workers=1,
+                                                compressao=zipfile.ZIP_DEFLATED))
+
+        # cabeçalho e PDF de cada unidade, depois o diretório central
+        self.assertEqual(len(partes), 3)
+        with zipfile.ZipFile(io.BytesIO(b''.join(partes))) as zf:
+            self.assertIsNone(zf.testzip())
+            nomes = [nome_arquivo_boleto(u, MES, ANO) for u in (self.unidade, outra)]
+            self.assertEqual(zf.namelist(), nomes)
+            self.assertEqual({i.date_time for i in zf.infolist()}, {(ANO, MES, 1, 0, 0, 0)})
+            self.assertEqual(zf.read(nomes[1]), b'PDF 102')
+
+    @override_settings(TAREFAS_EM_SEGUNDO_PLANO=False, BOLETOS_CACHE_MAX_BYTES=0)
+    def test_pdf_unico_do_mes(self):
+        outra = Unidade.objects.create(nome='102')
+        despesa = Despesa.objects.bulk_create([Despesa(
+            tipo=self.tipos['Elevador'], mes=str(MES), ano=ANO, valor_total=Decimal('1000.00'))])[0]
+        Rateio.objects.bulk_create([Rateio(despesa=despesa, unidade=u, valor=Decimal('10.00'))
+                                    for u in (self.unidade, outra)])
+        self.client.force_login(User.objects.create_superuser('admin'))
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        dados = {'mes': str(MES), 'ano': str(ANO), 'formato': 'pdf', 'compressao': 'stored'}
+
+        for unica in (False, True):
+            with self.subTest(execucao_unica=unica), \
+                    override_settings(EXECUCAO_UNICA=unica, EXECUCAO_UNICA_DIR=pasta.name), \
+                    mock.patch('despesas.renderizacao.HTML') as html:
+                html.return_value.write_pdf.return_value = b'%PDF unico'
+                resposta = self.client.post('/admin/despesas/boleto/gerar/', dados)
+
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(resposta['Content-Type'], 'application/pdf')
+                self.assertEqual(resposta['Content-Disposition'],
+                                 f'attachment; filename="boletos_{MES:02d}-{ANO}.pdf"')
+                self.assertEqual(resposta.getvalue(), b'%PDF unico')
+                # um só documento, com um bloco (uma página) por unidade, em ordem
+                self.assertEqual(html.call_count, 1)
+                documento = html.call_args.kwargs['string']
+                blocos = documento.split('<section class="boleto">')[1:]
+                self.assertEqual(len(blocos), 2)
+                self.assertIn('101', blocos[0])
+                self.assertIn('102', blocos[1])
+
+
+class RenderizacaoParalelaTests(TestCase):
+    """O pool de processos gera os mesmos PDFs, na mesma ordem, que a renderização sequencial."""
+
+    @override_settings(BOLETOS_CACHE_MAX_BYTES=0)
+    def test_dois_workers_igual_a_um(self):
+        popular_dados_referencia()
+        contextos = montar_contextos(MES, ANO)
+        sequencial = list(renderizar_boletos(contextos, workers=1))
+        em_paralelo = list(renderizar_boletos(contextos, workers=2))
+
+        self.assertEqual(len(sequencial), len(contextos))
+        # um PDF diferente por unidade: a comparação confere também a ordem
+        self.assertEqual(len(set(sequencial)), len(sequencial))
+        self.assertEqual(em_paralelo, sequencial)
+
+
+class GerarBoletosComandoTests(TestCase):
+    """O comando ``gerar_boletos`` só refaz os meses cujos dados mudaram."""
+
+    def setUp(self):
+        TipoDespesa.objects.bulk_create([TipoDespesa(nome=n) for n in ('Elevador', 'Gás')])
+        self.unidades = Unidade.objects.bulk_create([Unidade(nome='101'), Unidade(nome='102')])
+        _popular_mes(self.unidades)
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = Path(pasta.name)
+
+    def _gerar(self):
+        saida = io.StringIO()
+        with mock.patch('despesas.renderizacao.RenderizadorBoletos', return_value=lambda c: (
+                f"PDF {c['unidade'].nome} {c['total']} {c['gas_consumption']}".encode())):
+            call_command('gerar_boletos', mes=f'{MES - 1}-{MES}', ano=ANO, workers=1,
+                         out=str(self.pasta), stdout=saida)
+        return {linha.split(':')[0]: linha for linha in saida.getvalue().splitlines()}
+
+    @override_settings(BOLETOS_CACHE_MAX_BYTES=0)
+    def test_manifesto_pula_mes_sem_alteracoes(self):
+        anterior, atual = f'boletos_{MES - 1:02d}-{ANO}.zip', f'boletos_{MES:02d}-{ANO}.zip'
+        self.assertIn('gerado', self._gerar()[atual])
+        self.assertEqual(set(json.loads((self.pasta / '.boletos.json').read_text())),
+                         {anterior, atual})
+        conteudo = (self.pasta / atual).read_bytes()
+
+        saida = self._gerar()
+        self.assertIn('sem alterações', saida[anterior])
+        self.assertIn('sem alterações', saida[atual])
+
+        # rateio editado: o mês é refeito, o anterior continua igual
+        rateio = Rateio.objects.filter(unidade=self.unidades[0]).first()
+        rateio.valor += 1
+        rateio.save()
+        saida = self._gerar()
+        self.assertIn('sem alterações', saida[anterior])
+        self.assertIn('gerado', saida[atual])
+        self.assertNotEqual((self.pasta / atual).read_bytes(), conteudo)
+        conteudo = (self.pasta / atual).read_bytes()
+
+        # leitura de gás do mês editada: muda o consumo e o mês é refeito
+        leitura = LeituraGas.objects.get(unidade=self.unidades[1], mes=MES, ano=ANO)
+        leitura.leitura += 5
+        leitura.save()
+        saida = self._gerar()
+        self.assertIn('sem alterações', saida[anterior])
+        self.assertIn('gerado', saida[atual])
+        self.assertNotEqual((self.pasta / atual).read_bytes(), conteudo)
+
+
+class ImportacaoLeveTests(SimpleTestCase):
+    """Subir o Django (admin e URLs) não carrega as bibliotecas pesadas."""
+
+    PESADAS = ('pandas', 'numpy', 'xlsxwriter', 'weasyprint')
+
+    def test_dependencias_pesadas_nao_sao_importadas_no_setup(self):
+        # processo novo: neste aqui outros testes já geraram planilhas
+        codigo = textwrap.dedent(f"""
+            import sys, django
+            django.setup()
+            from django.urls import get_resolver
+            get_resolver().url_patterns
+            import despesas.admin, despesas.tarefas
+            print(','.join(m for m in {self.PESADAS!r} if m in sys.modules))
+        """)
+        saida = subprocess.run([sys.executable, '-c', codigo], capture_output=True,
+                               text=True, check=True)
+        self.assertEqual(saida.stdout.strip(), '')
+
+
+class ExecucaoUnicaTests(SimpleTestCase):
+    """Pedidos simultâneos iguais recebem o arquivo gerado pelo primeiro."""
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(EXECUCAO_UNICA_DIR=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.geracoes = []
+
+    def _pedir(self, resultados, conteudo):
+        def gravar(destino):
+            self.geracoes.append(conteudo)
+            time.sleep(0.3)
+            destino.write_bytes(conteudo)
+        with executar_uma_vez('teste_03-2025', 'v1', gravar) as arquivo:
+            resultados.append(arquivo.read())
+
+    def test_simultaneos_esperam_o_primeiro(self):
+        resultados = []
+        threads = [threading.Thread(target=self._pedir, args=(resultados, f'{i}'.encode()))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.geracoes), 1)
+        self.assertEqual(resultados, self.geracoes * 4)
+
+        # pedido que chega depois da geração terminar gera de novo
+        self._pedir(resultados, b'novo')
+        self.assertEqual(resultados[-1], b'novo')
+
+    def test_travas_ociosas_sao_apagadas(self):
+        self._pedir([], b'1')
+        pasta = diretorio()
+        velho = time.time() - 3600
+        for caminho in pasta.iterdir():
+            os.utime(caminho, (velho, velho))
+        with executar_uma_vez('outra_03-2025', 'v1', lambda destino: destino.write_bytes(b'2')) as f:
+            self.assertEqual(f.read(), b'2')
+        self.assertEqual(sorted(c.name for c in pasta.iterdir()),
+                         ['outra_03-2025.lock', 'outra_03-2025.v1'])
+
+
+class TarefasTests(TestCase):
+    """Fila do banco: deduplicação, reserva e registro do resultado."""
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        configuracao = override_settings(TAREFAS_DIR=pasta.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.pasta = Path(pasta.name)
+
+    def test_enfileirar_reaproveita_a_tarefa_ativa(self):
+        tarefa, criada = enfileirar(Tarefa.XLSX, 3, 2025, {'abas': ['Gás']})
+        self.assertTrue(criada)
+        self.assertEqual(enfileirar(Tarefa.XLSX, 3, 2025, {'abas': ['Gás']}), (tarefa, False))
+        self.assertTrue(enfileirar(Tarefa.XLSX, 3, 2025, {'abas': ['Água']})[1])
+
+        # terminada, não conta mais: o próximo pedido gera de novo
+        Tarefa.objects.filter(pk=tarefa.pk).update(status=Tarefa.CONCLUIDA)
+        self.assertTrue(enfileirar(Tarefa.XLSX, 3, 2025, {'abas': ['Gás']})[1])
+
+    def test_reservar_proxima_uma_vez_cada(self):
+        primeira, _ = enfileirar(Tarefa.XLSX, 1, 2025)
+        segunda, _ = enfileirar(Tarefa.XLSX, 2, 2025)
+        reservadas = [reservar_proxima(), reservar_proxima(), reservar_proxima()]
+        self.assertEqual(reservadas, [primeira, segunda, None])
+        self.assertEqual(set(Tarefa.objects.values_list('status', flat=True)), {Tarefa.EXECUTANDO})
+
+    def test_executar_registra_o_resultado(self):
+        def gravar(tarefa, destino):
+            destino.write_bytes(b'parcial')
+            if tarefa.mes == 2:
+                raise RuntimeError('sem dados')
+            destino.write_bytes(b'xlsx')
+
+        enfileirar(Tarefa.XLSX, 1, 2025)
+        enfileirar(Tarefa.XLSX, 2, 2025)
+        with mock.patch('despesas.tarefas._gravar_arquivo', gravar), \
+                self.assertLogs('despesas.tarefas', 'ERROR'):
+            ok = executar(reservar_proxima())
+            falha = executar(reservar_proxima())
+
+        ok.refresh_from_db()
+        self.assertEqual((ok.status, ok.progresso), (Tarefa.CONCLUIDA, 100))
+        self.assertEqual((self.pasta / ok.arquivo).read_bytes(), b'xlsx')
+        falha.refresh_from_db()
+        self.assertEqual((falha.status, falha.erro, falha.arquivo),
+                         (Tarefa.ERRO, 'RuntimeError: sem dados', ''))
+        self.assertEqual([c.name for c in self.pasta.iterdir()], [ok.arquivo])
+
+    def test_status_so_com_permissao_ou_para_quem_pediu(self):
+        dono = User.objects.create_user('dono', is_staff=True)
+        outro = User.objects.create_user('outro', is_staff=True)
+        tarefa, _ = enfileirar(Tarefa.XLSX, 3, 2025, usuario=dono)
+        url = f'/admin/despesas/tarefa/{tarefa.pk}/status.json'
+
+        self.client.force_login(outro)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        outro.user_permissions.add(Permission.objects.get(codename='view_tarefa'))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.force_login(dono)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ConferenciaReferenciaTests(TestCase):
+    """
+    Planilhas e boletos gerados dos dados fixos batem com despesas/referencia/.
+    Se a mudança no resultado for intencional, regrave com
+    ``manage.py conferir_referencia --gravar``.
+    """
+
+    def test_igual_a_referencia(self):
+        popular_dados_referencia()
+        dados, _ = capturar()
+        self.assertEqual(comparar(dados)[:20], [])
@@ -11,6 +11,8 @@ from .models import LogAlteracao
 from django.db import transaction
 from django.db.models.signals import post_delete
 from .signals import recalc_fundo_reserva
+from . import consumo as consumo_mensal
+from .models import ConsumoMensal
 from datetime import datetime
 import json
 import re
@@ -1322,17 +1324,12 @@ def ver_rateio(request, despesa_id):
         gas_leituras = getattr(despesa, 'gas_leituras', {}) or {}
         gas_params   = gas_leituras.get('params', {})
         gas_info     = {}
-        mes_atual, ano_atual = int(despesa.mes), despesa.ano
-        if mes_atual > 1:
-            mes_ant, ano_ant = mes_atual - 1, ano_atual
-        else:
-            mes_ant, ano_ant = 12, ano_atual - 1
+        leituras = consumo_mensal.do_mes(ConsumoMensal.GAS, int(despesa.mes), despesa.ano)
         for r in rateios:
             u   = r.unidade
-            ant = LeituraGas.objects.filter(unidade=u, mes=mes_ant, ano=ano_ant).first()
-            atu = LeituraGas.objects.filter(unidade=u, mes=mes_atual, ano=ano_atual).first()
-            la  = float(ant.leitura) if ant else 0
-            lk  = float(atu.leitura) if atu else 0
+            c   = leituras.get((u.id, 0))
+            la  = float(c.leitura_anterior) if c and c.leitura_anterior is not None else 0
+            lk  = float(c.leitura_atual) if c and c.leitura_atual is not None else 0
             consumo = max(lk - la, 0)
             gas_info[u.id] = {
                 'leitura_anterior': la,
@@ -1355,17 +1352,12 @@ def ver_rateio(request, despesa_id):
         agua_leituras = getattr(despesa, 'agua_leituras', {}) or {}
         agua_params   = agua_leituras.get('params', {})
         agua_info     = {}
-        mes_atual, ano_atual = int(despesa.mes), despesa.ano
-        if mes_atual > 1:
-            mes_ant, ano_ant = mes_atual - 1, ano_atual
-        else:
-            mes_ant, ano_ant = 12, ano_atual - 1
+        leituras = consumo_mensal.do_mes(ConsumoMensal.AGUA, int(despesa.mes), despesa.ano)
         for r in rateios:
             u   = r.unidade
-            ant = LeituraAgua.objects.filter(unidade=u, mes=mes_ant, ano=ano_ant).first()
-            atu = LeituraAgua.objects.filter(unidade=u, mes=mes_atual, ano=ano_atual).first()
-            la  = float(ant.leitura) if ant else 0
-            lk  = float(atu.leitura) if atu else 0
+            c   = leituras.get((u.id, 0))
+            la  = float(c.leitura_anterior) if c and c.leitura_anterior is not None else 0
+            lk  = float(c.leitura_atual) if c and c.leitura_atual is not None else 0
             agua_info[u.id] = {
                 'leitura_anterior': la,
                 'leitura_atual':    lk,
@@ -1384,33 +1376,23 @@ def ver_rateio(request, despesa_id):
         energia_leituras = getattr(despesa, 'energia_leituras', {}) or {}
         energia_params   = energia_leituras.get('params', {})
         energia_info     = {}
-        mes_atual, ano_atual = int(despesa.mes), despesa.ano
-        if mes_atual > 1:
-            mes_ant, ano_ant = mes_atual - 1, ano_atual
-        else:
-            mes_ant, ano_ant = 12, ano_atual - 1
+        leituras = consumo_mensal.do_mes(ConsumoMensal.ENERGIA, int(despesa.mes), despesa.ano)
+
+        def leitura(c, campo):
+            valor = getattr(c, campo) if c else None
+            return float(valor) if valor is not None else 0
 
         total_leituras = 0
 
         for rateio in rateios:
             u = rateio.unidade
-            ant1 = LeituraEnergia.objects.filter(
-                unidade=u, mes=mes_ant, ano=ano_ant, medidor=1
-            ).first()
-            atu1 = LeituraEnergia.objects.filter(
-                unidade=u, mes=mes_atual, ano=ano_atual, medidor=1
-            ).first()
-            ant2 = LeituraEnergia.objects.filter(
-                unidade=u, mes=mes_ant, ano=ano_ant, medidor=2
-            ).first()
-            atu2 = LeituraEnergia.objects.filter(
-                unidade=u, mes=mes_atual, ano=ano_atual, medidor=2
-            ).first()
+            c1 = leituras.get((u.id, 1))
+            c2 = leituras.get((u.id, 2))
 
-            la1 = float(ant1.leitura) if ant1 else 0
-            lk1 = float(atu1.leitura) if atu1 else 0
-            la2 = float(ant2.leitura) if ant2 else 0
-            lk2 = float(atu2.leitura) if atu2 else 0
+            la1 = leitura(c1, 'leitura_anterior')
+            lk1 = leitura(c1, 'leitura_atual')
+            la2 = leitura(c2, 'leitura_anterior')
+            lk2 = leitura(c2, 'leitura_atual')
 
             consumo = (lk1 - la1) + (lk2 - la2)
             total_leituras += consumo
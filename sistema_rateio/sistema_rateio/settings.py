@@ -123,3 +123,51 @@ PARAMETROS_LEITURAS_JSON = os.path.join(BASE_DIR, "parametros_leituras.json")
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'lista_despesas'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Boletos: número de processos usados para renderizar os PDFs
+# (1 = sequencial, dentro do próprio processo da requisição)
+BOLETOS_WORKERS = int(os.environ.get('BOLETOS_WORKERS', 1))
+
+# Tarefas em segundo plano (boletos e XLSX): o admin enfileira e o comando
+# "python manage.py processar_tarefas" executa. Com 0 tudo roda na requisição.
+TAREFAS_EM_SEGUNDO_PLANO = os.environ.get('TAREFAS_EM_SEGUNDO_PLANO', '1') == '1'
+TAREFAS_DIR = DATA_DIR / "tarefas"
+# segundos até uma tarefa "em execução" ser considerada interrompida
+TAREFAS_TEMPO_MAXIMO = int(os.environ.get('TAREFAS_TEMPO_MAXIMO', 3600))
+
+# Cache em disco dos PDFs de boleto (0 desliga). Ao passar do limite, os
+# PDFs usados há mais tempo são apagados.
+BOLETOS_CACHE_DIR = DATA_DIR / "cache_boletos"
+BOLETOS_CACHE_MAX_BYTES = int(os.environ.get('BOLETOS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+# XLSX: grava a planilha (na tarefa, na execução única ou na própria
+# requisição, sempre num arquivo) com o modo constant_memory do xlsxwriter
+# (memória estável em planilhas grandes). Com 0 a planilha é montada
+# inteira na memória antes de ir para o arquivo.
+XLSX_MEMORIA_CONSTANTE = os.environ.get('XLSX_MEMORIA_CONSTANTE', '1') == '1'
+
+# CSV dos rateios: quantas linhas buscar do banco por vez durante o streaming.
+CSV_CHUNK_SIZE = int(os.environ.get('CSV_CHUNK_SIZE', '2000'))
+
+# XLSX: mede tempo, consultas e memória de cada fase da exportação, grava no
+# log e numa aba oculta "Diagnóstico". Deixa a geração bem mais lenta
+# (tracemalloc); só para investigar lentidão.
+XLSX_DIAGNOSTICO = os.environ.get('XLSX_DIAGNOSTICO', '0') == '1'
+
+# XLSX e boletos gerados na hora: pedidos iguais e simultâneos esperam o
+# primeiro e recebem o mesmo arquivo, em vez de cada um gerar o seu.
+EXECUCAO_UNICA = os.environ.get('EXECUCAO_UNICA', '1') == '1'
+EXECUCAO_UNICA_DIR = DATA_DIR / "execucao_unica"
+# segundos que um resultado fica em disco depois de entregue
+EXECUCAO_UNICA_RETENCAO = int(os.environ.get('EXECUCAO_UNICA_RETENCAO', 300))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'despesas.diagnostico': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}